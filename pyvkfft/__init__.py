@@ -4,3 +4,5 @@
 #   (c) 2021- : ESRF-European Synchrotron Radiation Facility
 #       authors:
 #         Vincent Favre-Nicolin, favre@esrf.fr
+
+from .base import next_fast_len, next_fast_shape
@@ -9,17 +9,22 @@
 # Functions for accuracy tests.
 
 import os
+import hashlib
 import multiprocessing
+import pickle
+import queue
+import traceback
 import timeit
 import atexit
+from collections import OrderedDict
 
 import psutil
 import numpy as np
 from numpy.fft import fftn, ifftn, rfftn, irfftn
 
 try:
-    # We prefer scipy over numpy for fft, and we can also test dct
-    from scipy.fft import dctn, idctn, fftn, ifftn, rfftn, irfftn
+    # We prefer scipy over numpy for fft, and we can also test dct & dst
+    from scipy.fft import dctn, idctn, dstn, idstn, fftn, ifftn, rfftn, irfftn
 
     has_dct_ref = True
     has_scipy = True
@@ -38,6 +43,8 @@ except ImportError:
 # except ImportError:
 #     has_pyfftw = False
 
+from pyvkfft.base import complex32, primes
+
 try:
     import pyopencl as cl
     import pyopencl.array as cla
@@ -66,7 +73,16 @@ except ImportError:
 gpu_ctx_dic = {}
 
 
-def init_ctx(backend, gpu_name=None, verbose=False):
+def init_ctx(backend, gpu_name=None, verbose=False, opencl_platform=None):
+    """
+    Initialise the GPU context for a given backend, if it does not already exist.
+
+    :param backend: either 'pyopencl', 'pycuda' or 'cupy'
+    :param gpu_name: the (sub)string used to select the GPU (ignored for cupy)
+    :param verbose: if True, print the name of the selected device
+    :param opencl_platform: for pyopencl, the (sub)string used to select the platform
+        (e.g. 'portable' for PoCL). If given, non-GPU (e.g. CPU) devices can also be selected.
+    """
     if backend in gpu_ctx_dic:
         return
     if backend == "pycuda":
@@ -96,8 +112,10 @@ def init_ctx(backend, gpu_name=None, verbose=False):
         for p in cl.get_platforms():
             if d is not None:
                 break
+            if opencl_platform is not None and opencl_platform.lower() not in p.name.lower():
+                continue
             for d0 in p.get_devices():
-                if d0.type & cl.device_type.GPU:
+                if d0.type & cl.device_type.GPU or opencl_platform is not None:
                     if gpu_name is not None:
                         if gpu_name.lower() in d0.name.lower():
                             d = d0
@@ -131,6 +149,359 @@ def init_ctx(backend, gpu_name=None, verbose=False):
         raise RuntimeError("init_ctx: unknown backend ", backend)
 
 
+def get_gpu_name(backend, gpu_name=None):
+    """
+    Get the name of the GPU used for a given backend, as selected by init_ctx().
+    This does not create a context for the pycuda and cupy backends.
+
+    :param backend: either 'pyopencl', 'pycuda' or 'cupy'
+    :param gpu_name: the (sub)string used to select the GPU (ignored for cupy)
+    :return: the GPU name
+    """
+    if backend == "pyopencl":
+        init_ctx(backend, gpu_name=gpu_name)
+        return gpu_ctx_dic["pyopencl"][0].name
+    elif backend == "pycuda":
+        if "pycuda" in gpu_ctx_dic:
+            return gpu_ctx_dic["pycuda"][0].name()
+        if not has_pycuda:
+            raise RuntimeError("get_gpu_name: backend=%s is not available" % backend)
+        cu_drv.init()
+        for i in range(cu_drv.Device.count()):
+            name = cu_drv.Device(i).name()
+            if gpu_name is None or gpu_name.lower() in name.lower():
+                return name
+        raise RuntimeError("Selected backend is pycuda, but no device found (name=%s)" % gpu_name)
+    elif backend == "cupy":
+        if not has_cupy:
+            raise RuntimeError("get_gpu_name: backend=%s is not available" % backend)
+        # init_ctx() always uses the first device
+        name = cp.cuda.runtime.getDeviceProperties(0)['name']
+        return name.decode() if isinstance(name, bytes) else name
+    raise RuntimeError("get_gpu_name: unknown backend ", backend)
+
+
+def get_free_memory(backend, gpu_name=None):
+    """
+    Get the free GPU memory for a given backend, and the available host memory.
+    This does not keep a context for the pycuda and cupy backends.
+
+    :param backend: either 'pyopencl', 'pycuda' or 'cupy'
+    :param gpu_name: the (sub)string used to select the GPU
+    :return: (gpu_free, host_available) in bytes. OpenCL does not report
+        the free memory, so the total GPU memory is returned instead.
+    """
+    host = psutil.virtual_memory().available
+    if backend == "pyopencl":
+        init_ctx(backend, gpu_name=gpu_name)
+        return gpu_ctx_dic["pyopencl"][0].global_mem_size, host
+    elif backend == "pycuda":
+        if "pycuda" in gpu_ctx_dic:
+            return cu_drv.mem_get_info()[0], host
+        get_gpu_name(backend, gpu_name)  # Check the device exists
+        for i in range(cu_drv.Device.count()):
+            d = cu_drv.Device(i)
+            if gpu_name is None or gpu_name.lower() in d.name().lower():
+                ctx = d.make_context()
+                try:
+                    return cu_drv.mem_get_info()[0], host
+                finally:
+                    ctx.pop()
+                    ctx.detach()
+        raise RuntimeError("get_free_memory: no GPU matching gpu_name=%s (backend=pycuda)" % gpu_name)
+    elif backend == "cupy":
+        if not has_cupy:
+            raise RuntimeError("get_free_memory: backend=%s is not available" % backend)
+        for i in range(cp.cuda.runtime.getDeviceCount()):
+            name = cp.cuda.runtime.getDeviceProperties(i)['name']
+            name = name.decode() if isinstance(name, bytes) else name
+            if gpu_name is None or gpu_name.lower() in name.lower():
+                with cp.cuda.Device(i):
+                    return cp.cuda.runtime.memGetInfo()[0], host
+        raise RuntimeError("get_free_memory: no GPU matching gpu_name=%s (backend=cupy)" % gpu_name)
+    raise RuntimeError("get_free_memory: unknown backend ", backend)
+
+
+def _is_auto(ref_long_double):
+    """ Check if ref_long_double is 'auto' - any other true value selects the long double reference """
+    return isinstance(ref_long_double, str) and ref_long_double == 'auto'
+
+
+def accuracy_tolerance(n, dtype, compute_dtype=None):
+    """
+    Tolerance for the relative Linf error of a transform in test_accuracy(),
+    estimated from the accuracy notebook. This is doubled for Bluestein transforms.
+
+    :param n: the number of points of the transform (excluding batch axes)
+    :param dtype: the array dtype
+    :param compute_dtype: the dtype used for the calculations, if different from dtype
+    :return: the tolerance
+    """
+    if dtype == complex32:
+        # Dominated by the rounding of the result to half precision
+        return 1e-3 + 5e-7 * np.log10(n)
+    if dtype in (np.complex64, np.float32):
+        if compute_dtype in (np.complex128, np.float64):
+            # Dominated by the rounding of the result to single precision
+            return 5e-7
+        return 2e-6 + 5e-7 * np.log10(n)
+    return 5e-15 + 5e-16 * np.log10(n)
+
+
+def _ref_auto_long_double(shape, tol, r2r=False):
+    """
+    With ref_long_double='auto', check if the long double reference must be used directly,
+    because the float64 reference error bound is not well below the tolerance, which is
+    the case for double precision transforms. Otherwise both references would be computed.
+
+    :param shape: the shape of the transformed axes (excluding batch axes)
+    :param tol: the tolerance, see accuracy_tolerance()
+    :param r2r: True for a DCT or DST transform
+    :return: True if the long double reference should be used
+    """
+    return ref_error_bound(shape, r2r=r2r) > 0.1 * tol
+
+
+# Estimated GPU memory used by a process for the GPU context and the VkFFT kernels
+gpu_context_nbytes = 300 * 1024 ** 2
+
+
+def accuracy_test_memory(shape, dtype, inplace, r2c=False, dct=False, dst=False, compute_dtype=None,
+                         ref_long_double=True, **kwargs):
+    """
+    Estimate the GPU and host memory used by test_accuracy() for a given configuration.
+    This includes the GPU context, the source and destination arrays, the VkFFT
+    temporary buffer (used for large or Bluestein transforms), and the host arrays
+    for the reference transforms.
+
+    :param shape, dtype, inplace, r2c, dct, dst, compute_dtype, ref_long_double: see test_accuracy()
+    :param kwargs: other test_accuracy() parameters, ignored. This allows to use a
+        dictionary of test_accuracy() keyword arguments.
+    :return: (gpu_nbytes, host_nbytes)
+    """
+    # Size of a real value in the arrays
+    if dtype == complex32:
+        fl = 2
+    else:
+        fl = np.dtype(np.float64 if dtype in (np.float64, np.complex128) else np.float32).itemsize
+    n = int(np.prod(shape, dtype=np.float64))
+    # Size of the arrays (complex for C2C, real or half-hermitian for R2C, DCT and DST)
+    nbytes = n * fl * (1 if r2c or dct or dst else 2)
+    gpu = nbytes * (1 if inplace else 2)
+    # VkFFT uses a temporary buffer for multi-upload or Bluestein transforms
+    if max(shape[-1:]) > 4096 or max(list(shape[:-1]) + [0]) > 2048:
+        gpu += nbytes
+    if max(max(primes(k)) for k in shape) > 13:
+        gpu += 2 * nbytes
+    if compute_dtype in (np.float64, np.complex128) and fl == 4:
+        gpu += nbytes
+    # Host: source array, reference transform input and output, conversions
+    ref_ld = has_scipy and bool(ref_long_double)
+    if ref_ld and _is_auto(ref_long_double):
+        axes, ndim = kwargs.get("axes"), kwargs.get("ndim")
+        if axes is None:
+            sh = shape[-ndim:] if ndim else shape
+        else:
+            sh = [shape[i] for i in axes]
+        ref_ld = _ref_auto_long_double(sh, accuracy_tolerance(np.prod(sh, dtype=np.float64), dtype, compute_dtype),
+                                       r2r=bool(dct or dst))
+    if ref_ld:
+        nref = np.dtype(np.longdouble).itemsize / fl
+    else:
+        nref = 8 / fl
+    host = nbytes * (2 + 3 * nref)
+    return gpu + gpu_context_nbytes, int(host)
+
+
+def imap_memory(pool, nproc, vkwargs, vmem, max_mem, timeout=None, func=None):
+    """
+    Apply test_accuracy() (or another function) to a list of configurations using a
+    multiprocessing pool, only submitting a new configuration when the estimated memory
+    used by all submitted configurations remains below the available memory.
+    This allows to use many parallel processes for small transforms, and fewer for
+    large ones. A configuration is always submitted if no other is running.
+
+    :param pool: the multiprocessing pool
+    :param nproc: the number of processes in the pool, which is also the maximum
+        number of configurations submitted at the same time
+    :param vkwargs: the list of configurations (test_accuracy() keyword arguments)
+    :param vmem: the list of the estimated memory used by each configuration,
+        as a tuple (gpu_nbytes, host_nbytes), see accuracy_test_memory()
+    :param max_mem: the available memory, as a tuple (gpu_nbytes, host_nbytes)
+    :param timeout: the timeout (in seconds) to wait for each result. When it is
+        exceeded, a multiprocessing.TimeoutError is raised.
+    :param func: the function to apply, test_accuracy_kwargs by default
+    :return: an iterator over the results, in the same order as vkwargs
+    """
+    if func is None:
+        func = test_accuracy_kwargs
+    pending = []
+    used = [0, 0]
+    i = 0
+    while i < len(vkwargs) or len(pending):
+        while i < len(vkwargs) and len(pending) < nproc:
+            m = vmem[i]
+            if len(pending) and (used[0] + m[0] > max_mem[0] or used[1] + m[1] > max_mem[1]):
+                break
+            pending.append((pool.apply_async(func, (vkwargs[i],)), m))
+            used = [used[0] + m[0], used[1] + m[1]]
+            i += 1
+        r, m = pending.pop(0)
+        res = r.get(timeout=timeout)
+        used = [used[0] - m[0], used[1] - m[1]]
+        yield res
+
+
+def _accuracy_test_worker(tasks, results, wid, func):
+    """Worker process for AccuracyTestPool: run the tasks until None is received"""
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        i, kwargs = task
+        try:
+            res = func(kwargs)
+        except Exception as ex:
+            try:
+                pickle.dumps(ex)
+                res = ex
+            except Exception:
+                res = RuntimeError("%s\n%s" % (repr(ex), traceback.format_exc()))
+        results.put((wid, i, res))
+
+
+class AccuracyTestPool:
+    """
+    A pool of persistent worker processes to run test_accuracy() on many
+    configurations. Each worker keeps its imported modules and GPU contexts
+    (see init_ctx) between tasks, and the pool can be re-used for successive
+    series of tests, e.g. for a complete test suite.
+    Unlike multiprocessing.Pool, when a task exceeds the timeout only the
+    corresponding worker is terminated and replaced, and other tasks continue.
+    """
+
+    def __init__(self, nproc, func=None):
+        """
+
+        :param nproc: the number of worker processes
+        :param func: the function called by the workers with a dictionary of
+            keyword arguments, test_accuracy_kwargs by default
+        """
+        # Need to use spawn to handle the GPU context
+        self._mp = multiprocessing.get_context('spawn')
+        self.nproc = nproc
+        self.func = test_accuracy_kwargs if func is None else func
+        self._results = self._mp.Queue()
+        self._workers = []
+        self._wid = 0
+        # Each call to imap() is a new run, so results from a previous (interrupted) run are ignored
+        self._run = 0
+        for i in range(nproc):
+            self._workers.append(self._start_worker())
+
+    def _start_worker(self):
+        self._wid += 1
+        tasks = self._mp.Queue()
+        p = self._mp.Process(target=_accuracy_test_worker, args=(tasks, self._results, self._wid, self.func),
+                             daemon=True)
+        p.start()
+        return {"id": self._wid, "process": p, "tasks": tasks, "task": None, "t0": 0, "mem": (0, 0)}
+
+    def _replace_worker(self, w):
+        w["process"].terminate()
+        w["process"].join(5)
+        if w["process"].is_alive():
+            w["process"].kill()
+        self._workers[self._workers.index(w)] = self._start_worker()
+
+    def imap(self, vkwargs, vmem=None, max_mem=None, timeout=None):
+        """
+        Run the tests for a list of configurations, returning the results in order.
+        A new configuration is only started when a worker is idle and, if vmem and
+        max_mem are given, when its estimated memory fits in the available memory
+        (see imap_memory).
+
+        :param vkwargs: the list of configurations (test_accuracy() keyword arguments)
+        :param vmem: the list of the estimated memory used by each configuration,
+            as a tuple (gpu_nbytes, host_nbytes), see accuracy_test_memory()
+        :param max_mem: the available memory, as a tuple (gpu_nbytes, host_nbytes)
+        :param timeout: the maximum duration (in seconds) of each test. The worker
+            running a test which exceeds it is replaced.
+        :return: an iterator over the results, in the same order as vkwargs. If a
+            test raised an exception or exceeded the timeout, the exception
+            (multiprocessing.TimeoutError for the timeout) is returned instead.
+        """
+        if vmem is None or max_mem is None:
+            vmem = [(0, 0)] * len(vkwargs)
+            max_mem = (np.inf, np.inf)
+        self._run += 1
+        run = self._run
+        used = [0, 0]
+        vres = {}
+        i_next, i_yield = 0, 0
+        while i_yield < len(vkwargs):
+            # Start new tasks
+            for w in self._workers:
+                if i_next >= len(vkwargs):
+                    break
+                if w["task"] is not None:
+                    continue
+                m = vmem[i_next]
+                if used != [0, 0] and (used[0] + m[0] > max_mem[0] or used[1] + m[1] > max_mem[1]):
+                    break
+                w["tasks"].put(((run, i_next), vkwargs[i_next]))
+                w["task"], w["t0"], w["mem"] = (run, i_next), timeit.default_timer(), m
+                used = [used[0] + m[0], used[1] + m[1]]
+                i_next += 1
+            if i_yield in vres:
+                yield vres.pop(i_yield)
+                i_yield += 1
+                continue
+            try:
+                wid, task, res = self._results.get(timeout=1)
+                for w in self._workers:
+                    if w["id"] == wid and w["task"] == task:
+                        w["task"] = None
+                        if task[0] == run:
+                            vres[task[1]] = res
+                            used = [used[0] - w["mem"][0], used[1] - w["mem"][1]]
+            except queue.Empty:
+                pass
+            # Replace the workers which exceeded the timeout or died
+            for w in list(self._workers):
+                if w["task"] is None:
+                    continue
+                if timeout is not None and timeit.default_timer() - w["t0"] > timeout:
+                    ex = multiprocessing.TimeoutError("Test exceeded the %gs timeout" % timeout)
+                elif not w["process"].is_alive():
+                    ex = RuntimeError("The worker process died (exit code %s)" % str(w["process"].exitcode))
+                else:
+                    continue
+                if w["task"][0] == run:
+                    vres[w["task"][1]] = ex
+                    used = [used[0] - w["mem"][0], used[1] - w["mem"][1]]
+                self._replace_worker(w)
+
+    def close(self):
+        """Stop all the worker processes"""
+        for w in self._workers:
+            if w["task"] is None:
+                w["tasks"].put(None)
+            else:
+                w["process"].terminate()
+        for w in self._workers:
+            w["process"].join(5)
+            if w["process"].is_alive():
+                w["process"].kill()
+        self._workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
 def cleanup_cu_ctx():
     # Is that really clean ?
     if has_pycuda:
@@ -142,19 +513,332 @@ def cleanup_cu_ctx():
 atexit.register(cleanup_cu_ctx)
 
 
+# Number of values used for each chunk when comparing arrays
+norm_chunk_size = 2 ** 22
+
+
+def _host_chunks(a, b, chunk_size=None):
+    """Iterate over corresponding chunks of two host arrays of the same shape,
+    without copy if both arrays are contiguous"""
+    if chunk_size is None:
+        chunk_size = norm_chunk_size
+    if a.flags.c_contiguous and b.flags.c_contiguous:
+        a, b = a.reshape(-1), b.reshape(-1)
+        for i in range(0, a.size, chunk_size):
+            yield a[i:i + chunk_size], b[i:i + chunk_size]
+    else:
+        yield a, b
+
+
+def _gpu_chunks(ref, a_gpu, half=False, crop=0, scale=1, chunk_size=None):
+    """
+    Iterate over corresponding chunks of a host reference array and of a GPU array
+    with the same shape, downloading the GPU array by chunks so that no full-size
+    host copy is needed.
+
+    :param ref: the reference numpy array
+    :param a_gpu: the GPU array (pyopencl, pycuda or cupy), which must be contiguous
+    :param half: if True, a_gpu is a float16 array with a last (real, imaginary) axis,
+        see complex_to_half()
+    :param crop: number of values to ignore at the end of the last axis of a_gpu
+        (2 for the padding of inplace R2C transforms)
+    :param scale: the downloaded values are multiplied by this factor
+    :param chunk_size: the approximate number of values in each chunk
+    :return: an iterator over (ref_chunk, a_chunk) numpy arrays
+    """
+    if chunk_size is None:
+        chunk_size = norm_chunk_size
+    if ref.ndim == 0 or ref.size == 0:
+        # Nothing to chunk
+        yield ref, _gpu_get(a_gpu, half, crop, scale)
+        return
+    nx = ref.shape[-1] if crop else 1
+    ref = ref.reshape((-1, nx))
+    a_gpu = a_gpu.reshape((len(ref), nx + crop) + ((2,) if half else ()))
+    nrow = max(1, chunk_size // nx)
+    for i in range(0, len(ref), nrow):
+        yield ref[i:i + nrow], _gpu_get(a_gpu[i:i + nrow], half, crop, scale)
+
+
+def _gpu_get(a_gpu, half, crop, scale):
+    """Download a GPU array, as a complex64 array for half precision, with optional crop & scale"""
+    a = a_gpu.get()
+    if half:
+        a = half_to_complex(a)
+    if crop:
+        a = a[..., :-crop]
+    if scale != 1:
+        a *= scale
+    return a
+
+
+def _chunk_norms(chunks):
+    """Compute the relative L2 and Linf norms of b-a (relative to a) by iterating
+    over (a, b) chunks, so only chunk-sized temporary arrays are used"""
+    n2d, n2, nid, ni = 0, 0, 0, 0
+    for a, b in chunks:
+        d = abs(a - b)
+        n2d += (d * d).sum()
+        nid = max(nid, d.max())
+        d = abs(a)
+        n2 += (d * d).sum()
+        ni = max(ni, d.max())
+    return float(np.sqrt(n2d / n2)), float(nid / ni)
+
+
+def error_norms(a, b):
+    """
+    Compute the relative L2 and Linf norms of the difference between two arrays,
+    using chunks to avoid full-size temporary arrays.
+
+    :param a: the reference array
+    :param b: the array to compare to the reference, with the same shape
+    :return: (l2, linf)
+    """
+    return _chunk_norms(_host_chunks(a, b))
+
+
+def gpu_error_norms(ref, a_gpu, half=False, crop=0, scale=1):
+    """
+    Compute the relative L2 and Linf norms of the difference between a GPU array
+    and a host reference array. The GPU array is downloaded and compared by chunks,
+    so this does not require a full-size host copy of the GPU array or any
+    full-size temporary array.
+
+    :param ref: the reference numpy array
+    :param a_gpu: the GPU array (pyopencl, pycuda or cupy), which must be contiguous
+    :param half: if True, a_gpu is a float16 array with a last (real, imaginary) axis
+    :param crop: number of values to ignore at the end of the last axis of a_gpu,
+        e.g. 2 for the padding of inplace R2C transforms
+    :param scale: the values of the GPU array are multiplied by this factor
+    :return: (l2, linf)
+    """
+    return _chunk_norms(_gpu_chunks(ref, a_gpu, half=half, crop=crop, scale=scale))
+
+
+def gpu_array_equal(ref, a_gpu, half=False):
+    """
+    Check that a GPU array is equal to a host array, downloading it by chunks.
+
+    :param ref: the reference numpy array
+    :param a_gpu: the GPU array (pyopencl, pycuda or cupy), which must be contiguous
+    :param half: if True, a_gpu is a float16 array with a last (real, imaginary) axis
+    :return: True if all values are equal
+    """
+    for a, b in _gpu_chunks(ref, a_gpu, half=half):
+        if not np.array_equal(a, b):
+            return False
+    return True
+
+
+def ref_error_bound(shape, r2r=False):
+    """
+    A-priori bound for the relative Linf error (as computed by error_norms) of
+    a float64 reference transform computed using scipy (pocketfft) or numpy.
+
+    The relative L2 error of a float64 FFT is bounded by ~eps*log2(n)
+    (with a margin for the Bluestein algorithm or the generic radix
+    passes used for large prime factors, and for the extended size of DCT/DST).
+    The Linf error of each transform is then at most sqrt(n) times larger
+    than its L2 norm, relative to the largest value of the transform.
+
+    :param shape: the shape of the transformed axes (excluding batch axes)
+    :param r2r: True for a DCT or DST transform
+    :return: the error bound
+    """
+    b = 0
+    for n in shape:
+        if r2r:
+            n *= 2
+        if n > 1:
+            b += np.log2(n)
+            if max(primes(n)) > 13:
+                # Bluestein or generic radix pass
+                b += 2 * np.log2(4 * n)
+    n = np.prod(shape, dtype=np.float64)
+    return 4 * np.finfo(np.float64).eps * (2 + b) * np.sqrt(n)
+
+
 def l2(a, b):
     """L2 norm"""
-    return np.sqrt((abs(a - b) ** 2).sum() / (abs(a) ** 2).sum())
+    return error_norms(a, b)[0]
 
 
 def li(a, b):
     """Linf norm"""
-    return abs(a - b).max() / abs(a).max()
+    return error_norms(a, b)[1]
+
+
+def complex_to_half(a):
+    """Convert a complex numpy array to a float16 array with an extra (real, imaginary)
+    last axis, which has the same memory layout as complex32 and can be used
+    with all GPU array libraries.
+    """
+    b = np.empty(a.shape + (2,), dtype=np.float16)
+    b[..., 0] = a.real
+    b[..., 1] = a.imag
+    return b
+
+
+def half_to_complex(a):
+    """Convert a float16 array with an extra (real, imaginary) last axis to complex64"""
+    return a[..., 0].astype(np.float32) + 1j * a[..., 1].astype(np.float32)
+
+
+def make_random_array(shape, dtype, seed):
+    """
+    Generate a reproducible random array, with values uniformly distributed
+    between -0.5 and 0.5 (for both real and imaginary parts for a complex array).
+    This uses a counter-based Philox generator keyed on the seed and the array shape
+    and kind (real or complex), so any process generates the same array for a given
+    configuration, without depending on previous random draws.
+
+    :param shape: the array shape
+    :param dtype: the array type (np.float32, np.float64, np.complex64 or np.complex128)
+    :param seed: the seed (an integer)
+    :return: the new array
+    """
+    dtype = np.dtype(dtype)
+    h = hashlib.blake2b(repr((int(seed), tuple(int(n) for n in shape), dtype.kind)).encode(), digest_size=16)
+    rng = np.random.Generator(np.random.Philox(key=np.frombuffer(h.digest(), dtype=np.uint64)))
+    a = np.empty(shape, dtype=dtype)
+    # Generate directly in the destination array, without a float64 temporary array
+    v = a.view(np.float32 if dtype in (np.float32, np.complex64) else np.float64)
+    rng.random(out=v, dtype=v.dtype)
+    v -= 0.5
+    return a
+
+
+class ReferenceCache:
+    """
+    Content-addressed cache of the reference (scipy or numpy) transforms used by
+    test_accuracy(), so that the same reference is not computed again when testing
+    the same array with different parameters (LUT, inplace, normalisation, backend..).
+    The results are kept in memory, and optionally stored on disk as .npy files
+    which are loaded as memory maps, so they can be shared between processes and runs.
+    """
+
+    def __init__(self, directory=None, maxbytes=1024 ** 3, disk_maxbytes=32 * 1024 ** 3):
+        """
+        :param directory: the directory where the reference transforms are stored.
+            If None, the cache is only kept in memory.
+        :param maxbytes: the maximum size of the arrays kept in memory
+        :param disk_maxbytes: the maximum size of the files stored in the directory.
+            When it is exceeded, the least recently stored files are removed.
+        """
+        self.directory = directory
+        self.maxbytes = maxbytes
+        self.disk_maxbytes = disk_maxbytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(func, a, **kwargs):
+        """
+        Compute the key for a reference transform, from the transform function name,
+        its keyword arguments, and the shape, type and content of the input array.
+
+        :return: the key as a hexadecimal string
+        """
+        h = hashlib.blake2b(digest_size=20)
+        h.update(repr((func.__name__, a.shape, str(a.dtype), sorted(kwargs.items()))).encode())
+        h.update(np.ascontiguousarray(a).view(np.uint8))
+        return h.hexdigest()
+
+    def transform(self, func, a, **kwargs):
+        """
+        Get the transform func(a, **kwargs) from the cache, or compute it.
+
+        :param func: the reference transform function, e.g. scipy.fft.fftn
+        :param a: the input array
+        :param kwargs: keyword arguments for the transform, e.g. axes
+        :return: the transformed array. This should not be modified.
+        """
+        k = self.key(func, a, **kwargs)
+        if k in self._cache:
+            self._cache.move_to_end(k)
+            self.hits += 1
+            return self._cache[k]
+        filename = None
+        if self.directory is not None:
+            filename = os.path.join(self.directory, k + '.npy')
+            if os.path.exists(filename):
+                try:
+                    r = np.load(filename, mmap_mode='r')
+                    self.hits += 1
+                    self._add(k, r)
+                    return r
+                except (OSError, ValueError):
+                    # The file may be incomplete or removed by another process
+                    pass
+        self.misses += 1
+        r = func(a, **kwargs)
+        self._add(k, r)
+        if filename is not None:
+            self._save(filename, r)
+        return r
+
+    def _add(self, k, r):
+        self._cache[k] = r
+        self.nbytes += r.nbytes
+        while self.nbytes > self.maxbytes and len(self._cache) > 1:
+            self.nbytes -= self._cache.popitem(last=False)[1].nbytes
+
+    def _save(self, filename, r):
+        try:
+            # Write to a temporary file first so other processes never read a partial file
+            tmp = filename + '.%d.tmp' % os.getpid()
+            with open(tmp, 'wb') as f:
+                np.save(f, r)
+            os.replace(tmp, filename)
+            vf = []
+            for e in os.scandir(self.directory):
+                if e.name.endswith('.npy'):
+                    st = e.stat()
+                    vf.append((st.st_mtime, st.st_size, e.path))
+            nbytes = sum(v[1] for v in vf)
+            for mtime, size, path in sorted(vf):
+                if nbytes <= self.disk_maxbytes:
+                    break
+                os.remove(path)
+                nbytes -= size
+        except OSError:
+            # Disk full or files removed by another process - the cache is not essential
+            pass
+
+    def stats(self):
+        """
+        :return: a dictionary with the number of 'hits' and 'misses', and the 'nbytes'
+            size of the arrays kept in memory
+        """
+        return {"hits": self.hits, "misses": self.misses, "nbytes": self.nbytes}
+
+
+# Reference caches, by directory (None for the in-memory only cache)
+_ref_cache_dic = {}
+
+
+def get_reference_cache(directory=None):
+    """
+    Get the reference cache used by test_accuracy() in this process.
+
+    :param directory: the directory used to store the reference transforms,
+        or None for an in-memory only cache.
+    :return: the ReferenceCache
+    """
+    if directory not in _ref_cache_dic:
+        _ref_cache_dic[directory] = ReferenceCache(directory)
+    return _ref_cache_dic[directory]
 
 
 def test_accuracy(backend, shape, ndim, axes, dtype, inplace, norm, use_lut, r2c=False, dct=False,
                   gpu_name=None, stream=None, queue=None, return_array=False, init_array=None, verbose=False,
-                  colour_output=False, ref_long_double=True):
+                  colour_output=False, ref_long_double=True, compute_dtype=None, dst=False,
+                  preserve_input=False, ref_cache=None, seed=None):
     """
     Measure the
     :param backend: either 'pyopencl', 'pycuda' or 'cupy'
@@ -163,7 +847,9 @@ def test_accuracy(backend, shape, ndim, axes, dtype, inplace, norm, use_lut, r2c
         so the actual transform shape is the one supplied
     :param ndim: the number of FFT dimensions. Can be None if axes is given
     :param axes: the transform axes. Supersedes ndim
-    :param dtype: either np.complex64 or np.complex128, or np.float32/np.float64 for r2c & dct
+    :param dtype: either np.complex64 or np.complex128, or np.float32/np.float64 for r2c, dct & dst.
+        pyvkfft.base.complex32 can also be used for an out-of-place C2C transform with
+        compute_dtype=np.complex64.
     :param inplace: if True, make an inplace transform. Note that for inplace r2c transforms,
         the size for the last (x, fastest) axis must be even.
     :param norm: either 0, 1 or "ortho"
@@ -187,6 +873,27 @@ def test_accuracy(backend, shape, ndim, axes, dtype, inplace, norm, use_lut, r2c
     :param colour_output: if True, use some colour to tag the quality of the accuracy
     :param ref_long_double: if True and scipy is available, long double precision
         will be used for the reference transform. Otherwise, this is ignored.
+        If 'auto', a float64 reference is used with an a-priori error bound
+        (see ref_error_bound), and the long double reference is only computed
+        when the measured error is within that bound of the tolerance, i.e. when
+        the float64 reference cannot decide whether the test succeeds.
+    :param compute_dtype: the dtype used for the calculations, if different from dtype.
+        Use np.complex64 with dtype=complex32 to test half precision storage with
+        single precision calculations, or np.complex128 (or np.float64) with
+        a single precision dtype to test double precision calculations with
+        single precision storage.
+    :param dst: either 1, 2, 3 or 4 to test different dst. Only norm=1 is can be
+        tested (native scipy normalisation).
+    :param preserve_input: if True (only for out-of-place transforms), use an internal
+        buffer so that the source array is never modified, including for C2R transforms.
+    :param ref_cache: if True, the reference transforms are cached in memory, so they are
+        not computed again for the same input array (see ReferenceCache). If this is a
+        directory name, the reference transforms are also stored in this directory,
+        to be re-used by other processes. This is only useful with init_array or seed.
+    :param seed: the seed used to generate the random array if init_array is None,
+        see make_random_array(). The same array (and reference transforms) is then used
+        when testing different parameters with the same array shape. If None, a random
+        seed is drawn, and returned in the results so the test can be reproduced.
     :return: a dictionary with (l2_fft, li_fft, l2_ifft, li_ifft, tol, dt_array,
         dt_app, dt_fft, dt_ifft, src_unchanged_fft, src_unchanged_ifft, tol_test, str),
         with the L2 and Linf normalised norms comparing pyvkfft's result with either
@@ -216,16 +923,22 @@ def test_accuracy(backend, shape, ndim, axes, dtype, inplace, norm, use_lut, r2c
         queue = gpu_ctx_dic["pyopencl"][2]
     shape0 = shape
     dtype0 = dtype
-    if dtype in (np.complex64, np.float32):
+    # Half precision storage: the GPU arrays use float16 with an extra (re, im) axis
+    half = dtype == complex32
+    if half and (r2c or dct or dst or inplace):
+        raise RuntimeError("test_accuracy: complex32 can only be tested with out-of-place C2C transforms")
+    # Single precision storage with double precision calculations
+    double_compute = dtype in (np.complex64, np.float32) and compute_dtype in (np.complex128, np.float64)
+    if dtype in (np.complex64, np.float32) or half:
         dtype = np.complex64
         dtypef = np.float32
     else:
         dtype = np.complex128
         dtypef = np.float64
 
-    if dct:
+    if dct or dst:
         if norm != 1:
-            raise RuntimeError("test_accuracy: only norm=1 can be used with dct")
+            raise RuntimeError("test_accuracy: only norm=1 can be used with dct or dst")
     if r2c:
         if inplace:
             # Add two extra columns in the source array
@@ -247,32 +960,48 @@ def test_accuracy(backend, shape, ndim, axes, dtype, inplace, norm, use_lut, r2c
                 d0[..., :-2] = init_array
             else:
                 d0 = init_array.astype(dtypef)
-        elif dct:
+        elif dct or dst:
             d0 = init_array.astype(dtypef)
         else:
             d0 = init_array.astype(dtype)
     else:
-        if r2c or dct:
-            d0 = np.random.uniform(-0.5, 0.5, shape).astype(dtypef)
+        if seed is None:
+            seed = int(np.random.randint(0, 2 ** 31))
+        # Use the shape without the inplace R2C padding, so the same array is generated
+        # for inplace and out-of-place transforms
+        tmp = make_random_array(shape0, dtypef if r2c or dct or dst else dtype, seed)
+        if r2c and inplace:
+            d0 = np.zeros(shape, dtype=dtypef)
+            d0[..., :-2] = tmp
         else:
-            d0 = (np.random.uniform(-0.5, 0.5, shape) + 1j * np.random.uniform(-0.5, 0.5, shape)).astype(dtype)
+            d0 = tmp
+    if half:
+        # Use values which can be exactly represented in half precision
+        d0 = half_to_complex(complex_to_half(d0))
 
     t1 = timeit.default_timer()
 
     if 'opencl' in backend:
-        app = clVkFFTApp(d0.shape, d0.dtype, queue, ndim=ndim, norm=norm,
-                         axes=axes, useLUT=use_lut, inplace=inplace, r2c=r2c, dct=dct)
+        app = clVkFFTApp(d0.shape, complex32 if half else d0.dtype, queue, ndim=ndim, norm=norm,
+                         axes=axes, useLUT=use_lut, inplace=inplace, r2c=r2c, dct=dct,
+                         dst=dst, compute_dtype=compute_dtype, preserve_input=preserve_input)
         t2 = timeit.default_timer()
-        d_gpu = cla.to_device(queue, d0)
+
+        def to_gpu(a):
+            return cla.to_device(queue, a)
     else:
         if backend == "pycuda":
             to_gpu = cua.to_gpu
         else:
             to_gpu = cp.array
 
-        app = cuVkFFTApp(d0.shape, d0.dtype, ndim=ndim, norm=norm, axes=axes,
-                         useLUT=use_lut, inplace=inplace, r2c=r2c, dct=dct, stream=stream)
+        app = cuVkFFTApp(d0.shape, complex32 if half else d0.dtype, ndim=ndim, norm=norm, axes=axes,
+                         useLUT=use_lut, inplace=inplace, r2c=r2c, dct=dct, dst=dst, stream=stream,
+                         compute_dtype=compute_dtype, preserve_input=preserve_input)
         t2 = timeit.default_timer()
+    if half:
+        d_gpu = to_gpu(complex_to_half(d0))
+    else:
         d_gpu = to_gpu(d0)
 
     if axes is None:
@@ -284,11 +1013,7 @@ def test_accuracy(backend, shape, ndim, axes, dtype, inplace, norm, use_lut, r2c
     if r2c and inplace:
         s = np.sqrt(s ** 2 / d0.shape[-1] * (d0.shape[-1] - 2))
 
-    # Tolerance estimated from accuracy notebook
-    if dtype in (np.complex64, np.float32):
-        tol = 2e-6 + 5e-7 * np.log10(s ** 2)
-    else:
-        tol = 5e-15 + 5e-16 * np.log10(s ** 2)
+    tol = accuracy_tolerance(s ** 2, dtype, compute_dtype)
 
     n = max(shape)
     bluestein = max(primes(n)) > 13
@@ -309,41 +1034,75 @@ def test_accuracy(backend, shape, ndim, axes, dtype, inplace, norm, use_lut, r2c
         else:
             d1_gpu = d_gpu.copy()
 
-    if has_scipy and ref_long_double:
-        # Use long double precision
-        if r2c or dct:
-            d0n = d0.astype(np.longdouble)
-        else:
-            d0n = d0.astype(np.clongdouble)
+    # Precision used for the reference transform
+    ref_auto = has_scipy and _is_auto(ref_long_double)
+    ref_ld = has_scipy and not ref_auto and bool(ref_long_double)
+    if ref_auto and _ref_auto_long_double([shape0[i] for i in axes_numpy], tol, r2r=bool(dct or dst)):
+        # The float64 reference would never be accurate enough to decide
+        ref_auto, ref_ld = False, True
+
+    def ref_input(a, long_double):
+        if long_double:
+            return a.astype(np.longdouble if a.dtype.kind == 'f' else np.clongdouble)
+        if ref_auto:
+            return a.astype(np.float64 if a.dtype.kind == 'f' else np.complex128, copy=False)
+        return a
+
+    d0n = ref_input(d0, ref_ld)
+
+    if ref_cache:
+        ref = get_reference_cache(None if ref_cache is True else ref_cache).transform
     else:
-        d0n = d0
+        def ref(func, a, **kwargs):
+            return func(a, **kwargs)
 
-    d1_gpu = app.fft(d_gpu, d1_gpu)
-    if not dct:
-        d1_gpu *= app.get_fft_scale()
+    if ref_auto:
+        ref_bound = ref_error_bound([shape0[i] for i in axes_numpy], r2r=dct or dst)
+    # Number of reference transforms computed in long double precision
+    ref_nb_ld = 0
 
-    if r2c:
-        if inplace:
-            d = rfftn(d0n[..., :-2], axes=axes_numpy) / s
-        else:
-            d = rfftn(d0n, axes=axes_numpy) / s
-    elif dct:
-        d = dctn(d0n, axes=axes_numpy, type=dct)
+    d1_gpu = app.fft(d_gpu, d1_gpu)
+    if half:
+        # Scaling is done on the host
+        scale = app.get_fft_scale()
     else:
-        d = fftn(d0n, axes=axes_numpy) / s
+        scale = 1
+        if not (dct or dst):
+            d1_gpu *= app.get_fft_scale()
+
+    def fft_ref(a):
+        if r2c:
+            if inplace:
+                return ref(rfftn, a[..., :-2], axes=axes_numpy) / s
+            return ref(rfftn, a, axes=axes_numpy) / s
+        elif dct:
+            return ref(dctn, a, axes=axes_numpy, type=dct)
+        elif dst:
+            return ref(dstn, a, axes=axes_numpy, type=dst)
+        return ref(fftn, a, axes=axes_numpy) / s
+
+    d = fft_ref(d0n)
 
     if inplace and r2c:
         assert d1_gpu.dtype == dtype, "The array type is incorrect after an inplace FFT"
 
-    n2, ni = l2(d, d1_gpu.get()), li(d, d1_gpu.get())
+    # The result is downloaded and compared by chunks
+    n2, ni = gpu_error_norms(d, d1_gpu, half=half, scale=scale)
+    if ref_auto and abs(ni - tol) <= ref_bound:
+        # The float64 reference is not accurate enough to decide
+        d = fft_ref(ref_input(d0, True))
+        n2, ni = gpu_error_norms(d, d1_gpu, half=half, scale=scale)
+        ref_nb_ld += 1
 
-    src_unchanged_fft = np.all(np.equal(d_gpu.get(), d0))
+    src_unchanged_fft = gpu_array_equal(d0, d_gpu, half=half)
 
     # Output string
     if r2c:
         t = "R2C"
     elif dct:
         t = "DCT%d" % dct
+    elif dst:
+        t = "DST%d" % dst
     else:
         t = "C2C"
     if r2c and inplace:
@@ -363,9 +1122,12 @@ def test_accuracy(backend, shape, ndim, axes, dtype, inplace, norm, use_lut, r2c
     else:
         stol = "%6.2e < %6.2e (%5.3f)" % (ni, tol, ni / tol)
 
+    sdtype = "complex32" if half else str(d0.dtype)
+    if double_compute:
+        sdtype += "[f64]"
     verb_out = "%8s %4s %14s axes=%10s ndim=%4s %10s lut=%4s inplace=%d " \
                " norm=%4s %5s: n2=%6.2e ninf=%s %d" % \
-               (backend, t, shstr, shax, str(ndim), str(d0.dtype),
+               (backend, t, shstr, shax, str(ndim), sdtype,
                 str(use_lut), int(inplace), str(norm), "FFT", n2, stol, src_unchanged_fft)
 
     t3 = timeit.default_timer()
@@ -383,13 +1145,10 @@ def test_accuracy(backend, shape, ndim, axes, dtype, inplace, norm, use_lut, r2c
     if r2c:
         # Exception: we need a proper half-Hermitian array
         d0 = d.astype(dtype)
-        if has_scipy and ref_long_double:
-            d0n = d0.astype(np.clongdouble)
-        else:
-            d0n = d0
+        d0n = ref_input(d0, ref_ld)
 
-    if 'opencl' in backend:
-        d_gpu = cla.to_device(queue, d0)
+    if half:
+        d_gpu = to_gpu(complex_to_half(d0))
     else:
         d_gpu = to_gpu(d0)
 
@@ -407,33 +1166,45 @@ def test_accuracy(backend, shape, ndim, axes, dtype, inplace, norm, use_lut, r2c
             d1_gpu = d_gpu.copy()
 
     d1_gpu = app.ifft(d_gpu, d1_gpu)
-    if not dct:
-        d1_gpu *= app.get_ifft_scale()
-
-    if r2c:
-        d = irfftn(d0n, axes=axes_numpy) * s
-    elif dct:
-        d = idctn(d0n, axes=axes_numpy, type=dct)
+    if half:
+        scale = app.get_ifft_scale()
     else:
-        d = ifftn(d0n, axes=axes_numpy) * s
+        scale = 1
+        if not (dct or dst):
+            d1_gpu *= app.get_ifft_scale()
+
+    def ifft_ref(a):
+        if r2c:
+            return ref(irfftn, a, axes=axes_numpy) * s
+        elif dct:
+            return ref(idctn, a, axes=axes_numpy, type=dct)
+        elif dst:
+            return ref(idstn, a, axes=axes_numpy, type=dst)
+        return ref(ifftn, a, axes=axes_numpy) * s
+
+    d = ifft_ref(d0n)
 
     if inplace:
-        if dct or r2c:
+        if dct or dst or r2c:
             assert d1_gpu.dtype == dtypef, "The array type is incorrect after an inplace iFFT"
         else:
             assert d1_gpu.dtype == dtype, "The array type is incorrect after an inplace iFFT"
 
-    if r2c and inplace:
-        n2i, nii = l2(d, d1_gpu.get()[..., :-2]), li(d, d1_gpu.get()[..., :-2])
-    else:
-        n2i, nii = l2(d, d1_gpu.get()), li(d, d1_gpu.get())
+    crop = 2 if r2c and inplace else 0
+    n2i, nii = gpu_error_norms(d, d1_gpu, half=half, crop=crop, scale=scale)
+    if ref_auto and abs(nii - tol) <= ref_bound:
+        d = ifft_ref(ref_input(d0, True))
+        n2i, nii = gpu_error_norms(d, d1_gpu, half=half, crop=crop, scale=scale)
+        ref_nb_ld += 1
 
-    src_unchanged_ifft = np.all(np.equal(d_gpu.get(), d0))
+    src_unchanged_ifft = gpu_array_equal(d0, d_gpu, half=half)
 
     # Max N for radix 1D C2R transforms to not overwrite source
     nmaxr2c1d = 3072 * (1 + int(dtype in (np.float32, np.complex64)))
+    # With preserve_input, the source array must always be unchanged
+    src_may_change = not preserve_input and (r2c and ndim > 1 or n >= nmaxr2c1d or bluestein)
     if max(ni, nii) <= tol and (inplace or src_unchanged_fft) and \
-            (inplace or src_unchanged_ifft or (r2c and ndim > 1 or n >= nmaxr2c1d or bluestein)):
+            (inplace or src_unchanged_ifft or src_may_change):
         success = 'OK'
     else:
         success = 'FAIL'
@@ -450,18 +1221,15 @@ def test_accuracy(backend, shape, ndim, axes, dtype, inplace, norm, use_lut, r2c
 
     t4 = timeit.default_timer()
 
-    if backend == "pyopencl":
-        gpu_name = gpu_ctx_dic["pyopencl"][0].name
-    elif backend == "pycuda":
-        gpu_name = gpu_ctx_dic["pycuda"][0].name()
-    else:
-        gpu_name = ""
+    gpu_name = get_gpu_name(backend, gpu_name)
 
     res = {"n2": n2, "ni": ni, "n2i": n2i, "nii": nii, "tol": tol, "dt_array": t1 - t0, "dt_app": t2 - t1,
            "dt_fft": t3 - t2, "dt_ifft": t4 - t3, "src_unchanged_fft": src_unchanged_fft,
            "src_unchanged_ifft": src_unchanged_ifft, "tol_test": max(ni, nii) < tol, "str": verb_out,
            "backend": backend, "shape": shape0, "ndim": ndim, "axes": axes, "dtype": dtype0, "inplace": inplace,
-           "norm": norm, "use_lut": use_lut, "r2c": r2c, "dct": dct, "gpu_name": gpu_name}
+           "norm": norm, "use_lut": use_lut, "r2c": r2c, "dct": dct, "dst": dst,
+           "gpu_name": gpu_name, "compute_dtype": compute_dtype, "preserve_input": preserve_input,
+           "seed": seed, "ref_nb_long_double": ref_nb_ld if ref_auto else 2 * ref_ld}
 
     if return_array:
         res["d0"] = d0
@@ -484,15 +1252,275 @@ def test_accuracy_kwargs(kwargs):
     return test_accuracy(**kwargs)
 
 
+class GPUTimer:
+    """
+    Measure the time spent on the GPU using cuda events or OpenCL profiling
+    markers, so that the host overhead (kernel launch, python calls) is excluded
+    as much as possible.
+    """
+
+    def __init__(self, backend, stream=None, queue=None):
+        """
+
+        :param backend: either 'pyopencl', 'pycuda' or 'cupy'
+        :param stream: the cuda stream used for the measured operations, or None
+        :param queue: the opencl queue used for the measured operations. It must have
+            been created with cl.command_queue_properties.PROFILING_ENABLE
+        """
+        self.backend = backend
+        self.stream = stream
+        self.queue = queue
+        self._start = None
+
+    def _event(self):
+        if self.backend == "pyopencl":
+            return cl.enqueue_marker(self.queue)
+        elif self.backend == "pycuda":
+            return cu_drv.Event().record(self.stream)
+        e = cp.cuda.Event()
+        e.record(self.stream)
+        return e
+
+    def start(self):
+        self._start = self._event()
+
+    def stop(self):
+        """
+        Wait for the measured operations to finish.
+
+        :return: the time elapsed on the GPU since start(), in seconds
+        """
+        e = self._event()
+        if self.backend == "pyopencl":
+            e.wait()
+            return (e.profile.end - self._start.profile.end) * 1e-9
+        e.synchronize()
+        if self.backend == "pycuda":
+            return e.time_since(self._start) * 1e-3
+        return cp.cuda.get_elapsed_time(self._start, e) * 1e-3
+
+
+def gpu_timings(app, src, dest=None, inverse=False, nb_repeat=20, reset=None):
+    """
+    Measure the GPU time of each launch of a transform, using cuda events or
+    OpenCL profiling (see GPUTimer), as well as the host time needed to launch it.
+    The number of kernels actually launched by VkFFT is used to estimate the
+    memory bandwidth achieved by the transform, assuming that each kernel reads
+    and writes the whole array once.
+
+    :param app: the VkFFTApp (pyvkfft.cuda or pyvkfft.opencl). For OpenCL, its
+        queue must have been created with cl.command_queue_properties.PROFILING_ENABLE
+    :param src: the source GPU array
+    :param dest: the destination GPU array, or None for an inplace transform
+    :param inverse: if True, time the inverse transform
+    :param nb_repeat: the number of timed transforms. One extra (untimed)
+        transform is performed first as a warm-up.
+    :param reset: a function called (untimed) before each transform, e.g. to
+        restore the source array of an inplace transform
+    :return: a dictionary with 'dt' and 'dt_launch' (the lists of GPU and host
+        launch times for each transform, in seconds), 'nb_dispatch' (the number of
+        kernels launched for one transform), 'nbytes' (the estimated number of bytes
+        read and written in GPU memory for one transform) and 'gbps', the
+        corresponding bandwidth in Gbytes/s (using the median GPU time)
+    """
+    if has_opencl and isinstance(app, clVkFFTApp):
+        backend, stream, queue = "pyopencl", None, app.queue
+        if not queue.properties & cl.command_queue_properties.PROFILING_ENABLE:
+            raise RuntimeError("gpu_timings: the OpenCL queue must be created with PROFILING_ENABLE")
+    else:
+        backend = "cupy" if has_cupy and isinstance(src, cp.ndarray) else "pycuda"
+        stream, queue = app.stream, None
+    timer = GPUTimer(backend, stream=stream, queue=queue)
+    func = app.ifft if inverse else app.fft
+    vdt, vdt_launch = [], []
+    for i in range(nb_repeat + 1):
+        if reset is not None:
+            reset()
+        timer.start()
+        t0 = timeit.default_timer()
+        func(src, dest)
+        dt_launch = timeit.default_timer() - t0
+        dt = timer.stop()
+        if i:
+            vdt.append(dt)
+            vdt_launch.append(dt_launch)
+    nb_dispatch = app.get_nb_dispatch()
+    nbytes = nb_dispatch * 2 * max(src.nbytes, src.nbytes if dest is None else dest.nbytes)
+    return {"dt": vdt, "dt_launch": vdt_launch, "nb_dispatch": nb_dispatch, "nbytes": nbytes,
+            "gbps": nbytes / np.median(vdt) / 1024 ** 3}
+
+
+def speed_test(backend, shape, ndim, axes, dtype, inplace, norm, use_lut, r2c=False, dct=False, dst=False,
+               gpu_name=None, compute_dtype=None, nb_repeat=20, verbose=False, **kwargs):
+    """
+    Measure the GPU time of a forward and backward transform. Each transform
+    is timed separately using cuda events or OpenCL profiling (see GPUTimer),
+    so unlike the times returned by test_accuracy(), these only include the
+    time spent on the GPU.
+
+    :param backend: either 'pyopencl', 'pycuda' or 'cupy'
+    :param shape: the shape of the array to test. If this is an inplace r2c, two
+        extra values will be appended along x, as for test_accuracy()
+    :param ndim: the number of FFT dimensions. Can be None if axes is given
+    :param axes: the transform axes. Supersedes ndim
+    :param dtype: the array dtype, see test_accuracy()
+    :param inplace: if True, make an inplace transform
+    :param norm: either 0, 1 or "ortho"
+    :param use_lut: if True,1, False or 0, will trigger useLUT=1 or 0 for VkFFT.
+    :param r2c: if True, test an r2c transform
+    :param dct: either 1, 2, 3 or 4 to test different dct
+    :param dst: either 1, 2, 3 or 4 to test different dst
+    :param gpu_name: the name of the gpu to use. If None, the first available
+        for the backend will be used.
+    :param compute_dtype: the dtype used for the calculations, if different from dtype
+    :param nb_repeat: the number of timed forward and backward transforms
+    :param verbose: if True, print a 1-line summary of the results
+    :param kwargs: other parameters (e.g. used by test_accuracy) are ignored,
+        so the same configurations can be used for both functions
+    :return: a dictionary with (dt_fft, dt_fft_std, dt_ifft, dt_ifft_std, nb_repeat,
+        dt_app, gpu_name, str), where dt_fft and dt_ifft are the median GPU times
+        for one transform, and dt_fft_std and dt_ifft_std a robust estimate of their
+        standard deviation (from the median absolute deviation).
+        All input parameters are also returned as key/values.
+    """
+    if backend == "cupy" and has_cupy:
+        mempool = cp.get_default_memory_pool()
+        if mempool is not None:
+            mempool.free_all_blocks()
+    init_ctx(backend, gpu_name=gpu_name, verbose=False)
+    queue = None
+    if backend == "pyopencl":
+        # A dedicated queue is needed to get the profiling information
+        queue = cl.CommandQueue(gpu_ctx_dic["pyopencl"][1], properties=cl.command_queue_properties.PROFILING_ENABLE)
+    half = dtype == complex32
+    if dtype in (np.complex64, np.float32) or half:
+        dtypec, dtypef = np.complex64, np.float32
+    else:
+        dtypec, dtypef = np.complex128, np.float64
+    shape0 = tuple(shape)
+    shapec = shape0
+    if r2c:
+        shape = list(shape)
+        shapec = list(shape)
+        shapec[-1] = shapec[-1] // 2 + 1
+        if inplace:
+            shape[-1] += 2
+        shape, shapec = tuple(shape), tuple(shapec)
+    d0 = make_random_array(shape, dtypef if r2c or dct or dst else dtypec, seed=0)
+    if half:
+        d0 = complex_to_half(d0)
+
+    t0 = timeit.default_timer()
+    if backend == "pyopencl":
+        app = clVkFFTApp(shape, complex32 if half else d0.dtype, queue, ndim=ndim, norm=norm, axes=axes,
+                         useLUT=use_lut, inplace=inplace, r2c=r2c, dct=dct, dst=dst, compute_dtype=compute_dtype)
+
+        def to_gpu(a):
+            return cla.to_device(queue, a)
+
+        def empty(sh, dt):
+            return cla.empty(queue, sh, dtype=dt)
+    else:
+        app = cuVkFFTApp(shape, complex32 if half else d0.dtype, ndim=ndim, norm=norm, axes=axes,
+                         useLUT=use_lut, inplace=inplace, r2c=r2c, dct=dct, dst=dst, compute_dtype=compute_dtype)
+        if backend == "pycuda":
+            to_gpu, empty = cua.to_gpu, cua.empty
+        else:
+            to_gpu, empty = cp.array, cp.empty
+    dt_app = timeit.default_timer() - t0
+
+    d_gpu = to_gpu(d0)
+    if inplace:
+        d1_gpu, d2_gpu = d_gpu, d_gpu
+    else:
+        d1_gpu = empty(shapec, dtypec) if r2c else d_gpu.copy()
+        d2_gpu = d_gpu.copy()
+
+    def reset_fft():
+        if inplace:
+            # Avoid an overflow after repeated transforms with norm=0
+            d_gpu.set(d0)
+
+    def reset_ifft():
+        # Each inverse transform uses the result of a forward one
+        reset_fft()
+        app.fft(d_gpu, d1_gpu)
+
+    vdt_fft = gpu_timings(app, d_gpu, None if inplace else d1_gpu, nb_repeat=nb_repeat, reset=reset_fft)["dt"]
+    vdt_ifft = gpu_timings(app, d1_gpu, None if inplace else d2_gpu, inverse=True, nb_repeat=nb_repeat,
+                           reset=reset_ifft)["dt"]
+    del d_gpu, d1_gpu, d2_gpu, app
+
+    dt_fft, dt_ifft = np.median(vdt_fft), np.median(vdt_ifft)
+    # Robust standard deviation estimate, from the median absolute deviation
+    dt_fft_std = 1.4826 * np.median(abs(np.array(vdt_fft) - dt_fft))
+    dt_ifft_std = 1.4826 * np.median(abs(np.array(vdt_ifft) - dt_ifft))
+
+    if r2c:
+        t = "R2C"
+    elif dct:
+        t = "DCT%d" % dct
+    elif dst:
+        t = "DST%d" % dst
+    else:
+        t = "C2C"
+    sdtype = "complex32" if half else str(np.dtype(dtypef if r2c or dct or dst else dtypec))
+    if dtype in (np.complex64, np.float32) and compute_dtype in (np.complex128, np.float64):
+        sdtype += "[f64]"
+    verb_out = "%8s %4s %14s axes=%10s ndim=%4s %10s lut=%4s inplace=%d  norm=%4s FFT: %10.4fms +/- %8.4f " \
+               "iFFT: %10.4fms +/- %8.4f" % \
+               (backend, t, str(shape0).replace(" ", ""), str(axes).replace(" ", ""), str(ndim), sdtype,
+                str(use_lut), int(inplace), str(norm), dt_fft * 1000, dt_fft_std * 1000, dt_ifft * 1000,
+                dt_ifft_std * 1000)
+    if verbose:
+        print(verb_out)
+
+    return {"dt_fft": float(dt_fft), "dt_fft_std": float(dt_fft_std), "dt_ifft": float(dt_ifft),
+            "dt_ifft_std": float(dt_ifft_std), "nb_repeat": nb_repeat, "dt_app": dt_app,
+            "gpu_name": get_gpu_name(backend, gpu_name), "str": verb_out, "backend": backend, "shape": shape0,
+            "ndim": ndim, "axes": axes, "dtype": dtype, "inplace": inplace, "norm": norm, "use_lut": use_lut,
+            "r2c": r2c, "dct": dct, "dst": dst, "compute_dtype": compute_dtype}
+
+
+def speed_test_kwargs(kwargs):
+    # Module-level function so it can be used with a multiprocessing pool, see test_accuracy_kwargs
+    if kwargs['backend'] == 'pyopencl' and has_opencl:
+        try:
+            return speed_test(**kwargs)
+        except cl.RuntimeError as ex:
+            raise RuntimeError("An OpenCL RuntimeError was encountered")
+    return speed_test(**kwargs)
+
+
+def is_slower(dt, dt_std, nb, dt0, dt0_std, nb0, threshold=0.05, nsigma=3):
+    """
+    Test if a measured time is significantly slower than a reference (baseline) one.
+
+    :param dt: the measured (median) time
+    :param dt_std: the standard deviation of the measured time
+    :param nb: the number of measurements
+    :param dt0: the reference time
+    :param dt0_std: the standard deviation of the reference time
+    :param nb0: the number of reference measurements
+    :param threshold: the relative slowdown below which differences are ignored
+    :param nsigma: the slowdown must also be larger than nsigma times the
+        standard deviation of the difference to be significant
+    :return: True if dt is slower than dt0 by more than the threshold, and the
+        difference is statistically significant
+    """
+    d = dt - dt0
+    return bool(d > threshold * dt0 and d > nsigma * np.sqrt(dt_std ** 2 / nb + dt0_std ** 2 / nb0))
+
+
 def exhaustive_test(backend, vn, ndim, dtype, inplace, norm, use_lut, r2c=False, dct=False, nproc=None,
-                    verbose=True, return_res=False):
+                    verbose=True, return_res=False, dst=False):
     """
     Run tests on a large range of sizes using multiprocessing. Manual function.
 
     :param backend: either 'pyopencl', 'pycuda' or 'cupy'
     :param vn: the list/iterable of sizes n.
     :param ndim: the number of dimensions. The array shape will be [n]*ndim
-    :param dtype: either np.complex64 or np.complex128, or np.float32/np.float64 for r2c & dct
+    :param dtype: either np.complex64 or np.complex128, or np.float32/np.float64 for r2c, dct & dst
     :param inplace: True or False
     :param norm: either 0, 1 or "ortho"
     :param use_lut: if True,1, False or 0, will trigger useLUT=1 or 0 for VkFFT.
@@ -506,6 +1534,8 @@ def exhaustive_test(backend, vn, ndim, dtype, inplace, norm, use_lut, r2c=False,
         number of detected cores will be used (this may use too much memory !)
     :param verbose: if True, prints 1 line per test
     :param return_res: if True, return the list of result dictionaries.
+    :param dst: either 1, 2, 3 or 4 to test different dst. Only norm=1 is can be
+        tested (native scipy normalisation).
     :return: True if all tests passed, False otherwise. If return_res is True, return
         the list of result dictionaries instead.
     """
@@ -523,14 +1553,16 @@ def exhaustive_test(backend, vn, ndim, dtype, inplace, norm, use_lut, r2c=False,
     vkwargs = []
     for n in vn:
         kwargs = {"backend": backend, "shape": [n] * ndim, "ndim": ndim, "axes": None, "dtype": dtype,
-                  "inplace": inplace, "norm": norm, "use_lut": use_lut, "r2c": r2c, "dct": dct, "stream": None,
-                  "verbose": False}
+                  "inplace": inplace, "norm": norm, "use_lut": use_lut, "r2c": r2c, "dct": dct, "dst": dst,
+                  "stream": None, "verbose": False}
         vkwargs.append(kwargs)
     vok = []
     vres = []
+    vmem = [accuracy_test_memory(**kw) for kw in vkwargs]
+    gpu_free, host_free = get_free_memory(backend)
     # Need to use spawn to handle the GPU context
     with multiprocessing.get_context('spawn').Pool(nproc) as pool:
-        for res in pool.imap(test_accuracy_kwargs, vkwargs):
+        for res in imap_memory(pool, nproc, vkwargs, vmem, (0.9 * gpu_free, 0.8 * host_free)):
             # TODO: this should better be logged
             if verbose:
                 print(res['str'])
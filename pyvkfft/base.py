@@ -9,6 +9,9 @@ import os
 import platform
 import sysconfig
 import ctypes
+import functools
+import time
+import timeit
 import warnings
 from enum import Enum
 import numpy as np
@@ -108,13 +111,100 @@ class VkFFTResult(Enum):
     VKFFT_ERROR_FAILED_TO_CREATE_EVENT = 4052
 
 
-def load_library(basename):
+def _get_precision(dtype):
+    """ Return the number of bytes per float for a real or complex dtype """
+    if dtype in [np.float16, complex32]:
+        return 2
+    elif dtype in [np.float32, np.complex64]:
+        return 4
+    elif dtype in [np.float64, np.complex128]:
+        return 8
+    raise RuntimeError("Unsupported dtype: %s" % str(dtype))
+
+
+def library_path(basename):
+    """ Return the path to one of the pyvkfft shared libraries, e.g. '_vkfft_cuda' """
     if platform.system() == 'Windows':
         # We patched build_ext so the module is a .so and not a dll
         ext = '.so'
     else:
         ext = sysconfig.get_config_var('SO')
-    return ctypes.cdll.LoadLibrary(os.path.join(os.path.dirname(__file__) or os.path.curdir, basename + ext))
+    return os.path.join(os.path.dirname(__file__) or os.path.curdir, basename + ext)
+
+
+def load_library(basename):
+    return ctypes.cdll.LoadLibrary(library_path(basename))
+
+
+class _DLDevice(ctypes.Structure):
+    _fields_ = [("device_type", ctypes.c_int32), ("device_id", ctypes.c_int32)]
+
+
+class _DLDataType(ctypes.Structure):
+    _fields_ = [("code", ctypes.c_uint8), ("bits", ctypes.c_uint8), ("lanes", ctypes.c_uint16)]
+
+
+class _DLTensor(ctypes.Structure):
+    """ DLTensor from dlpack.h, which is also the start of DLManagedTensor """
+    _fields_ = [("data", ctypes.c_void_p), ("device", _DLDevice), ("ndim", ctypes.c_int32),
+                ("dtype", _DLDataType), ("shape", ctypes.POINTER(ctypes.c_int64)),
+                ("strides", ctypes.POINTER(ctypes.c_int64)), ("byte_offset", ctypes.c_uint64)]
+
+
+# DLPack device types for CUDA memory (kDLCUDA, kDLCUDAHost and kDLCUDAManaged)
+_dlpack_cuda_devices = (2, 3, 13)
+
+
+def _is_c_contiguous(shape, strides, itemsize):
+    """ Check if an array is C-contiguous, with strides in bytes (None if contiguous) """
+    if strides is None:
+        return True
+    s = itemsize
+    for n, st in zip(reversed(shape), reversed(strides)):
+        if n > 1 and st != s:
+            return False
+        s *= n
+    return True
+
+
+def cuda_array_ptr(a, stream=None):
+    """
+    Get the address of the data of an array in the CUDA memory space, using its
+    __cuda_array_interface__ (e.g. cupy, numba, pytorch) or __dlpack__ (e.g. pytorch, jax)
+    export, without any copy.
+
+    :param a: the array, which must be C-contiguous
+    :param stream: the handle (as an int) of the CUDA stream which will use the array.
+        This is given to __dlpack__ so the producer can make its pending work on
+        the array visible to this stream.
+    :raises RuntimeError: if the array is not a C-contiguous CUDA array
+    :return: a tuple (ptr, producer_stream), where producer_stream is the handle of the
+        stream given by __cuda_array_interface__, which must be synchronised with before
+        using the array, or None if no synchronisation is needed.
+    """
+    cai = getattr(a, "__cuda_array_interface__", None)
+    if cai is not None:
+        sh = cai["shape"]
+        if not _is_c_contiguous(sh, cai.get("strides"), np.dtype(cai["typestr"]).itemsize):
+            raise RuntimeError("cuda_array_ptr: the array is not C-contiguous")
+        return cai["data"][0], cai.get("stream")
+    if not hasattr(a, "__dlpack__"):
+        raise RuntimeError("cuda_array_ptr: %s does not export __cuda_array_interface__ or __dlpack__" % type(a))
+    if a.__dlpack_device__()[0] not in _dlpack_cuda_devices:
+        raise RuntimeError("cuda_array_ptr: the array is not in the CUDA memory space (DLPack device: %s)"
+                           % str(a.__dlpack_device__()))
+    # For CUDA, stream=None means the legacy default stream, which should be given as 1
+    capsule = a.__dlpack__(stream=1 if not stream else stream)
+    get_pointer = ctypes.pythonapi.PyCapsule_GetPointer
+    get_pointer.restype, get_pointer.argtypes = ctypes.c_void_p, [ctypes.py_object, ctypes.c_char_p]
+    # The capsule is not consumed, so the producer keeps ownership of the data
+    t = _DLTensor.from_address(get_pointer(capsule, b"dltensor"))
+    sh = [t.shape[i] for i in range(t.ndim)]
+    itemsize = t.dtype.bits * t.dtype.lanes // 8
+    strides = None if not t.strides else [t.strides[i] * itemsize for i in range(t.ndim)]
+    if not _is_c_contiguous(sh, strides, itemsize):
+        raise RuntimeError("cuda_array_ptr: the array is not C-contiguous")
+    return (t.data or 0) + t.byte_offset, None
 
 
 def primes(n):
@@ -179,7 +269,7 @@ def radix_gen(nmax, radix, even=False, exclude_one=True, inverted=False, nmin=No
 
 
 def radix_gen_n(nmax, max_size, radix, ndim=None, even=False, exclude_one=True, inverted=False,
-                nmin=None, max_pow=None, range_nd_narrow=None, min_size=0):
+                nmin=None, max_pow=None, range_nd_narrow=None, min_size=0, as_array=False):
     """
     Generate a list of array shape with integers which are only multiple
     of powers of base integers, e.g. 2**N1 * 3**N2 * 5**N3 etc...,
@@ -210,9 +300,10 @@ def radix_gen_n(nmax, max_size, radix, ndim=None, even=False, exclude_one=True,
     :param min_size: the minimum size (number of elements). This can be
         used to separate large array tests and use a larger number of
         parallel process for smaller ones.
-    :return: the list of array shapes.
+    :param as_array: if True, return the shapes as a compact (nb, ndim) int64
+        array instead of a list of tuples. This requires ndim=1, 2 or 3.
+    :return: the list of array shapes, sorted by size
     """
-    v = []
     if radix is None:
         if even:
             if nmin is None:
@@ -227,53 +318,290 @@ def radix_gen_n(nmax, max_size, radix, ndim=None, even=False, exclude_one=True,
     else:
         n0 = radix_gen(nmax, radix, even=even, exclude_one=exclude_one, inverted=inverted, nmin=nmin, max_pow=max_pow)
 
-    if ndim is None or ndim in [1, 12, 123]:
-        idx = np.nonzero((n0 <= max_size) * (n0 >= min_size))[0]
-        if len(idx):
-            v += list(zip(n0.take(idx)))
-    if ndim is None or ndim in [2, 12, 123]:
-        vidx = list(range(0, len(n0), 1000))
-        if vidx[-1] != len(n0):
-            vidx.append(len(n0))
-        for i1 in range(len(vidx) - 1):
-            l01 = n0[vidx[i1]:vidx[i1 + 1]]
-            for i2 in range(len(vidx) - 1):
-                l2 = n0[vidx[i2]:vidx[i2 + 1]][:, np.newaxis]
-                s = (l01 * l2).flatten()
-                l1, l2 = (l01 + np.zeros_like(l2)).flatten(), (l2 + np.zeros_like(l01)).flatten()
-                tmp = (s <= max_size) * (s >= min_size)
-                if range_nd_narrow is not None:
-                    drel, dabs = range_nd_narrow
-                    m = np.maximum(dabs, l1 * drel)
-                    tmp = np.logical_and(tmp, abs(l1 - l2) <= m)
-                idx = np.nonzero(tmp)[0]
-                if len(idx):
-                    v += list(zip(l1.take(idx), l2.take(idx)))
-    if ndim is None or ndim in [3, 123]:
-        vidx = list(range(0, len(n0), 100))
-        if vidx[-1] != len(n0):
-            vidx.append(len(n0))
-        for i1 in range(len(vidx) - 1):
-            l01 = n0[vidx[i1]:vidx[i1 + 1]]
-            for i2 in range(len(vidx) - 1):
-                l02 = n0[vidx[i2]:vidx[i2 + 1], np.newaxis]
-                for i3 in range(len(vidx) - 1):
-                    l3 = n0[vidx[i3]:vidx[i3 + 1], np.newaxis, np.newaxis]
-                    # print(i1, i2, i3, l1.shape, l2.shape, l3.shape)
-                    s = (l01 * l02 * l3).flatten()
-                    l1, l2, l3 = (l01 + np.zeros_like(l02) + np.zeros_like(l3)).flatten(), \
-                                 (l02 + np.zeros_like(l01) + np.zeros_like(l3)).flatten(), \
-                                 (l3 + np.zeros_like(l01) + np.zeros_like(l02)).flatten()
-                    tmp = (s <= max_size) * (s >= min_size)
-                    if range_nd_narrow is not None:
-                        drel, dabs = range_nd_narrow
-                        m = np.maximum(dabs, l1 * drel)
-                        tmp = np.logical_and(tmp, (abs(l1 - l2) <= m)
-                                             * (abs(l1 - l3) <= m))
-                    idx = np.nonzero(tmp)[0]
-                    if len(idx):
-                        v += list(zip(l1.take(idx), l2.take(idx), l3.take(idx)))
-    return v
+    if as_array and ndim not in [1, 2, 3]:
+        raise RuntimeError("radix_gen_n: as_array=True requires ndim=1, 2 or 3")
+    n0 = np.unique(n0).astype(np.int64)
+    va = [_radix_gen_nd(n0, nd, max_size, min_size, range_nd_narrow)
+          for nd in {None: (1, 2, 3), 12: (1, 2), 123: (1, 2, 3)}.get(ndim, (ndim,))]
+    if as_array:
+        return va[0]
+    v = [tuple(s) for a in va for s in a.tolist()]
+    # Sort by size, and by number of dimensions for identical sizes
+    vs = np.concatenate([np.prod(a, axis=1, dtype=np.float64) for a in va])
+    vnd = np.concatenate([np.full(len(a), a.shape[1]) for a in va])
+    return [v[i] for i in np.lexsort((np.arange(len(v)), vnd, vs))]
+
+
+def _radix_gen_nd(n0, ndim, max_size, min_size, range_nd_narrow):
+    """
+    Generate all the array shapes with ndim dimensions, with lengths taken
+    from n0, and the size and range_nd_narrow filters of radix_gen_n.
+    For each partial shape (s0, ..., sk), the allowed values of the next
+    length form a contiguous range of the sorted n0 array, so the shapes are
+    generated without any loop over the lengths.
+
+    :param n0: the sorted array of allowed lengths, without duplicates
+    :return: an int64 array of shape (nb, ndim), sorted by array size
+    """
+    if len(n0) == 0:
+        return np.empty((0, ndim), dtype=np.int64)
+    a = n0[:, np.newaxis]
+    # Partial product, as float64 to avoid overflow
+    p = n0.astype(np.float64)
+    # Small margin so that float rounding does not exclude a valid size, the
+    # exact filter is applied at the end
+    eps = 1 + 1e-9
+    a = a[p * float(n0[0]) ** (ndim - 1) <= max_size * eps]
+    p = a[:, 0].astype(np.float64)
+    for k in range(1, ndim):
+        nrem = ndim - 1 - k
+        hi = max_size * eps / (p * float(n0[0]) ** nrem)
+        lo = min_size / eps / (p * float(n0[-1]) ** nrem)
+        if range_nd_narrow is not None:
+            drel, dabs = range_nd_narrow
+            m = np.maximum(dabs, a[:, 0] * drel)
+            hi = np.minimum(hi, a[:, 0] + m)
+            lo = np.maximum(lo, a[:, 0] - m)
+        ilo = np.searchsorted(n0, lo, side='left')
+        nb = np.maximum(np.searchsorted(n0, hi, side='right') - ilo, 0)
+        rows = np.repeat(np.arange(len(a)), nb)
+        # Index in n0 of the new length, for each new shape
+        idx = np.arange(nb.sum()) - np.repeat(np.cumsum(nb) - nb - ilo, nb)
+        a = np.concatenate((a[rows], n0[idx, np.newaxis]), axis=1)
+        p = p[rows] * n0[idx]
+    s = np.prod(a, axis=1, dtype=np.float64)
+    ok = (s <= max_size) * (s >= min_size)
+    if range_nd_narrow is not None and ndim > 1:
+        # Exact filter for the lengths differences
+        drel, dabs = range_nd_narrow
+        m = np.maximum(dabs, a[:, :1] * drel)
+        ok *= np.all(abs(a[:, 1:] - a[:, :1]) <= m, axis=1)
+    a, s = a[ok], s[ok]
+    # Sort by size, then by the lengths along each dimension
+    return a[np.lexsort([a[:, i] for i in range(ndim - 1, -1, -1)] + [s])]
+
+
+def vkfft_code_path(n, dtype=np.complex64, r2c=False, shared_memory=49152):
+    """
+    Classify a transform length according to the VkFFT code path it is expected
+    to use. This is an approximation (the actual choices in VkFFT depend on the
+    GPU and the other transform parameters), which is used to select a small
+    number of test sizes while exercising all the code paths.
+
+    :param n: the length of the transform along one axis
+    :param dtype: the array dtype, which determines how many values fit in
+        the shared memory
+    :param r2c: if True, this is the fast axis of an R2C transform, which
+        is computed as a C2C transform of half the size when n is even
+    :param shared_memory: the amount of shared memory (bytes) available
+    :return: a tuple (algorithm, nb_upload, radix, kernel) with algorithm either
+        'radix' or 'bluestein', nb_upload the number of uploads (1 for a
+        single-upload transform, 2 or 3 for the four-step algorithm), radix the
+        largest prime factor class (2, 7 for 3-7, 13 for 11-13, 0 for Bluestein),
+        and kernel either 'register' for small transforms computed in registers,
+        or 'shared' when using the shared memory.
+    """
+    if r2c and n % 2 == 0:
+        n //= 2
+    p = max(primes(n))
+    if p > 13:
+        algorithm, radix = 'bluestein', 0
+        # Bluestein's algorithm uses a radix transform of size >= 2n-1
+        n = 2 ** int(np.ceil(np.log2(2 * n - 1)))
+    else:
+        algorithm, radix = 'radix', 2 if p <= 2 else 7 if p <= 7 else 13
+    # Number of complex values which can be stored in the shared memory
+    nmax = shared_memory // (2 * _get_precision(dtype))
+    nb_upload = 1
+    while n > nmax ** nb_upload:
+        nb_upload += 1
+    return algorithm, nb_upload, radix, 'register' if n <= 32 else 'shared'
+
+
+def select_code_path_shapes(vshape, nb=3, dtype=np.complex64, r2c=False, shared_memory=49152):
+    """
+    Select a subset of array shapes so that all the VkFFT code paths are
+    tested, with fewer transforms. The shapes are grouped by code path
+    (see vkfft_code_path, for each axis), and for each group the smallest
+    and largest shapes (i.e. the boundaries between code paths) are kept,
+    with other shapes evenly distributed in between.
+
+    :param vshape: the list of shapes, e.g. from radix_gen_n
+    :param nb: the number of shapes kept for each code path. Must be >=2
+        to keep the boundaries.
+    :param dtype: the array dtype
+    :param r2c: True for R2C transforms
+    :param shared_memory: the amount of shared memory (bytes) available
+    :return: the list of selected shapes, in the same order as vshape
+    """
+    groups = {}
+    for i in range(len(vshape)):
+        s = vshape[i]
+        k = tuple(vkfft_code_path(n, dtype, r2c and j == len(s) - 1, shared_memory) for j, n in enumerate(s))
+        groups.setdefault(k, []).append(i)
+    vidx = []
+    for v in groups.values():
+        v.sort(key=lambda i: np.prod(vshape[i], dtype=np.float64))
+        if len(v) <= nb:
+            vidx += v
+        else:
+            vidx += [v[i] for i in np.unique(np.round(np.linspace(0, len(v) - 1, nb)).astype(int))]
+    return [vshape[i] for i in sorted(vidx)]
+
+
+# Approximate relative cost per element of a radix-p pass, used by the fft_cost() model
+_radix_cost = {2: 1., 3: 1.8, 5: 2.6, 7: 3.3, 11: 4.5, 13: 5.}
+
+# Default coefficients of the fft_cost() model, see _cost_features(). These give
+# a relative cost, and can be calibrated to a given GPU using fit_cost_model()
+default_cost_coeffs = {"launch": 0., "mem": 1., "flop": 0.02, "bluestein": 1.}
+
+
+def _cost_features(shape, ndim=None, dtype=np.complex64, r2c=False, shared_memory=49152):
+    """
+    Compute the features of the fft_cost() model, summed over the transform axes:
+    'launch' (the number of kernels), 'mem' (the number of complex values read and
+    written by all kernels), 'flop' (the number of values times the relative cost of
+    each radix pass, using Bluestein's padded length if necessary), and 'bluestein'
+    (the number of values transformed using Bluestein's algorithm).
+
+    :return: a numpy array with the 4 features, in the order of default_cost_coeffs
+    """
+    shape = [int(n) for n in shape]
+    if ndim is None:
+        ndim = len(shape)
+    # Number of complex values
+    size = np.prod(shape, dtype=np.float64) / (2 if r2c else 1)
+    f = np.zeros(4)
+    for i in range(len(shape) - ndim, len(shape)):
+        n, nb = shape[i], size
+        if r2c and i == len(shape) - 1:
+            if n % 2 == 0:
+                n //= 2
+            else:
+                # Odd R2C lengths are computed as a full C2C transform
+                nb = 2 * size
+        algorithm, nb_upload, radix, kernel = vkfft_code_path(n, dtype, shared_memory=shared_memory)
+        if algorithm == 'bluestein':
+            m = 2 ** int(np.ceil(np.log2(2 * n - 1)))
+            # Forward and backward transforms of the padded length
+            flop = 2 * m / n * sum(_radix_cost[p] for p in primes(m)[1:])
+            f += [nb_upload, nb * nb_upload, nb * flop, nb]
+        else:
+            flop = sum(_radix_cost[p] for p in primes(n)[1:])
+            f += [nb_upload, nb * nb_upload, nb * flop, 0]
+    return f
+
+
+def fft_cost(shape, ndim=None, dtype=np.complex64, r2c=False, shared_memory=49152, coeffs=None):
+    """
+    Estimate the cost of a transform, using a simple model taking into account the
+    number of kernels and of read & write passes through the array (see vkfft_code_path),
+    the radix of each pass, and the extra cost of Bluestein's algorithm for lengths with
+    prime factors larger than 13.
+
+    :param shape: the shape of the array. For R2C transforms, this is the real array shape.
+    :param ndim: the number of transform dimensions, along the last axes. If None,
+        the transform is made along all axes.
+    :param dtype: the array dtype
+    :param r2c: if True, estimate the cost of an R2C transform
+    :param shared_memory: the amount of shared memory (bytes) available
+    :param coeffs: a dictionary with the model coefficients, e.g. from fit_cost_model().
+        If None, default_cost_coeffs is used.
+    :return: the estimated cost. This is a relative value unless calibrated coefficients
+        are given, in which case this is an estimated time in seconds.
+    """
+    if coeffs is None:
+        coeffs = default_cost_coeffs
+    c = np.array([coeffs[k] for k in default_cost_coeffs], dtype=np.float64)
+    return float(_cost_features(shape, ndim, dtype, r2c, shared_memory) @ c)
+
+
+def fit_cost_model(vshape, vdt, ndim=None, dtype=np.complex64, r2c=False, shared_memory=49152):
+    """
+    Calibrate the fft_cost() model coefficients using measured transform times,
+    e.g. from pyvkfft.benchmark.calibrate_cost_model().
+
+    :param vshape: the list of array shapes
+    :param vdt: the list of corresponding measured times, in seconds
+    :param ndim: the number of transform dimensions, along the last axes
+    :param dtype: the array dtype
+    :param r2c: True for R2C transforms
+    :param shared_memory: the amount of shared memory (bytes) available
+    :return: a dictionary with the model coefficients, which can be used as
+        coeffs for fft_cost(), next_fast_len() and next_fast_shape()
+    """
+    a = np.array([_cost_features(sh, ndim, dtype, r2c, shared_memory) for sh in vshape])
+    c = np.linalg.lstsq(a, np.array(vdt, dtype=np.float64), rcond=None)[0]
+    return {k: float(max(v, 0)) for k, v in zip(default_cost_coeffs, c)}
+
+
+def _fast_len_candidates(n, r2c=False):
+    """Candidate lengths >=n for padding: n and the 13-smooth lengths up to the next power of 2"""
+    v = radix_gen(2 ** int(np.ceil(np.log2(n))), (2, 3, 5, 7, 11, 13), even=r2c, nmin=n).tolist()
+    return sorted(set(v + [n]))
+
+
+def next_fast_len(n, ndim=1, dtype=np.complex64, r2c=False, shared_memory=49152, coeffs=None):
+    """
+    Find the length m>=n for which a transform is expected to be the fastest, e.g.
+    to choose the padding of an array. Unlike the smallest length with only small
+    prime factors, this takes into account the extra cost of larger arrays, and the
+    relative speed of the different radix and of Bluestein's algorithm (see fft_cost).
+
+    :param n: the minimum length
+    :param ndim: the number of transform dimensions: the cost is evaluated for
+        an array with a length m along all ndim axes.
+    :param dtype: the array dtype
+    :param r2c: if True, optimise for R2C transforms
+    :param shared_memory: the amount of shared memory (bytes) available
+    :param coeffs: the cost model coefficients, e.g. calibrated with fit_cost_model().
+        If None, default_cost_coeffs is used.
+    :return: the optimal length
+    """
+    n = int(n)
+    if n <= 2:
+        return n
+    vm = _fast_len_candidates(n, r2c)
+    vc = [fft_cost((m,) * ndim, ndim, dtype, r2c, shared_memory, coeffs) for m in vm]
+    return vm[int(np.argmin(vc))]
+
+
+def next_fast_shape(shape, ndim=None, dtype=np.complex64, r2c=False, shared_memory=49152, coeffs=None):
+    """
+    Find the array shape, larger or equal to shape along each transform axis, for
+    which a transform is expected to be the fastest, e.g. to choose the padding of
+    an array. This is the multi-dimensional version of next_fast_len(): each axis
+    is optimised in turn, taking into account the lengths of the other axes.
+
+    :param shape: the minimum array shape
+    :param ndim: the number of transform dimensions, along the last axes. If None,
+        the transform is made along all axes. Other (batch) axes are not modified.
+    :param dtype: the array dtype
+    :param r2c: if True, optimise for R2C transforms (the last axis being the R2C one)
+    :param shared_memory: the amount of shared memory (bytes) available
+    :param coeffs: the cost model coefficients, e.g. calibrated with fit_cost_model().
+        If None, default_cost_coeffs is used.
+    :return: the optimal shape, as a tuple
+    """
+    shape = [int(n) for n in shape]
+    if ndim is None:
+        ndim = len(shape)
+    vaxis = list(range(len(shape) - ndim, len(shape)))
+    vcand = {i: _fast_len_candidates(shape[i], r2c and i == len(shape) - 1) if shape[i] > 2 else [shape[i]]
+             for i in vaxis}
+    best = list(shape)
+    for it in range(3):
+        prev = list(best)
+        for i in vaxis:
+            vc = []
+            for m in vcand[i]:
+                best[i] = m
+                vc.append(fft_cost(best, ndim, dtype, r2c, shared_memory, coeffs))
+            best[i] = vcand[i][int(np.argmin(vc))]
+        if best == prev:
+            break
+    return tuple(best)
 
 
 def calc_transform_axes(shape, axes=None, ndim=None):
@@ -359,7 +687,7 @@ def calc_transform_axes(shape, axes=None, ndim=None):
 
 
 def check_vkfft_result(res, shape=None, dtype=None, ndim=None, inplace=None,
-                       norm=None, r2c=None, dct=None, axes=None, backend=None):
+                       norm=None, r2c=None, dct=None, axes=None, backend=None, dst=None):
     """
     Check VkFFTResult code.
 
@@ -373,6 +701,7 @@ def check_vkfft_result(res, shape=None, dtype=None, ndim=None, inplace=None,
     :param dct: False, 1, 2, 3 or 4
     :param axes: transform axes
     :param backend: the backend
+    :param dst: False, 1, 2, 3 or 4
     :raises RuntimeError: if res != 0
     """
     if isinstance(res, ctypes.c_int):
@@ -383,6 +712,8 @@ def check_vkfft_result(res, shape=None, dtype=None, ndim=None, inplace=None,
             s += "R2C "
         elif dct:
             s += "DCT%d " % dct
+        elif dst:
+            s += "DST%d " % dst
         else:
             s += "C2C "
         if r2c and inplace and shape is not None:
@@ -414,6 +745,21 @@ def check_vkfft_result(res, shape=None, dtype=None, ndim=None, inplace=None,
             raise RuntimeError("VkFFT error %d (unknown) %s" % (res, s))
 
 
+def _profiled(func):
+    """
+    Decorator for the fft() and ifft() methods of the VkFFTApp backends, recording
+    the profiling information of the launched kernels if profiling is enabled.
+    """
+
+    @functools.wraps(func)
+    def wrapper(self, src, dest=None):
+        if self.profiling:
+            return self._profile_transform(func, src, dest)
+        return func(self, src, dest)
+
+    return wrapper
+
+
 class VkFFTApp:
     """
     VkFFT application interface implementing a FFT plan, base implementation
@@ -421,7 +767,8 @@ class VkFFTApp:
     """
 
     def __init__(self, shape, dtype: type, ndim=None, inplace=True, norm=1,
-                 r2c=False, dct=False, axes=None, **kwargs):
+                 r2c=False, dct=False, axes=None, compute_dtype=None, dst=False, preserve_input=False,
+                 **kwargs):
         """
         Init function for the VkFFT application.
 
@@ -453,27 +800,54 @@ class VkFFTApp:
             For an out-of-place transform, if the input (real) shape is (..., nx),
             the output (complex) shape should be (..., nx//2+1).
             Note that for C2R transforms with ndim>=2, the source (complex) array
-            is modified.
+            is modified, unless preserve_input=True.
         :param dct: used to perform a Direct Cosine Transform (DCT) aka a R2R transform.
             An integer can be given to specify the type of DCT (1, 2, 3 or 4).
             if dct=True, the DCT type 2 will be performed, following scipy's convention.
         :param axes: a list or tuple of axes along which the transform should be made.
             if None, the transform is done along the ndim fastest axes, or all
             axes if ndim is None. Not allowed for R2C transforms
+        :param compute_dtype: the dtype used for the calculations, if it should be
+            different from the storage one (dtype). If None, the same precision
+            is used for storage and calculations. The following combinations are
+            supported: complex32 storage with complex64 calculations
+            (half precision memory only, out-of-place C2C transforms only), and
+            complex64 (or float32) storage with complex128 (or float64) calculations,
+            which gives an accuracy close to double precision without doubling
+            the memory used by the arrays.
+        :param dst: used to perform a Direct Sine Transform (DST) aka a R2R transform.
+            An integer can be given to specify the type of DST (1, 2, 3 or 4).
+            if dst=True, the DST type 2 will be performed, following scipy's convention.
+            This requires a VkFFT version >= 1.3.0.
+        :param preserve_input: if True, for an out-of-place transform the calculations are
+            made in an internal buffer allocated with the VkFFT application, so that the source
+            array is never modified. This is useful for C2R transforms with ndim>=2 (or large
+            or non-radix 1D C2R transforms), where VkFFT would otherwise use the source array
+            as work buffer. This avoids copying the source array before the transform, but uses
+            an internal buffer with the size of the complex array.
+        :param kwargs: VkFFT parameters (disableReorderFourStep, registerBoost, useLUT,
+            coalescedMemory, aimThreads, numSharedBanks) can be given to override the
+            VkFFT defaults. Otherwise, the parameters found by pyvkfft.tune for the
+            same transform and GPU are used if available, unless use_tuning=False.
         :raises RuntimeError:  if the transform dimensions are not allowed by VkFFT.
         """
         self.app = None
         self.config = None
         if dct and r2c:
             raise RuntimeError("R2C and DCT cannot both be selected !")
-        if (r2c or dct) and dtype not in [np.float16, np.float32, np.float64]:
-            raise RuntimeError("R2C or DCT selected but input type is not real !")
+        if dst and (r2c or dct):
+            raise RuntimeError("DST cannot be selected with R2C or DCT !")
+        if (r2c or dct or dst) and dtype not in [np.float16, np.float32, np.float64]:
+            raise RuntimeError("R2C, DCT or DST selected but input type is not real !")
         if r2c and axes is not None:
             raise RuntimeError("axes=... is not allowed for R2C transforms")
         # Get the final shape passed to VkFFT, collapsing non-transform axes
         # as necessary. The calculated shape has 4 dimensions (nx, ny, nz, n_batch)
         self.shape, self.skip_axis, self.ndim = calc_transform_axes(shape, axes, ndim)
         self.inplace = inplace
+        if preserve_input and inplace:
+            raise RuntimeError("preserve_input=True requires an out-of-place transform")
+        self.preserve_input = preserve_input
         self.r2c = r2c
         if dct is False:
             self.dct = 0
@@ -483,6 +857,14 @@ class VkFFTApp:
             self.dct = dct
         if dct and self.dct < 1 or dct > 4:
             raise RuntimeError("Only DCT of types 1, 2, 3 and 4 are allowed")
+        if dst is False:
+            self.dst = 0
+        elif dst is True:
+            self.dst = 2
+        else:
+            self.dst = dst
+        if dst and self.dst < 1 or dst > 4:
+            raise RuntimeError("Only DST of types 1, 2, 3 and 4 are allowed")
         # print("VkFFTApp:", shape, axes, ndim, "->", self.shape, self.skip_axis, self.ndim)
 
         # Experimental parameters. Not much difference is seen, so don't document this,
@@ -515,17 +897,50 @@ class VkFFTApp:
         else:
             self.keepShaderCode = -1
 
+        # Other VkFFT parameters, mostly useful for auto-tuning, see pyvkfft.tune
+        for k in ("coalescedMemory", "aimThreads", "numSharedBanks"):
+            setattr(self, k, kwargs[k] if k in kwargs else -1)
+        # Parameters taken from the tuning database, see _apply_tuning()
+        self.tuned_params = {}
+        # Breakdown of the plan creation time, see get_plan_timings()
+        self.plan_timings = None
+
         if norm == "backward":
             norm = 1
         self.norm = norm
 
+        # Profiling of the kernels launched by fft() and ifft(), see enable_profiling()
+        self.profiling = False
+        self.profile = []
+
         # Precision: number of bytes per float
-        if dtype in [np.float16, complex32]:
-            self.precision = 2
-        elif dtype in [np.float32, np.complex64]:
-            self.precision = 4
-        elif dtype in [np.float64, np.complex128]:
-            self.precision = 8
+        self.precision = _get_precision(dtype)
+
+        # Precision used for the calculations, which can be higher than the storage one
+        if compute_dtype is None:
+            self.compute_precision = self.precision
+        else:
+            self.compute_precision = _get_precision(compute_dtype)
+        # Half precision storage with single precision calculations
+        self.half_memory_only = (self.precision, self.compute_precision) == (2, 4)
+        # Single precision storage with double precision calculations
+        self.double_compute_float_memory = (self.precision, self.compute_precision) == (4, 8)
+        if self.compute_precision != self.precision:
+            if self.double_compute_float_memory:
+                # VkFFT doublePrecisionFloatMemory: available for all transforms
+                pass
+            elif self.half_memory_only:
+                # VkFFT halfPrecisionMemoryOnly: the calculations are made in a
+                # separate single precision buffer
+                if inplace:
+                    raise RuntimeError("Half precision storage with single precision calculations "
+                                       "requires an out-of-place transform")
+                if r2c or dct or dst:
+                    raise RuntimeError("Half precision storage with single precision calculations "
+                                       "is only available for C2C transforms")
+            else:
+                raise RuntimeError("Unsupported combination of storage (%s) and calculation (%s) dtypes" %
+                                   (str(np.dtype(dtype)), str(np.dtype(compute_dtype))))
 
     def _get_fft_scale(self, norm):
         """Return the scale factor by which an array must be multiplied to keep its L2 norm
@@ -536,7 +951,7 @@ class VkFFTApp:
         dtype = np.float32
         if self.precision == 8:
             dtype = np.float64
-        elif self.precision == 2:
+        elif self.precision == 2 and self.compute_precision == 2:
             dtype = np.float16
         s = 1
         ndim_real = 0
@@ -547,10 +962,12 @@ class VkFFTApp:
         s = np.sqrt(s)
         if self.r2c and self.inplace:
             s *= np.sqrt((self.shape[0] - 2) / self.shape[0])
-        if self.dct:
+        # DCT and DST use the same scale factors
+        r2r = self.dct or self.dst
+        if r2r:
             s *= 2 ** (0.5 * ndim_real)
-            if self.dct != 4:
-                warnings.warn("A DCT type 2 or 3 cannot be strictly normalised, using approximation,"
+            if r2r != 4:
+                warnings.warn("A DCT/DST type 2 or 3 cannot be strictly normalised, using approximation,"
                               " see https://en.wikipedia.org/wiki/Discrete_cosine_transform#DCT-II")
         if norm == 0 or norm == 1:
             return dtype(1 / s)
@@ -573,30 +990,32 @@ class VkFFTApp:
         dtype = np.float32
         if self.precision == 8:
             dtype = np.float64
-        elif self.precision == 2:
+        elif self.precision == 2 and self.compute_precision == 2:
             dtype = np.float16
+        # DCT and DST use the same scale factors
+        r2r = self.dct or self.dst
         s = 1
         s_dct = 1
         for i in range(self.ndim):
             if not self.skip_axis[i]:
                 s *= self.shape[i]
-                if self.dct:
+                if r2r:
                     s_dct *= np.sqrt(2)
         s = np.sqrt(s)
         if self.r2c and self.inplace:
             s *= np.sqrt((self.shape[0] - 2) / self.shape[0])
-        if self.dct and self.dct != 4:
-            warnings.warn("A DCT type 2 or 3 cannot be strictly normalised, using approximation,"
+        if r2r and r2r != 4:
+            warnings.warn("A DCT/DST type 2 or 3 cannot be strictly normalised, using approximation,"
                           " see https://en.wikipedia.org/wiki/Discrete_cosine_transform#DCT-II")
         if norm == 0:
             return dtype(1 / (s * s_dct))
         elif norm == 1:
             # Not sure why the difference in scale factors
-            if self.dct == 2:
+            if r2r == 2:
                 s_dct = s_dct ** 1
-            elif self.dct == 3:
+            elif r2r == 3:
                 s_dct = s_dct ** 2
-            elif self.dct == 4:
+            elif r2r == 4:
                 s_dct = s_dct ** 3
             return dtype(s * s_dct)
         elif norm == "ortho":
@@ -608,3 +1027,117 @@ class VkFFTApp:
         after a backward FT
         """
         return self._get_ifft_scale(self.norm)
+
+    def enable_profiling(self, enable=True):
+        """
+        Enable (or disable) the profiling of the GPU kernels launched by fft() and ifft().
+        When enabled, each transform waits for its kernels to finish and records, for each
+        kernel, the GPU start and end times, the grid and block (work-group) sizes, and
+        the estimated number of bytes read and written. See get_profile().
+        The extra kernel used to scale the array for norm='ortho' is not included.
+
+        :param enable: True to enable the profiling, False to disable it
+        """
+        self.profiling = enable
+
+    def get_profile(self, clear=False):
+        """
+        Get the profiling information recorded for the transforms made since
+        profiling was enabled, see enable_profiling().
+
+        :param clear: if True, the recorded information is cleared
+        :return: a list with one dictionary for each transform, with 'transform'
+            ('fft' or 'ifft'), 't0' (the host time.perf_counter() value when the
+            transform was launched) and 'kernels', a list of dictionaries with
+            'grid' and 'block' (the number of blocks or work-groups and their size
+            along x, y and z), 'start' and 'end' (the GPU times in seconds, relative
+            to the start of the first kernel of the transform), 'dt' (the duration
+            of the kernel) and 'nbytes' (the estimated number of bytes read and
+            written by the kernel, assuming it reads and writes the array once).
+        """
+        p = self.profile
+        if clear:
+            self.profile = []
+        return p
+
+    def _set_profiling(self, enable):
+        """Enable or disable profiling in the backend library - implemented by the backend"""
+        raise NotImplementedError()
+
+    def _get_dispatch_profile(self, i):
+        """Get (grid, block, (start, end)) for the i-th kernel launched by the last transform,
+        implemented by the backend"""
+        raise NotImplementedError()
+
+    def get_plan_timings(self):
+        """
+        Get the breakdown of the time spent creating this VkFFTApp (the plan).
+        This can be used to know whether caching the generated code or the
+        compiled kernels would help to reduce the plan creation time.
+
+        :return: a dictionary with the times (in seconds) spent in: 'config' (creation
+            of the VkFFT configuration, including the allocation of the internal buffer
+            used e.g. with preserve_input=True), 'codegen' (generation of the kernels code
+            by VkFFT), 'compile' (runtime compilation of the kernels with NVRTC or the
+            OpenCL compiler), 'alloc' (allocation and initialisation of the VkFFT buffers,
+            e.g. for the LUT or Bluestein's algorithm), and 'total' (the whole VkFFTApp
+            creation, including the python overhead), as well as 'nb_compile', the number
+            of programs compiled.
+        """
+        return self.plan_timings
+
+    def _set_plan_timings(self, t0, t_config, get_init_profile):
+        """
+        Record the breakdown of the plan creation time, see get_plan_timings().
+
+        :param t0: the timeit.default_timer() value at the beginning of the VkFFTApp creation
+        :param t_config: the time spent creating the VkFFT configuration
+        :param get_init_profile: the get_init_profile function of the backend library
+        """
+        t = (ctypes.c_double * 4)()
+        nb = get_init_profile(t)
+        self.plan_timings = {"config": t_config, "codegen": t[1], "compile": t[2], "alloc": t[3],
+                             "total": timeit.default_timer() - t0, "nb_compile": nb}
+
+    def _get_gpu_name(self):
+        """Get the name of the GPU used by this VkFFTApp - implemented by the backend"""
+        raise NotImplementedError()
+
+    def _apply_tuning(self, backend, kwargs, version):
+        """
+        Use the VkFFT parameters stored in the tuning database for this transform
+        and GPU (see pyvkfft.tune), if any. Parameters given explicitly as keyword
+        arguments take precedence. This must be called by the backend before
+        creating the VkFFT configuration.
+
+        :param backend: the backend library, 'cuda' or 'opencl'
+        :param kwargs: the keyword arguments given to the VkFFTApp. If use_tuning=False
+            is among them, the tuning database is not used.
+        :param version: the VkFFT version used by the backend library
+        """
+        if not kwargs.get("use_tuning", True):
+            return
+        from .tune import has_tuning_db, get_tuned_params, tuning_key
+        if not has_tuning_db():
+            return
+        for k, v in get_tuned_params(backend, self._get_gpu_name(), tuning_key(self), version=version).items():
+            if k not in kwargs:
+                setattr(self, "use_lut" if k == "useLUT" else k, v)
+                self.tuned_params[k] = v
+
+    def _profile_transform(self, func, src, dest):
+        """Perform a transform and record its profiling information"""
+        self._set_profiling(True)
+        t0 = time.perf_counter()
+        try:
+            res = func(self, src, dest)
+        finally:
+            self._set_profiling(False)
+        nbytes = 2 * max(src.nbytes, src.nbytes if dest is None else dest.nbytes)
+        vk = []
+        for i in range(self.get_nb_dispatch() - int(self.norm == "ortho")):
+            grid, block, (start, end) = self._get_dispatch_profile(i)
+            vk.append({"grid": grid, "block": block, "start": start, "end": end, "dt": end - start,
+                       "nbytes": nbytes})
+        self.profile.append({"transform": func.__name__, "t0": t0, "kernels": vk})
+        return res
@@ -0,0 +1,487 @@
+# -*- coding: utf-8 -*-
+
+# PyVkFFT
+#   (c) 2022- : ESRF-European Synchrotron Radiation Facility
+#       authors:
+#         Vincent Favre-Nicolin, favre@esrf.fr
+#
+#
+# Functions for benchmarks.
+
+import csv
+import json
+import platform
+import socket
+import time
+import timeit
+
+import numpy as np
+
+from pyvkfft.base import complex32, primes, select_code_path_shapes, fit_cost_model
+from pyvkfft.version import __version__, vkfft_version
+from pyvkfft.accuracy import init_ctx, gpu_ctx_dic, get_gpu_name, make_random_array, complex_to_half, gpu_timings, \
+    GPUTimer, has_opencl, has_pycuda, has_cupy
+
+if has_opencl:
+    import pyopencl as cl
+    import pyopencl.array as cla
+    from pyvkfft.opencl import VkFFTApp as clVkFFTApp
+
+if has_pycuda or has_cupy:
+    from pyvkfft.cuda import VkFFTApp as cuVkFFTApp
+
+    if has_pycuda:
+        import pycuda.driver as cu_drv
+        import pycuda.gpuarray as cua
+
+    if has_cupy:
+        import cupy as cp
+
+# Percentiles reported for each timing, in addition to the median
+default_percentiles = (10, 90)
+
+
+def transform_name(r2c=False, dct=False, dst=False):
+    """Name of the transform, e.g. 'C2C', 'R2C', 'DCT2' or 'DST3'"""
+    if r2c:
+        return "R2C"
+    elif dct:
+        return "DCT%d" % dct
+    elif dst:
+        return "DST%d" % dst
+    return "C2C"
+
+
+def timing_stats(vdt, percentiles=default_percentiles):
+    """
+    Summarise a list of timings.
+
+    :param vdt: the list of measured times (in seconds)
+    :param percentiles: the percentiles to compute, in addition to the median
+    :return: a dictionary with the median, the min and the percentiles
+        (e.g. 'p10' and 'p90'), in seconds
+    """
+    vdt = np.array(vdt, dtype=np.float64)
+    r = {"median": float(np.median(vdt)), "min": float(vdt.min())}
+    for p in percentiles:
+        r["p%g" % p] = float(np.percentile(vdt, p))
+    return r
+
+
+def batch_shapes(ndim, nmin=32, nmax=2048, radix_max=13, batch_mb=256, dtype=np.complex64, r2c=False):
+    """
+    Generate the shapes for a benchmark of batched 1D, 2D or 3D transforms, with
+    a batch size adapted so that each array has approximately the same size.
+
+    :param ndim: the number of transform dimensions (1, 2 or 3)
+    :param nmin: the minimum transform length along each axis (included)
+    :param nmax: the maximum transform length along each axis (included)
+    :param radix_max: the largest allowed prime factor for the transform lengths.
+        Use a value >= nmax to include non-radix (Bluestein) transforms.
+    :param batch_mb: the approximate size of each array in Mbytes
+    :param dtype: the array dtype
+    :param r2c: if True, only even lengths are generated
+    :return: a list of shapes, with the batch as the first dimension
+    """
+    itemsize = np.dtype(complex32 if dtype == complex32 else dtype).itemsize
+    vsh = []
+    for n in range(nmin, nmax + 1):
+        if (r2c and n % 2) or max(primes(n)) > radix_max:
+            continue
+        nb = int(round(batch_mb * 1024 ** 2 / (n ** ndim * itemsize)))
+        nb = min(max(nb, 1), 99999)
+        vsh.append((nb,) + (n,) * ndim)
+    return vsh
+
+
+def copy_bandwidth(backend, nbytes=256 * 1024 ** 2, nb_repeat=20, gpu_name=None, opencl_platform=None):
+    """
+    Measure the achievable memory bandwidth of the GPU, using a device-to-device
+    copy on the same backend as the transforms. This is used as the peak
+    bandwidth to compute the efficiency of the transforms, which are memory-bound.
+
+    :param backend: either 'pyopencl', 'pycuda' or 'cupy'
+    :param nbytes: the size of the copied array, in bytes
+    :param nb_repeat: the number of timed copies
+    :param gpu_name: the (sub)string used to select the GPU
+    :param opencl_platform: the (sub)string used to select the OpenCL platform
+    :return: a dictionary with 'gbps' (the bandwidth in Gbytes/s, counting both
+        the read and the write, using the median time), 'dt' (the timing
+        statistics, see timing_stats) and 'nbytes'
+    """
+    init_ctx(backend, gpu_name=gpu_name, opencl_platform=opencl_platform)
+    n = nbytes // 4
+    nbytes = n * 4
+    if backend == "pyopencl":
+        queue = cl.CommandQueue(gpu_ctx_dic["pyopencl"][1], properties=cl.command_queue_properties.PROFILING_ENABLE)
+        src, dest = cla.zeros(queue, n, dtype=np.float32), cla.empty(queue, n, dtype=np.float32)
+
+        def copy():
+            cl.enqueue_copy(queue, dest.data, src.data, byte_count=nbytes)
+    elif backend == "pycuda":
+        queue = None
+        src, dest = cua.zeros(n, dtype=np.float32), cua.empty(n, dtype=np.float32)
+
+        def copy():
+            cu_drv.memcpy_dtod_async(dest.gpudata, src.gpudata, nbytes)
+    else:
+        queue = None
+        src, dest = cp.zeros(n, dtype=np.float32), cp.empty(n, dtype=np.float32)
+
+        def copy():
+            dest.data.copy_from_device_async(src.data, nbytes)
+    timer = GPUTimer(backend, queue=queue)
+    vdt = []
+    for i in range(nb_repeat + 1):
+        timer.start()
+        copy()
+        dt = timer.stop()
+        if i:
+            vdt.append(dt)
+    dt = timing_stats(vdt)
+    return {"gbps": 2 * nbytes / dt["median"] / 1024 ** 3, "dt": dt, "nbytes": nbytes}
+
+
+def benchmark(backend, shape, ndim=None, axes=None, dtype=np.complex64, inplace=False, norm=1, r2c=False,
+              dct=False, dst=False, use_lut=None, compute_dtype=None, nb_repeat=20, nb_plan=3,
+              percentiles=default_percentiles, gpu_name=None, opencl_platform=None, profile=False, peak_gbps=None,
+              verbose=False):
+    """
+    Benchmark a transform, measuring separately the different phases: creation
+    of the VkFFTApp (plan), transfer of the array between host and GPU, host time
+    to launch the transform (the python call, which is asynchronous), and the GPU time
+    of the forward and backward transforms (measured with cuda events or OpenCL
+    profiling, see pyvkfft.accuracy.gpu_timings).
+
+    :param backend: either 'pyopencl', 'pycuda' or 'cupy'
+    :param shape: the shape of the array. For an inplace r2c transform, two extra
+        values are appended along x, so the actual transform shape is the one supplied.
+    :param ndim: the number of transform dimensions. Can be None if axes is given
+    :param axes: the transform axes. Supersedes ndim
+    :param dtype: the array dtype: np.complex64 or np.complex128 (C2C), np.float32 or
+        np.float64 (R2C, DCT and DST), or pyvkfft.base.complex32.
+    :param inplace: if True, perform an inplace transform
+    :param norm: either 0, 1 or "ortho"
+    :param r2c: if True, benchmark a real-to-complex transform
+    :param dct: 1, 2, 3 or 4 to benchmark a DCT
+    :param dst: 1, 2, 3 or 4 to benchmark a DST
+    :param use_lut: if True or False, will trigger useLUT=1 or 0 for VkFFT.
+        If None, the default VkFFT behaviour is used.
+    :param compute_dtype: the dtype used for the calculations, if different from dtype
+    :param nb_repeat: the number of timed repeats for the transforms and transfers
+    :param nb_plan: the number of timed VkFFTApp creations
+    :param percentiles: the percentiles reported for each timing, in addition to the median
+    :param gpu_name: the (sub)string used to select the GPU
+    :param opencl_platform: the (sub)string used to select the OpenCL platform,
+        e.g. 'portable' to use PoCL on a CPU.
+    :param profile: if True, an extra forward and backward transform are made with
+        the profiling of each VkFFT kernel enabled (see VkFFTApp.enable_profiling),
+        and the result of VkFFTApp.get_profile() is returned as 'profile'
+    :param peak_gbps: the peak memory bandwidth of the GPU in Gbytes/s, e.g. measured
+        with copy_bandwidth(). If given, the efficiency of the transforms is computed.
+    :param verbose: if True, print a 1-line summary of the results
+    :return: a dictionary with the input parameters, the 'gpu_name', and the timing
+        statistics (see timing_stats) for each phase: 'plan', 'upload', 'download',
+        'launch', 'fft' and 'ifft'. 'plan_phases' gives the breakdown of the plan creation
+        (median values), see VkFFTApp.get_plan_timings(). 'nb_dispatch_fft' and 'nb_dispatch_ifft' are the number
+        of kernels launched by VkFFT for each transform, and 'gbps' and 'gbps_ifft' the
+        corresponding achieved memory bandwidth (using the median GPU time), assuming each
+        kernel reads and writes the array once. 'gbps_ideal' is the idealised throughput of
+        the forward transform, assuming one read and one write of the array per transform axis.
+        If peak_gbps is given, 'efficiency' and 'efficiency_ifft' are the fractions of the
+        peak bandwidth achieved by the forward and backward transforms (i.e. gbps / peak_gbps).
+    """
+    init_ctx(backend, gpu_name=gpu_name, opencl_platform=opencl_platform)
+    if backend == "cupy":
+        mempool = cp.get_default_memory_pool()
+        if mempool is not None:
+            mempool.free_all_blocks()
+    half = dtype == complex32
+    if dtype in (np.complex64, np.float32) or half:
+        dtypec, dtypef = np.complex64, np.float32
+    else:
+        dtypec, dtypef = np.complex128, np.float64
+    shape0 = tuple(shape)
+    shape = list(shape0)
+    shapec = list(shape0)
+    if r2c:
+        shapec[-1] = shapec[-1] // 2 + 1
+        if inplace:
+            shape[-1] += 2
+    shape, shapec = tuple(shape), tuple(shapec)
+    d0 = make_random_array(shape, dtypef if r2c or dct or dst else dtypec, seed=0)
+    if half:
+        d0 = complex_to_half(d0)
+
+    queue = None
+    if backend == "pyopencl":
+        # A dedicated queue is needed to get the profiling information
+        queue = cl.CommandQueue(gpu_ctx_dic["pyopencl"][1], properties=cl.command_queue_properties.PROFILING_ENABLE)
+
+        def to_gpu(a):
+            return cla.to_device(queue, a)
+
+        def empty(sh, dt):
+            return cla.empty(queue, sh, dtype=dt)
+
+        def sync():
+            queue.finish()
+    elif backend == "pycuda":
+        to_gpu, empty, sync = cua.to_gpu, cua.empty, cu_drv.Context.synchronize
+    else:
+        to_gpu, empty, sync = cp.array, cp.empty, cp.cuda.runtime.deviceSynchronize
+
+    # Plan creation
+    vdt_plan, vplan_phases = [], []
+    for i in range(nb_plan):
+        t0 = timeit.default_timer()
+        if backend == "pyopencl":
+            app = clVkFFTApp(shape, complex32 if half else d0.dtype, queue, ndim=ndim, norm=norm, axes=axes,
+                             useLUT=use_lut, inplace=inplace, r2c=r2c, dct=dct, dst=dst,
+                             compute_dtype=compute_dtype)
+        else:
+            app = cuVkFFTApp(shape, complex32 if half else d0.dtype, ndim=ndim, norm=norm, axes=axes,
+                             useLUT=use_lut, inplace=inplace, r2c=r2c, dct=dct, dst=dst,
+                             compute_dtype=compute_dtype)
+        vdt_plan.append(timeit.default_timer() - t0)
+        vplan_phases.append(app.get_plan_timings())
+        if i < nb_plan - 1:
+            del app
+
+    # Host <-> GPU transfers
+    vdt_up, vdt_down = [], []
+    for i in range(nb_repeat):
+        sync()
+        t0 = timeit.default_timer()
+        d_gpu = to_gpu(d0)
+        sync()
+        vdt_up.append(timeit.default_timer() - t0)
+        t0 = timeit.default_timer()
+        d_gpu.get()
+        vdt_down.append(timeit.default_timer() - t0)
+
+    if inplace:
+        d1_gpu, d2_gpu = d_gpu, d_gpu
+    else:
+        d1_gpu = empty(shapec, dtypec) if r2c else d_gpu.copy()
+        d2_gpu = d_gpu.copy()
+
+    # Transforms
+    def reset_fft():
+        if inplace:
+            # Avoid an overflow after repeated transforms with norm=0
+            d_gpu.set(d0)
+
+    def reset_ifft():
+        # Each inverse transform uses the result of a forward one
+        reset_fft()
+        app.fft(d_gpu, d1_gpu)
+
+    rfft = gpu_timings(app, d_gpu, None if inplace else d1_gpu, nb_repeat=nb_repeat, reset=reset_fft)
+    rifft = gpu_timings(app, d1_gpu, None if inplace else d2_gpu, inverse=True, nb_repeat=nb_repeat,
+                        reset=reset_ifft)
+    vprofile = None
+    if profile:
+        reset_fft()
+        app.enable_profiling()
+        app.fft(d_gpu, None if inplace else d1_gpu)
+        app.ifft(d1_gpu, None if inplace else d2_gpu)
+        vprofile = app.get_profile()
+    nbytes = d_gpu.nbytes
+    del d_gpu, d1_gpu, d2_gpu, app
+
+    if axes is None:
+        nb_axes = len(shape) if ndim is None else ndim
+    else:
+        nb_axes = len(axes)
+    res = {"backend": backend, "transform": transform_name(r2c, dct, dst), "shape": shape0, "ndim": ndim,
+           "axes": axes, "dtype": "complex32" if half else np.dtype(dtype).name, "inplace": inplace,
+           "norm": norm, "use_lut": use_lut, "compute_dtype": None if compute_dtype is None else
+           np.dtype(compute_dtype).name, "nb_repeat": nb_repeat, "gpu_name": get_gpu_name(backend, gpu_name),
+           "plan": timing_stats(vdt_plan, percentiles),
+           "plan_phases": {k: float(np.median([p[k] for p in vplan_phases])) for k in vplan_phases[0]},
+           "upload": timing_stats(vdt_up, percentiles),
+           "download": timing_stats(vdt_down, percentiles), "launch": timing_stats(rfft["dt_launch"], percentiles),
+           "fft": timing_stats(rfft["dt"], percentiles), "ifft": timing_stats(rifft["dt"], percentiles),
+           "nb_dispatch_fft": rfft["nb_dispatch"], "nb_dispatch_ifft": rifft["nb_dispatch"],
+           "gbps": rfft["gbps"], "gbps_ifft": rifft["gbps"]}
+    # Idealised throughput, as if each axis required exactly one read and one write
+    res["gbps_ideal"] = nbytes * nb_axes * 2 / res["fft"]["median"] / 1024 ** 3
+    if peak_gbps is not None:
+        res["peak_gbps"] = peak_gbps
+        res["efficiency"] = res["gbps"] / peak_gbps
+        res["efficiency_ifft"] = res["gbps_ifft"] / peak_gbps
+    if profile:
+        res["profile"] = vprofile
+    if verbose:
+        print(result_str(res))
+    return res
+
+
+def calibrate_cost_model(backend, ndim=1, nmin=16, nmax=4096, batch_mb=64, dtype=np.complex64, r2c=False,
+                         nb=4, nb_repeat=10, gpu_name=None, opencl_platform=None, verbose=False):
+    """
+    Calibrate the cost model used by pyvkfft.base.fft_cost(), next_fast_len() and
+    next_fast_shape() on a given GPU, by benchmarking a selection of lengths for
+    all the VkFFT code paths (see select_code_path_shapes), including Bluestein ones.
+
+    :param backend: either 'pyopencl', 'pycuda' or 'cupy'
+    :param ndim: the number of transform dimensions (1, 2 or 3)
+    :param nmin: the minimum transform length along each axis (included)
+    :param nmax: the maximum transform length along each axis (included)
+    :param batch_mb: the approximate size of each array in Mbytes
+    :param dtype: the array dtype
+    :param r2c: if True, calibrate R2C transforms
+    :param nb: the number of lengths benchmarked for each code path
+    :param nb_repeat: the number of timed transforms for each length
+    :param gpu_name: the (sub)string used to select the GPU
+    :param opencl_platform: the (sub)string used to select the OpenCL platform
+    :param verbose: if True, print the result of each benchmark
+    :return: the dictionary of model coefficients, to be used as coeffs=...
+        for fft_cost(), next_fast_len() and next_fast_shape()
+    """
+    vsh = batch_shapes(ndim, nmin, nmax, radix_max=nmax, batch_mb=batch_mb, dtype=dtype, r2c=r2c)
+    # Select the lengths, ignoring the batch dimension
+    vsel = set(select_code_path_shapes([sh[1:] for sh in vsh], nb=nb, dtype=dtype, r2c=r2c))
+    vsh = [sh for sh in vsh if sh[1:] in vsel]
+    vdt = []
+    for sh in vsh:
+        res = benchmark(backend, sh, ndim=ndim, dtype=dtype, r2c=r2c, nb_repeat=nb_repeat, nb_plan=1,
+                        gpu_name=gpu_name, opencl_platform=opencl_platform, verbose=verbose)
+        vdt.append(res["fft"]["median"])
+    return fit_cost_model(vsh, vdt, ndim=ndim, dtype=dtype, r2c=r2c)
+
+
+def result_str(res):
+    """One-line summary of a benchmark() result"""
+    s = "%8s %4s %20s %10s inplace=%d norm=%4s plan=%8.3fms launch=%8.3fms " \
+        "FFT=%9.4fms [%9.4f-%9.4f] iFFT=%9.4fms %8.2f Gbytes/s [%d kernels]" % \
+        (res["backend"], res["transform"], str(res["shape"]).replace(" ", ""), res["dtype"], int(res["inplace"]),
+         str(res["norm"]), res["plan"]["median"] * 1000, res["launch"]["median"] * 1000,
+         res["fft"]["median"] * 1000, min(v for k, v in res["fft"].items() if k[0] == 'p') * 1000,
+         max(v for k, v in res["fft"].items() if k[0] == 'p') * 1000, res["ifft"]["median"] * 1000,
+         res["gbps"], res["nb_dispatch_fft"])
+    if "efficiency" in res:
+        s += " %5.1f%% of peak" % (res["efficiency"] * 100)
+    return s
+
+
+def plan_summary(vres):
+    """
+    Aggregate the breakdown of the plan creation time over several benchmarks, to
+    find which phase dominates: code generation, compilation or buffer allocation.
+
+    :param vres: the list of results returned by benchmark()
+    :return: a dictionary with, for each phase ('config', 'codegen', 'compile', 'alloc'
+        and 'other' for the remaining python overhead), a dictionary with the total time
+        ('time', in seconds) and its fraction of the total plan creation time ('fraction'),
+        plus 'total' (the total plan creation time) and 'nb' (the number of benchmarks)
+    """
+    phases = ("config", "codegen", "compile", "alloc")
+    vp = [r["plan_phases"] for r in vres if r.get("plan_phases") is not None]
+    total = sum(p["total"] for p in vp)
+    res = {"total": total, "nb": len(vp)}
+    for k in phases:
+        res[k] = {"time": sum(p[k] for p in vp)}
+    res["other"] = {"time": total - sum(res[k]["time"] for k in phases)}
+    for k in phases + ("other",):
+        res[k]["fraction"] = res[k]["time"] / total if total > 0 else 0
+    return res
+
+
+def low_efficiency(vres, nb=10):
+    """
+    Find the benchmarks with the lowest efficiency relative to the peak bandwidth,
+    i.e. the transform sizes which are pathologically slow.
+
+    :param vres: the list of results returned by benchmark() with peak_gbps given
+    :param nb: the maximum number of results returned
+    :return: the list of results with the lowest efficiency, sorted by increasing efficiency
+    """
+    return sorted([r for r in vres if "efficiency" in r], key=lambda r: r["efficiency"])[:nb]
+
+
+def chrome_trace(profiles, filename=None):
+    """
+    Convert the profiling information of VkFFTApp transforms to the Chrome trace
+    event format, which can be displayed using chrome://tracing or https://ui.perfetto.dev
+
+    :param profiles: a dictionary with, for each name (e.g. a description of the
+        transform), the list returned by VkFFTApp.get_profile(). Each name is
+        displayed as a separate thread.
+    :param filename: if given, the trace is saved to this JSON file
+    :return: the trace, as a dictionary with the list of 'traceEvents'
+    """
+    vt0 = [p["t0"] for v in profiles.values() for p in v]
+    t00 = min(vt0) if len(vt0) else 0
+    events = []
+    for tid, (name, v) in enumerate(profiles.items()):
+        events.append({"name": "thread_name", "ph": "M", "pid": 0, "tid": tid, "args": {"name": name}})
+        for p in v:
+            # The kernels are placed according to the host time at which the transform was launched
+            t0 = p["t0"] - t00
+            for i, k in enumerate(p["kernels"]):
+                events.append({"name": "%s kernel #%d" % (p["transform"], i), "cat": "VkFFT", "ph": "X",
+                               "ts": (t0 + k["start"]) * 1e6, "dur": k["dt"] * 1e6, "pid": 0, "tid": tid,
+                               "args": {"grid": k["grid"], "block": k["block"], "nbytes": k["nbytes"],
+                                        "gbps": k["nbytes"] / max(k["dt"], 1e-12) / 1024 ** 3}})
+    trace = {"traceEvents": events, "displayTimeUnit": "ms"}
+    if filename is not None:
+        with open(filename, 'w') as f:
+            json.dump(trace, f)
+    return trace
+
+
+def benchmark_info():
+    """Information about the host and versions, stored with the benchmark results"""
+    return {"hostname": socket.gethostname(), "platform": platform.platform(), "pyvkfft_version": __version__,
+            "vkfft_version": vkfft_version(), "date": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def _flatten(res):
+    r = {}
+    for k, v in res.items():
+        if k == "profile":
+            # Per-kernel profiling is only exported to JSON
+            continue
+        if isinstance(v, dict):
+            for k1, v1 in v.items():
+                r["%s_%s" % (k, k1)] = v1
+        else:
+            r[k] = str(v) if isinstance(v, (tuple, list)) else v
+    return r
+
+
+def save_json(filename, vres, info=None):
+    """
+    Save benchmark results to a JSON file.
+
+    :param filename: the JSON file name
+    :param vres: the list of results returned by benchmark()
+    :param info: the information about the host and versions. If None,
+        benchmark_info() is used.
+    """
+    with open(filename, 'w') as f:
+        json.dump({"info": benchmark_info() if info is None else info, "results": vres}, f, indent=1)
+
+
+def save_csv(filename, vres, info=None):
+    """
+    Save benchmark results to a CSV file, with one line per benchmark,
+    and one column per timing statistic (e.g. 'fft_median', 'fft_p90').
+
+    :param filename: the CSV file name
+    :param vres: the list of results returned by benchmark()
+    :param info: the information about the host and versions, added as columns.
+        If None, benchmark_info() is used.
+    """
+    if info is None:
+        info = benchmark_info()
+    rows = [dict(_flatten(r), **info) for r in vres]
+    fields = []
+    for r in rows:
+        fields += [k for k in r.keys() if k not in fields]
+    with open(filename, 'w', newline='') as f:
+        w = csv.DictWriter(f, fieldnames=fields)
+        w.writeheader()
+        w.writerows(rows)
@@ -16,6 +16,11 @@ FFT_CACHE_NB = 32
 # Valid values: either None or 1
 USE_LUT = None
 
+# Path to the sqlite database with the VkFFT parameters tuned for each transform
+# and GPU (see pyvkfft.tune). If this file exists, the tuned parameters are used
+# automatically when creating a VkFFTApp. Use an empty string to disable tuning.
+TUNE_DB = os.path.join(os.path.expanduser("~"), ".cache", "pyvkfft", "tune.db")
+
 
 def process_environ(environ):
     if "PYVKFFT_FFT_CACHE_NB" in environ:
@@ -28,6 +33,11 @@ def process_environ(environ):
     else:
         USE_LUT = None
 
+    if "PYVKFFT_TUNE_DB" in environ:
+        TUNE_DB = environ["PYVKFFT_TUNE_DB"]
+    else:
+        TUNE_DB = os.path.join(os.path.expanduser("~"), ".cache", "pyvkfft", "tune.db")
+
     # Inject values into the module globals
     for name, value in locals().copy().items():
         if name.isupper():
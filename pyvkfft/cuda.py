@@ -6,10 +6,13 @@
 #         Vincent Favre-Nicolin, favre@esrf.fr
 
 import ctypes
+import sys
+import timeit
 import numpy as np
 
 try:
     import pycuda.driver as cu_drv
+    import pycuda.gpuarray as cua
 
     has_pycuda = True
 except ImportError:
@@ -23,7 +26,8 @@ except ImportError:
     if has_pycuda is False:
         raise ImportError("You need either PyCUDA or CuPy to use pyvkfft.cuda.")
 
-from .base import load_library, primes, VkFFTApp as VkFFTAppBase, VkFFTResult, check_vkfft_result
+from .base import load_library, primes, VkFFTApp as VkFFTAppBase, _profiled, VkFFTResult, check_vkfft_result, \
+    cuda_array_ptr, _dlpack_cuda_devices
 
 _vkfft_cuda = load_library("_vkfft_cuda")
 
@@ -38,9 +42,10 @@ class _types:
 _vkfft_cuda.make_config.restype = ctypes.c_void_p
 _vkfft_cuda.make_config.argtypes = [ctypes.c_size_t, ctypes.c_size_t, ctypes.c_size_t, ctypes.c_size_t,
                                     ctypes.c_void_p, ctypes.c_void_p, _types.stream, ctypes.c_int,
-                                    ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int,
-                                    ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_size_t,
-                                    ctypes.c_int, ctypes.c_int, ctypes.c_int]
+                                    ctypes.c_size_t, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                    ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_size_t,
+                                    ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                    ctypes.c_int, ctypes.c_int]
 
 _vkfft_cuda.init_app.restype = ctypes.c_void_p
 _vkfft_cuda.init_app.argtypes = [_types.vkfft_config, ctypes.POINTER(ctypes.c_int)]
@@ -57,6 +62,89 @@ _vkfft_cuda.free_app.argtypes = [_types.vkfft_app]
 _vkfft_cuda.free_config.restype = None
 _vkfft_cuda.free_config.argtypes = [_types.vkfft_config]
 
+_vkfft_cuda.get_buffer_nbytes.restype = ctypes.c_size_t
+_vkfft_cuda.get_buffer_nbytes.argtypes = [_types.vkfft_app]
+
+_vkfft_cuda.get_nb_dispatch.restype = ctypes.c_size_t
+_vkfft_cuda.get_nb_dispatch.argtypes = None
+
+_vkfft_cuda.set_profiling.restype = None
+_vkfft_cuda.set_profiling.argtypes = [ctypes.c_int]
+
+_vkfft_cuda.get_dispatch_profile.restype = ctypes.c_int
+_vkfft_cuda.get_dispatch_profile.argtypes = [ctypes.c_size_t, ctypes.POINTER(ctypes.c_size_t),
+                                    ctypes.POINTER(ctypes.c_size_t), ctypes.POINTER(ctypes.c_double)]
+
+_vkfft_cuda.get_init_profile.restype = ctypes.c_size_t
+_vkfft_cuda.get_init_profile.argtypes = [ctypes.POINTER(ctypes.c_double)]
+
+_vkfft_cuda.dst_supported.restype = ctypes.c_int
+_vkfft_cuda.dst_supported.argtypes = None
+
+_vkfft_cuda.stream_wait.restype = ctypes.c_int
+_vkfft_cuda.stream_wait.argtypes = [_types.stream, _types.stream]
+
+
+def _is_native(a):
+    """ Check if an array is a pycuda GPUArray or a cupy ndarray """
+    return (has_pycuda and isinstance(a, cua.GPUArray)) or (has_cupy and isinstance(a, cp.ndarray))
+
+
+def _as_cupy(a):
+    """
+    Get a cupy view (without copy) of an array exporting __cuda_array_interface__ or __dlpack__.
+    The cupy current stream waits for the work pending on the array, following the
+    __cuda_array_interface__ or DLPack synchronisation semantics.
+    """
+    if not has_cupy:
+        raise RuntimeError("cupy is required to use arrays from %s with norm='ortho', in-place R2C "
+                           "transforms or the pyvkfft.fft functions" % type(a).__module__)
+    if hasattr(a, "__cuda_array_interface__"):
+        return cp.asarray(a)
+    if a.__dlpack_device__()[0] not in _dlpack_cuda_devices:
+        raise RuntimeError("The array is not in the CUDA memory space (DLPack device: %s)"
+                           % str(a.__dlpack_device__()))
+    return cp.from_dlpack(a)
+
+
+def _from_cupy(src, a):
+    """
+    Convert a cupy array to the type of the src array (without copy) using the from_dlpack
+    function of its library if it exists (e.g. torch.from_dlpack), or return the cupy array.
+    """
+    from_dlpack = getattr(sys.modules.get(type(src).__module__.split('.')[0]), 'from_dlpack', None)
+    return a if from_dlpack is None else from_dlpack(a)
+
+
+def _scale(a, s):
+    """ Multiply an array in-place by a scale factor """
+    if _is_native(a):
+        a *= s
+    else:
+        c = _as_cupy(a)
+        c *= s
+
+
+def _view(a, dtypes):
+    """
+    Get a view of an array with a different dtype.
+
+    :param a: the array
+    :param dtypes: a dictionary giving the new dtype from the array dtype
+    :return: the view with the new dtype, of the same type as the array if possible,
+        or the array itself if its dtype is not in dtypes.
+    """
+    c = a if _is_native(a) else _as_cupy(a)
+    dtype = dtypes.get(np.dtype(c.dtype).type)
+    if dtype is None:
+        return a
+    v = c.view(dtype=dtype)
+    return v if c is a else _from_cupy(a, v)
+
+
+# Names of the GPU used through cupy, by device number
+_gpu_names = {}
+
 
 class VkFFTApp(VkFFTAppBase):
     """
@@ -64,7 +152,8 @@ class VkFFTApp(VkFFTAppBase):
     """
 
     def __init__(self, shape, dtype: type, ndim=None, inplace=True, stream=None, norm=1,
-                 r2c=False, dct=False, axes=None, **kwargs):
+                 r2c=False, dct=False, axes=None, compute_dtype=None, dst=False, preserve_input=False,
+                 **kwargs):
         """
 
         :param shape: the shape of the array to be transformed. The number
@@ -81,7 +170,8 @@ class VkFFTApp(VkFFTAppBase):
         :param inplace: if True (the default), performs an inplace transform and
             the destination array should not be given in fft() and ifft().
         :param stream: the pycuda.driver.Stream or cupy.cuda.Stream to use
-            for the transform. If None, the default one will be used
+            for the transform, or any stream with a cuda_stream attribute (e.g. torch.cuda.Stream),
+            or the stream handle as an int. If None, the default one will be used
         :param norm: if 0 (unnormalised), every transform multiplies the L2
             norm of the array by its size (or the size of the transformed
             array if ndim<d.ndim).
@@ -99,26 +189,51 @@ class VkFFTApp(VkFFTAppBase):
             For an out-of-place transform, if the input (real) shape is (..., nx),
             the output (complex) shape should be (..., nx//2+1).
             Note that for C2R transforms with ndim>=2, the source (complex) array
-            is modified.
+            is modified, unless preserve_input=True.
         :param dct: used to perform a Direct Cosine Transform (DCT) aka a R2R transform.
             An integer can be given to specify the type of DCT (1, 2, 3 or 4).
             if dct=True, the DCT type 2 will be performed, following scipy's convention.
         :param axes: a list or tuple of axes along which the transform should be made.
             if None, the transform is done along the ndim fastest axes, or all
             axes if ndim is None. Not allowed for R2C transforms
+        :param compute_dtype: the dtype used for the calculations, if it should be
+            different from the storage one (dtype). If None, the same precision
+            is used for storage and calculations. The following combinations are
+            supported: complex32 storage with complex64 calculations
+            (half precision memory only, out-of-place C2C transforms only), and
+            complex64 (or float32) storage with complex128 (or float64) calculations,
+            which gives an accuracy close to double precision without doubling
+            the memory used by the arrays.
+        :param dst: used to perform a Direct Sine Transform (DST) aka a R2R transform.
+            An integer can be given to specify the type of DST (1, 2, 3 or 4).
+            if dst=True, the DST type 2 will be performed, following scipy's convention.
+            This requires a VkFFT version >= 1.3.0.
+        :param preserve_input: if True, for an out-of-place transform the calculations are
+            made in an internal buffer allocated with the VkFFT application, so that the source
+            array is never modified. This is useful for C2R transforms with ndim>=2, where VkFFT
+            would otherwise use the source array as work buffer.
         :raises RuntimeError: if the initialisation fails, e.g. if the CUDA
             driver has not been properly initialised.
         """
-        super().__init__(shape, dtype, ndim=ndim, inplace=inplace, norm=norm, r2c=r2c, dct=dct, axes=axes, **kwargs)
+        t0 = timeit.default_timer()
+        super().__init__(shape, dtype, ndim=ndim, inplace=inplace, norm=norm, r2c=r2c, dct=dct, axes=axes,
+                         compute_dtype=compute_dtype, dst=dst, preserve_input=preserve_input, **kwargs)
+        if self.dst and not dst_supported():
+            raise RuntimeError("DST transforms require VkFFT>=1.3.0, but pyvkfft was built with VkFFT %s"
+                               % vkfft_version())
 
         self.stream = stream
+        self._stream_handle = self._get_stream_handle()
+        self._apply_tuning("cuda", kwargs, vkfft_version())
 
+        t1 = timeit.default_timer()
         self.config = self._make_config()
+        t_config = timeit.default_timer() - t1
         if self.config is None:
             raise RuntimeError("Error creating VkFFTConfiguration. Was the CUDA context properly initialised ?")
         res = ctypes.c_int(0)
         self.app = _vkfft_cuda.init_app(self.config, ctypes.byref(res))
-        check_vkfft_result(res, shape, dtype, ndim, inplace, norm, r2c, dct, axes, "cuda")
+        check_vkfft_result(res, shape, dtype, ndim, inplace, norm, r2c, dct, axes, "cuda", dst)
         if self.app is None:
             raise RuntimeError("Error creating VkFFTApplication. Was the CUDA driver initialised ?")
         if has_pycuda:
@@ -127,6 +242,7 @@ class VkFFTApp(VkFFTAppBase):
             #  anymore. Except that we cannot be sure this is the right context, if a stream
             #  has been given because we don't have access to cuStreamGetCtx from python...
             self._ctx = cu_drv.Context.get_current()
+        self._set_plan_timings(t0, t_config, _vkfft_cuda.get_init_profile)
 
     def __del__(self):
         """ Takes care of deleting allocated memory in the underlying
@@ -137,6 +253,89 @@ class VkFFTApp(VkFFTAppBase):
         if self.config is not None:
             _vkfft_cuda.free_config(self.config)
 
+    def get_buffer_nbytes(self):
+        """
+        Get the size of the GPU buffers allocated by this VkFFTApp, i.e. the internal
+        calculation buffer (e.g. with preserve_input=True) and the VkFFT temporary buffer.
+        This does not include the arrays given to fft() and ifft().
+
+        :return: the number of bytes allocated
+        """
+        if self.app is None:
+            return 0
+        return _vkfft_cuda.get_buffer_nbytes(self.app)
+
+    def get_nb_dispatch(self):
+        """
+        Get the number of GPU kernels launched by the last fft() or ifft() call
+        made in the current thread, including the scaling for norm='ortho'. Each kernel
+        reads and writes the array once, so this can be used to estimate the memory
+        bandwidth actually achieved by the transform.
+
+        :return: the number of kernels launched
+        """
+        return _vkfft_cuda.get_nb_dispatch() + int(self.norm == "ortho")
+
+    def _get_gpu_name(self):
+        if has_pycuda:
+            try:
+                return cu_drv.Context.get_device().name()
+            except cu_drv.Error:
+                # No current pycuda context
+                pass
+        if not has_cupy:
+            raise RuntimeError("VkFFTApp: could not get the GPU name. Was the CUDA context properly initialised ?")
+        dev = cp.cuda.runtime.getDevice()
+        if dev not in _gpu_names:
+            name = cp.cuda.runtime.getDeviceProperties(dev)['name']
+            _gpu_names[dev] = name.decode() if isinstance(name, bytes) else name
+        return _gpu_names[dev]
+
+    def _set_profiling(self, enable):
+        _vkfft_cuda.set_profiling(int(enable))
+
+    def _get_dispatch_profile(self, i):
+        grid, block, t = (ctypes.c_size_t * 3)(), (ctypes.c_size_t * 3)(), (ctypes.c_double * 2)()
+        res = _vkfft_cuda.get_dispatch_profile(i, grid, block, t)
+        if res:
+            raise RuntimeError("VkFFTApp: could not get the profiling information for kernel #%d "
+                               "(CUDA error code: %d)" % (i, res))
+        return tuple(grid), tuple(block), tuple(t)
+
+    def _get_stream_handle(self):
+        """ Get the handle of the CUDA stream used by this VkFFTApp, as an int (0 for the default stream) """
+        if self.stream is None:
+            return 0
+        if isinstance(self.stream, int):
+            return self.stream
+        if has_pycuda:
+            if isinstance(self.stream, cu_drv.Stream):
+                return self.stream.handle
+        if has_cupy:
+            if isinstance(self.stream, cp.cuda.Stream):
+                return self.stream.ptr
+        # e.g. torch.cuda.Stream
+        return int(getattr(self.stream, "cuda_stream", 0))
+
+    def _get_ptr(self, a):
+        """
+        Get the address of the data of a pycuda, cupy or any other CUDA array exporting
+        __cuda_array_interface__ or __dlpack__. If the array was produced on another
+        stream, the stream used for the transform will wait for it.
+        """
+        if has_pycuda:
+            if isinstance(a, cua.GPUArray):
+                # Must cast the gpudata to int as it can either be a DeviceAllocation object
+                # or an int (e.g. when using a view of another array)
+                return int(a.gpudata)
+        ptr, s = cuda_array_ptr(a, self._stream_handle)
+        # 0 and 1 are both the legacy default stream
+        if s is not None and s != self._stream_handle and {s, self._stream_handle} != {0, 1}:
+            res = _vkfft_cuda.stream_wait(s, self._stream_handle)
+            if res:
+                raise RuntimeError("VkFFTApp: could not synchronise the CUDA streams (CUDA error code: %d)" % res)
+        return ptr
+
     def _make_config(self):
         """ Create a vkfft configuration for a FFT transform"""
         nx, ny, nz, n_batch = self.shape
@@ -146,14 +345,7 @@ class VkFFTApp(VkFFTAppBase):
             # in the C array with a size nx//2+1
             nx -= 2
 
-        s = 0
-        if self.stream is not None:
-            if has_pycuda:
-                if isinstance(self.stream, cu_drv.Stream):
-                    s = self.stream.handle
-            if has_cupy:
-                if isinstance(self.stream, cp.cuda.Stream):
-                    s = self.stream.ptr
+        s = self._stream_handle
 
         if self.norm == "ortho":
             norm = 0
@@ -167,35 +359,26 @@ class VkFFTApp(VkFFTAppBase):
             dest_gpudata = 0
 
         return _vkfft_cuda.make_config(nx, ny, nz, self.ndim, 1, dest_gpudata, s,
-                                       norm, self.precision, int(self.r2c), int(self.dct),
-                                       int(self.disableReorderFourStep), int(self.registerBoost),
+                                       norm, self.precision, self.compute_precision, int(self.r2c), int(self.dct),
+                                       int(self.dst), int(self.disableReorderFourStep), int(self.registerBoost),
                                        int(self.use_lut), int(self.keepShaderCode),
-                                       n_batch, skipx, skipy, skipz)
+                                       n_batch, skipx, skipy, skipz, int(self.preserve_input),
+                                       int(self.coalescedMemory), int(self.aimThreads), int(self.numSharedBanks))
 
+    @_profiled
     def fft(self, src, dest=None):
         """
         Compute the forward FFT
-        :param src: the source pycuda.gpuarray.GPUArray or cupy.ndarray
+        :param src: the source pycuda.gpuarray.GPUArray, cupy.ndarray, or any CUDA array
+            exporting __cuda_array_interface__ or __dlpack__ (e.g. pytorch or jax)
         :param dest: the destination GPU array. Should be None for an inplace transform
         :raises RuntimeError: in case of a GPU kernel launch error
         :return: the transformed array. For a R2C inplace transform, the complex view of the
             array is returned.
         """
-        use_cupy = False
-        if has_cupy:
-            if isinstance(src, cp.ndarray):
-                use_cupy = True
-        if use_cupy:
-            src_ptr = src.__cuda_array_interface__['data'][0]
-        else:
-            # Must cast the gpudata to int as it can either be a DeviceAllocation object
-            # or an int (e.g. when using a view of another array)
-            src_ptr = int(src.gpudata)
+        src_ptr = self._get_ptr(src)
         if dest is not None:
-            if use_cupy:
-                dest_ptr = dest.__cuda_array_interface__['data'][0]
-            else:
-                dest_ptr = int(dest.gpudata)
+            dest_ptr = self._get_ptr(dest)
         else:
             dest_ptr = src_ptr
         if self.inplace:
@@ -203,14 +386,11 @@ class VkFFTApp(VkFFTAppBase):
                 raise RuntimeError("VkFFTApp.fft: dest is not None but this is an inplace transform")
             res = _vkfft_cuda.fft(self.app, int(src_ptr), int(src_ptr))
             check_vkfft_result(res, src.shape, src.dtype, self.ndim, self.inplace, self.norm, self.r2c,
-                               self.dct, backend="cuda")
+                               self.dct, backend="cuda", dst=self.dst)
             if self.norm == "ortho":
-                src *= self._get_fft_scale(norm=0)
+                _scale(src, self._get_fft_scale(norm=0))
             if self.r2c:
-                if src.dtype == np.float32:
-                    return src.view(dtype=np.complex64)
-                elif src.dtype == np.float64:
-                    return src.view(dtype=np.complex128)
+                return _view(src, {np.float32: np.complex64, np.float64: np.complex128})
             return src
         else:
             if dest is None:
@@ -218,38 +398,28 @@ class VkFFTApp(VkFFTAppBase):
             if src_ptr == dest_ptr:
                 raise RuntimeError("VkFFTApp.fft: dest and src are identical but this is an out-of-place transform")
             if self.r2c:
-                assert (dest.size == src.size // src.shape[-1] * (src.shape[-1] // 2 + 1))
+                assert (np.prod(dest.shape) == np.prod(src.shape) // src.shape[-1] * (src.shape[-1] // 2 + 1))
             res = _vkfft_cuda.fft(self.app, int(src_ptr), int(dest_ptr))
             check_vkfft_result(res, src.shape, src.dtype, self.ndim, self.inplace, self.norm, self.r2c,
-                               self.dct, backend="cuda")
+                               self.dct, backend="cuda", dst=self.dst)
             if self.norm == "ortho":
-                dest *= self._get_fft_scale(norm=0)
+                _scale(dest, self._get_fft_scale(norm=0))
             return dest
 
+    @_profiled
     def ifft(self, src, dest=None):
         """
         Compute the backward FFT
-        :param src: the source pycuda.gpuarray.GPUArray or cupy.ndarray
+        :param src: the source pycuda.gpuarray.GPUArray, cupy.ndarray, or any CUDA array
+            exporting __cuda_array_interface__ or __dlpack__ (e.g. pytorch or jax)
         :param dest: the destination GPU array. Should be None for an inplace transform
         :raises RuntimeError: in case of a GPU kernel launch error
         :return: the transformed array. For a C2R inplace transform, the float view of the
             array is returned.
         """
-        use_cupy = False
-        if has_cupy:
-            if isinstance(src, cp.ndarray):
-                use_cupy = True
-        if use_cupy:
-            src_ptr = src.__cuda_array_interface__['data'][0]
-        else:
-            # Must cast the gpudata to int as it can either be a DeviceAllocation object
-            # or an int (e.g. when using a view of another array)
-            src_ptr = int(src.gpudata)
+        src_ptr = self._get_ptr(src)
         if dest is not None:
-            if use_cupy:
-                dest_ptr = dest.__cuda_array_interface__['data'][0]
-            else:
-                dest_ptr = int(dest.gpudata)
+            dest_ptr = self._get_ptr(dest)
         else:
             dest_ptr = src_ptr
         if self.inplace:
@@ -258,34 +428,41 @@ class VkFFTApp(VkFFTAppBase):
                     raise RuntimeError("VkFFTApp.fft: dest!=src but this is an inplace transform")
             res = _vkfft_cuda.ifft(self.app, int(src_ptr), int(src_ptr))
             check_vkfft_result(res, src.shape, src.dtype, self.ndim, self.inplace, self.norm, self.r2c,
-                               self.dct, backend="cuda")
+                               self.dct, backend="cuda", dst=self.dst)
             if self.norm == "ortho":
-                src *= self._get_ifft_scale(norm=0)
+                _scale(src, self._get_ifft_scale(norm=0))
             if self.r2c:
-                if src.dtype == np.complex64:
-                    return src.view(dtype=np.float32)
-                elif src.dtype == np.complex128:
-                    return src.view(dtype=np.float64)
+                return _view(src, {np.complex64: np.float32, np.complex128: np.float64})
             return src
         if not self.inplace:
             if dest is None:
                 raise RuntimeError("VkFFTApp.ifft: dest is None but this is an out-of-place transform")
             if src_ptr == dest_ptr:
                 raise RuntimeError("VkFFTApp.ifft: dest and src are identical but this is an out-of-place transform")
-            if self.r2c:
-                assert (src.size == dest.size // dest.shape[-1] * (dest.shape[-1] // 2 + 1))
-                # Special case, src and dest buffer sizes are different,
-                # VkFFT is configured to go back to the source buffer
+            if self.r2c or self.half_memory_only or self.preserve_input:
+                if self.r2c:
+                    assert (np.prod(src.shape) == np.prod(dest.shape) // dest.shape[-1] * (dest.shape[-1] // 2 + 1))
+                # Special case, src and dest buffer sizes are different (R2C), or the calculations
+                # use a separate buffer (half precision storage or preserve_input), VkFFT is
+                # configured to go back to the source buffer
                 res = _vkfft_cuda.ifft(self.app, int(dest_ptr), int(src_ptr))
             else:
                 res = _vkfft_cuda.ifft(self.app, int(src_ptr), int(dest_ptr))
             check_vkfft_result(res, src.shape, src.dtype, self.ndim, self.inplace, self.norm, self.r2c,
-                               self.dct, backend="cuda")
+                               self.dct, backend="cuda", dst=self.dst)
             if self.norm == "ortho":
-                dest *= self._get_ifft_scale(norm=0)
+                _scale(dest, self._get_ifft_scale(norm=0))
             return dest
 
 
+def dst_supported():
+    """
+    Check if DST transforms are supported, which requires pyvkfft to be built with VkFFT>=1.3.0
+    :return: True if DST transforms are supported
+    """
+    return bool(_vkfft_cuda.dst_supported())
+
+
 def vkfft_version():
     """
     Get VkFFT version
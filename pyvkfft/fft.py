@@ -5,31 +5,50 @@
 #       authors:
 #         Vincent Favre-Nicolin, favre@esrf.fr
 
-__all__ = ['fftn', 'ifftn', 'rfftn', 'irfftn', 'vkfft_version', 'clear_vkfftapp_cache',
-           'has_pycuda', 'has_opencl', 'has_cupy']
+__all__ = ['fftn', 'ifftn', 'rfftn', 'irfftn', 'dctn', 'idctn', 'dstn', 'idstn', 'r2rn', 'ir2rn',
+           'vkfft_version', 'clear_vkfftapp_cache', 'vkfftapp_cache', 'VkFFTAppCache',
+           'has_pycuda', 'has_opencl', 'has_cupy', 'ArrayAdapter', 'register_array_adapter']
 
+from collections import OrderedDict
 from enum import Enum
-from functools import lru_cache
+from functools import wraps, lru_cache
+import importlib
+import importlib.util
+import inspect
+import os
+import sys
+import threading
+import timeit
 import numpy as np
-from .base import complex32
+from .base import complex32, library_path, cuda_array_ptr
 from .config import FFT_CACHE_NB
+from .version import vkfft_version
 
-try:
-    from .cuda import VkFFTApp as VkFFTApp_cuda, has_pycuda, has_cupy, vkfft_version
 
-    if has_pycuda:
-        import pycuda.gpuarray as cua
-    if has_cupy:
-        import cupy as cp
-except ImportError:
-    has_cupy, has_pycuda = False, False
+# The backend modules (pyvkfft.cuda and pyvkfft.opencl) are only imported when
+# a transform is first requested for a given type of array, so that importing
+# pyvkfft.fft does not load the shared libraries, nor pycuda, cupy or pyopencl.
+# has_pycuda, has_cupy and has_opencl only check that the required packages
+# and pyvkfft library are installed, without importing them.
 
-try:
-    from .opencl import VkFFTApp as VkFFTApp_cl, cla, vkfft_version
+@lru_cache(maxsize=None)
+def _has_backend(package, library):
+    return importlib.util.find_spec(package) is not None and os.path.exists(library_path(library))
 
-    has_opencl = True
-except ImportError:
-    has_opencl = False
+
+_backend_probes = {'has_pycuda': ('pycuda', '_vkfft_cuda'), 'has_cupy': ('cupy', '_vkfft_cuda'),
+                   'has_opencl': ('pyopencl', '_vkfft_opencl')}
+
+
+def __getattr__(name):
+    if name in _backend_probes:
+        return _has_backend(*_backend_probes[name])
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def _backend_module(name):
+    """ Import (on first use) and return the pyvkfft backend module, 'cuda' or 'opencl' """
+    return importlib.import_module('.' + name, __package__)
 
 
 class Backend(Enum):
@@ -40,6 +59,336 @@ class Backend(Enum):
     CUPY = 3
 
 
+class VkFFTAppCache:
+    """
+    Least-recently-used cache of the VkFFTApp (FFT plans) created through the
+    pyvkfft.fft interface, shared by all kinds of transforms ('fft', 'rfft',
+    'dct' and 'dst'), with statistics about its efficiency.
+    VkFFTApp are only removed when the cache is full (least recently used first),
+    or when clear() is called, which must be done before destroying a context.
+    """
+
+    def __init__(self, maxsize=FFT_CACHE_NB):
+        """
+        :param maxsize: the maximum number of VkFFTApp kept in the cache. When
+            it is exceeded, the least recently used VkFFTApp is removed.
+        """
+        self.maxsize = maxsize
+        # key -> (app, nbytes)
+        self._apps = OrderedDict()
+        self._lock = threading.RLock()
+        self._hits = {}
+        self._misses = {}
+        self._evictions = {}
+        self._compile_time = {}
+
+    def get(self, kind, key, create):
+        """
+        Get a VkFFTApp from the cache, or create it.
+
+        :param kind: the kind of transform, e.g. 'fft', 'rfft', 'dct' or 'dst'
+        :param key: a tuple with all the parameters used to create the VkFFTApp.
+            Lists are converted to tuples so they can be hashed.
+        :param create: a function without arguments which creates the VkFFTApp
+        :return: the VkFFTApp
+        """
+        key = (kind,) + tuple(tuple(v) if isinstance(v, list) else v for v in key)
+        with self._lock:
+            if key in self._apps:
+                self._apps.move_to_end(key)
+                self._hits[kind] = self._hits.get(kind, 0) + 1
+                return self._apps[key][0]
+            self._misses[kind] = self._misses.get(kind, 0) + 1
+            t0 = timeit.default_timer()
+            app = create()
+            self._compile_time[kind] = self._compile_time.get(kind, 0) + timeit.default_timer() - t0
+            nbytes = app.get_buffer_nbytes() if hasattr(app, "get_buffer_nbytes") else 0
+            self._apps[key] = (app, nbytes)
+            while len(self._apps) > self.maxsize:
+                k = next(iter(self._apps))
+                del self._apps[k]
+                self._evictions[k[0]] = self._evictions.get(k[0], 0) + 1
+            return app
+
+    def stats(self):
+        """
+        Get the cache statistics.
+
+        :return: a dictionary with the total number of 'hits', 'misses' and 'evictions',
+            the time spent creating (compiling) the VkFFTApp in seconds ('compile_time'),
+            the number of cached VkFFTApp ('size'), the maximum size ('maxsize'), the size
+            of the GPU buffers allocated by the cached VkFFTApp ('nbytes'), and under 'kinds'
+            a dictionary with the same values (except maxsize) for each kind of transform.
+        """
+        with self._lock:
+            kinds = set(self._hits) | set(self._misses) | set(k[0] for k in self._apps)
+            vk = {}
+            for kind in kinds:
+                v = [a for k, a in self._apps.items() if k[0] == kind]
+                vk[kind] = {"hits": self._hits.get(kind, 0), "misses": self._misses.get(kind, 0),
+                            "evictions": self._evictions.get(kind, 0),
+                            "compile_time": self._compile_time.get(kind, 0), "size": len(v),
+                            "nbytes": sum(a[1] for a in v)}
+            res = {"maxsize": self.maxsize, "kinds": vk}
+            for k in ["hits", "misses", "evictions", "compile_time", "size", "nbytes"]:
+                res[k] = sum(v[k] for v in vk.values())
+            return res
+
+    def clear(self, kind=None, context=None, reset_stats=False):
+        """
+        Remove VkFFTApp from the cache. The GPU memory they use is released when
+        they are not referenced elsewhere.
+
+        :param kind: if given, only remove VkFFTApp for this kind of transform,
+            e.g. 'fft', 'rfft', 'dct' or 'dst'.
+        :param context: if given, only remove VkFFTApp using this pyopencl.Context
+            or pycuda.driver.Context. This should be used before destroying a context,
+            as the cached VkFFTApp keep references to it. Note that VkFFTApp created
+            for cupy arrays do not record their context, so they are only removed
+            when context is None.
+        :param reset_stats: if True, also reset the statistics
+        """
+        with self._lock:
+            for k in list(self._apps.keys()):
+                if kind is not None and k[0] != kind:
+                    continue
+                if context is not None and _get_app_context(self._apps[k][0]) != context:
+                    continue
+                del self._apps[k]
+            if reset_stats:
+                self._hits.clear()
+                self._misses.clear()
+                self._evictions.clear()
+                self._compile_time.clear()
+
+
+def _get_app_context(app):
+    """ Return the pyopencl.Context or pycuda.driver.Context used by a VkFFTApp, or None """
+    if hasattr(app, "queue"):
+        return app.queue.context
+    return getattr(app, "_ctx", None)
+
+
+vkfftapp_cache = VkFFTAppCache()
+
+
+def _cached_app(kind):
+    """ Decorator to get VkFFTApp through vkfftapp_cache """
+
+    def decorator(func):
+        sig = inspect.signature(func)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            # Normalise the arguments, so that the same parameters given positionally,
+            # by keyword or using the default values share the same key
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return vkfftapp_cache.get(kind, tuple(bound.arguments.values()),
+                                      lambda: func(*bound.args, **bound.kwargs))
+
+        return wrapper
+
+    return decorator
+
+
+class ArrayAdapter:
+    """
+    Adapter between a type of GPU array and the pyvkfft backends, used by the
+    pyvkfft.fft functions to get the address of the array data and allocate
+    the destination arrays. Adapters for other array libraries can be added
+    using register_array_adapter().
+    """
+    # The backend used for the transforms: Backend.PYCUDA, Backend.CUPY
+    # (for any array in the CUDA memory space) or Backend.PYOPENCL
+    backend = Backend.UNKNOWN
+
+    def ptr(self, a):
+        """ Return the address of the array data, as an int """
+        raise NotImplementedError()
+
+    def empty_like(self, src, shape=None, dtype=None):
+        """
+        Allocate a new array of the same type as src, on the same device.
+
+        :param src: the source array
+        :param shape: the shape of the new array. If None, src.shape is used
+        :param dtype: the dtype of the new array. If None, src.dtype is used
+        :return: the new array
+        """
+        raise NotImplementedError()
+
+    def queue(self, src):
+        """ Return the pyopencl.CommandQueue associated to the array, or None """
+        return None
+
+
+class _PyCUDAAdapter(ArrayAdapter):
+    backend = Backend.PYCUDA
+
+    def ptr(self, a):
+        # Must cast the gpudata to int as it can either be a DeviceAllocation object
+        # or an int (e.g. when using a view of another array)
+        return int(a.gpudata)
+
+    def empty_like(self, src, shape=None, dtype=None):
+        cua = sys.modules['pycuda.gpuarray']
+        if shape is None and dtype is None:
+            return cua.empty_like(src)
+        return cua.empty(src.shape if shape is None else tuple(shape), dtype=src.dtype if dtype is None else dtype,
+                         allocator=src.allocator)
+
+
+class _PyOpenCLAdapter(ArrayAdapter):
+    backend = Backend.PYOPENCL
+
+    def ptr(self, a):
+        return a.data.int_ptr
+
+    def empty_like(self, src, shape=None, dtype=None):
+        cla = sys.modules['pyopencl.array']
+        if shape is None and dtype is None:
+            return cla.empty_like(src)
+        return cla.empty(src.queue, src.shape if shape is None else tuple(shape),
+                         dtype=src.dtype if dtype is None else dtype, allocator=src.allocator)
+
+    def queue(self, src):
+        return src.queue
+
+
+class _CuPyAdapter(ArrayAdapter):
+    backend = Backend.CUPY
+
+    def ptr(self, a):
+        return a.__cuda_array_interface__['data'][0]
+
+    def empty_like(self, src, shape=None, dtype=None):
+        cp = sys.modules['cupy']
+        if shape is None and dtype is None:
+            return cp.empty_like(src)
+        return cp.empty(src.shape if shape is None else tuple(shape), dtype=src.dtype if dtype is None else dtype)
+
+
+class _CUDAArrayAdapter(ArrayAdapter):
+    """
+    Adapter for any array in the CUDA memory space exporting __cuda_array_interface__
+    or __dlpack__ (e.g. pytorch, jax or numba). The transforms are made on a cupy
+    view of the arrays (without copies), and new arrays are allocated with cupy.
+    They are converted back to the type of the source array using the from_dlpack
+    function of its library if it exists (e.g. torch.from_dlpack), or returned
+    as cupy arrays otherwise.
+    """
+    backend = Backend.CUPY
+
+    def ptr(self, a):
+        return cuda_array_ptr(a)[0]
+
+    def empty_like(self, src, shape=None, dtype=None):
+        c = self.as_cupy(src)
+        cp = sys.modules['cupy']
+        with c.device:
+            d = cp.empty(c.shape if shape is None else tuple(shape), dtype=c.dtype if dtype is None else dtype)
+        return self.from_cupy(src, d)
+
+    def as_cupy(self, a):
+        """ Get a cupy view of the array """
+        return _backend_module('cuda')._as_cupy(a)
+
+    def from_cupy(self, src, a):
+        """ Convert a cupy array to the type of the src array, without copy """
+        return _backend_module('cuda')._from_cupy(src, a)
+
+
+def _is_cuda_array_type(t):
+    # numpy arrays also export __dlpack__, but can never be in the CUDA memory space
+    if issubclass(t, np.ndarray):
+        return False
+    return hasattr(t, '__cuda_array_interface__') or hasattr(t, '__dlpack__')
+
+
+def _module_type(module, name):
+    """
+    Return a function testing if a type is a subclass of module.name, without
+    importing the module: if it has not been imported, no array of this type exists.
+    """
+
+    def match(t):
+        m = sys.modules.get(module)
+        return m is not None and issubclass(t, getattr(m, name))
+
+    return match
+
+
+# List of (match, adapter), tested in order for each new type of array
+_array_adapters = [(_module_type('pycuda.gpuarray', 'GPUArray'), _PyCUDAAdapter()),
+                   (_module_type('pyopencl.array', 'Array'), _PyOpenCLAdapter()),
+                   (_module_type('cupy', 'ndarray'), _CuPyAdapter()),
+                   (_is_cuda_array_type, _CUDAArrayAdapter())]
+# type(array) -> adapter
+_array_adapter_cache = {}
+_array_adapter_lock = threading.Lock()
+
+
+def register_array_adapter(match, adapter):
+    """
+    Register an adapter so that the pyvkfft.fft functions (fftn, rfftn, dctn,...)
+    can be used with another type of GPU array, without copies. Adapters
+    registered last take precedence over the previous ones.
+
+    :param match: the array type (subclasses will also match), or a function
+        taking the type of an array and returning True if the adapter can be used
+    :param adapter: the ArrayAdapter for this type of array
+    """
+    if isinstance(match, type):
+        cls = match
+
+        def match(t):
+            return issubclass(t, cls)
+
+    with _array_adapter_lock:
+        _array_adapters.insert(0, (match, adapter))
+        _array_adapter_cache.clear()
+
+
+def _get_array_adapter(src):
+    """ Get the ArrayAdapter for an array, which is cached by type """
+    t = type(src)
+    adapter = _array_adapter_cache.get(t)
+    if adapter is None:
+        with _array_adapter_lock:
+            for match, a in _array_adapters:
+                if match(t):
+                    adapter = _array_adapter_cache[t] = a
+                    break
+    if adapter is None:
+        has = tuple(_has_backend(*_backend_probes[k]) for k in ('has_pycuda', 'has_opencl', 'has_cupy'))
+        raise RuntimeError("Could not determine the type of GPU array supplied (%s.%s), or the "
+                           "corresponding backend is not installed (has_pycuda=%d, has_pyopencl=%d, "
+                           "has_cupy=%d)" % ((t.__module__, t.__name__) + has))
+    return adapter
+
+
+@lru_cache(maxsize=None)
+def _r2c_shape_dtype(shape, dtype):
+    """ Return the shape and dtype of the destination array for an R2C (or C2R) transform """
+    sh = list(shape)
+    if dtype in [np.float16, np.float32, np.float64]:
+        sh[-1] = sh[-1] // 2 + 1
+        dtype_dest = np.complex64
+        if dtype == np.float16:
+            dtype_dest = complex32
+        elif dtype == np.float64:
+            dtype_dest = np.complex128
+    else:
+        sh[-1] = (sh[-1] - 1) * 2
+        dtype_dest = np.float32
+        if dtype == complex32:
+            dtype_dest = np.float16
+        elif dtype == np.complex128:
+            dtype_dest = np.float64
+    return tuple(sh), dtype_dest
+
+
 def _prepare_transform(src, dest, cl_queue, r2c=False):
     """
     Determine the backend from the input data.
@@ -53,69 +402,16 @@ def _prepare_transform(src, dest, cl_queue, r2c=False):
     :return: a tuple (backend, inplace, dest, cl_queue), also appending the
     destination dtype for an r2c transform.
     """
-    backend = Backend.UNKNOWN
+    adapter = _get_array_adapter(src)
+    backend = adapter.backend
     if r2c:
-        if src.dtype in [np.float16, np.float32, np.float64]:
-            sh = list(src.shape)
-            sh[-1] = sh[-1] // 2 + 1
-            dtype = np.complex64
-            if src.dtype == np.float16:
-                dtype = complex32
-            elif src.dtype == np.float64:
-                dtype = np.complex128
-        else:
-            sh = list(src.shape)
-            sh[-1] = (sh[-1] - 1) * 2
-            dtype = np.float32
-            if src.dtype == complex32:
-                dtype = np.float16
-            elif src.dtype == np.complex128:
-                dtype = np.float64
-    else:
-        sh, dtype = None, None
-
-    if has_pycuda:
-        if isinstance(src, cua.GPUArray):
-            backend = Backend.PYCUDA
-            # Must cast the gpudata to int as it can either be a DeviceAllocation object
-            # or an int (e.g. when using a view of another array)
-            src_ptr = int(src.gpudata)
-            if dest is None:
-                if r2c:
-                    dest = cua.empty(tuple(sh), dtype=dtype, allocator=src.allocator)
-                else:
-                    dest = cua.empty_like(src)
-            dest_ptr = int(dest.gpudata)
-
-    if backend == Backend.UNKNOWN and has_opencl:
-        if isinstance(src, cla.Array):
-            backend = Backend.PYOPENCL
-            src_ptr = src.data.int_ptr
-            if dest is None:
-                if r2c:
-                    dest = cla.empty(src.queue, tuple(sh), dtype=dtype, allocator=src.allocator)
-                else:
-                    dest = cla.empty_like(src)
-            dest_ptr = dest.data.int_ptr
-            if cl_queue is None:
-                cl_queue = src.queue
-
-    if backend == Backend.UNKNOWN and has_cupy:
-        if isinstance(src, cp.ndarray):
-            backend = Backend.CUPY
-            src_ptr = src.__cuda_array_interface__['data'][0]
-            if dest is None:
-                if r2c:
-                    dest = cp.empty(tuple(sh), dtype=dtype)
-                else:
-                    dest = cp.empty_like(src)
-            dest_ptr = dest.__cuda_array_interface__['data'][0]
-
-    if backend == Backend.UNKNOWN:
-        raise RuntimeError("Could note determine the type of GPU array supplied, or the "
-                           "corresponding backend is not installed "
-                           "(has_pycuda=%d, has_pyopencl=%d, has_cupy=%d)" %
-                           (has_pycuda, has_opencl, has_cupy))
+        sh, dtype = _r2c_shape_dtype(tuple(src.shape), src.dtype)
+    src_ptr = adapter.ptr(src)
+    if dest is None:
+        dest = adapter.empty_like(src, sh, dtype) if r2c else adapter.empty_like(src)
+    dest_ptr = adapter.ptr(dest)
+    if cl_queue is None:
+        cl_queue = adapter.queue(src)
 
     inplace = dest_ptr == src_ptr
     if r2c:
@@ -126,44 +422,98 @@ def _prepare_transform(src, dest, cl_queue, r2c=False):
         return backend, inplace, dest, cl_queue
 
 
-@lru_cache(maxsize=FFT_CACHE_NB)
-def _get_fft_app(backend, shape, dtype, inplace, ndim, axes, norm, cuda_stream, cl_queue):
+def _same_cupy_array(a, b):
+    return b is not None and a.data.ptr == b.data.ptr and a.dtype == b.dtype and a.shape == b.shape
+
+
+def _cuda_array_interop(func):
+    """
+    Decorator for the pyvkfft.fft functions, so that arrays exporting __cuda_array_interface__
+    or __dlpack__ are transformed using cupy views, and the result is returned in the type
+    of the source array.
+    """
+
+    @wraps(func)
+    def wrapper(src, dest=None, *args, **kwargs):
+        adapter = _get_array_adapter(src)
+        if not isinstance(adapter, _CUDAArrayAdapter):
+            return func(src, dest, *args, **kwargs)
+        csrc = adapter.as_cupy(src)
+        cdest = None if dest is None else (csrc if dest is src else adapter.as_cupy(dest))
+        res = func(csrc, cdest, *args, **kwargs)
+        r = res[0] if isinstance(res, tuple) else res
+        if _same_cupy_array(r, cdest):
+            r = dest
+        elif _same_cupy_array(r, csrc):
+            r = src
+        else:
+            r = adapter.from_cupy(src, r)
+        return (r,) + res[1:] if isinstance(res, tuple) else r
+
+    return wrapper
+
+
+@_cached_app('fft')
+def _get_fft_app(backend, shape, dtype, inplace, ndim, axes, norm, cuda_stream, cl_queue, compute_dtype=None):
     if backend in [Backend.PYCUDA, Backend.CUPY]:
+        VkFFTApp_cuda = _backend_module('cuda').VkFFTApp
         return VkFFTApp_cuda(shape, dtype, ndim=ndim, inplace=inplace,
-                             stream=cuda_stream, norm=norm, axes=axes)
+                             stream=cuda_stream, norm=norm, axes=axes, compute_dtype=compute_dtype)
     elif backend == Backend.PYOPENCL:
+        VkFFTApp_cl = _backend_module('opencl').VkFFTApp
         return VkFFTApp_cl(shape, dtype, cl_queue, ndim=ndim, inplace=inplace,
-                           norm=norm, axes=axes)
+                           norm=norm, axes=axes, compute_dtype=compute_dtype)
 
 
-@lru_cache(maxsize=FFT_CACHE_NB)
-def _get_rfft_app(backend, shape, dtype, inplace, ndim, norm, cuda_stream, cl_queue):
+@_cached_app('rfft')
+def _get_rfft_app(backend, shape, dtype, inplace, ndim, norm, cuda_stream, cl_queue, compute_dtype=None,
+                  preserve_input=False):
     if backend in [Backend.PYCUDA, Backend.CUPY]:
-        return VkFFTApp_cuda(shape, dtype, ndim=ndim, inplace=inplace,
-                             stream=cuda_stream, norm=norm, r2c=True)
+        VkFFTApp_cuda = _backend_module('cuda').VkFFTApp
+        return VkFFTApp_cuda(shape, dtype, ndim=ndim, inplace=inplace, stream=cuda_stream, norm=norm, r2c=True,
+                             compute_dtype=compute_dtype, preserve_input=preserve_input)
     elif backend == Backend.PYOPENCL:
-        return VkFFTApp_cl(shape, dtype, cl_queue, ndim=ndim, inplace=inplace,
-                           norm=norm, r2c=True)
+        VkFFTApp_cl = _backend_module('opencl').VkFFTApp
+        return VkFFTApp_cl(shape, dtype, cl_queue, ndim=ndim, inplace=inplace, norm=norm, r2c=True,
+                           compute_dtype=compute_dtype, preserve_input=preserve_input)
 
 
-@lru_cache(maxsize=FFT_CACHE_NB)
+@_cached_app('dct')
 def _get_dct_app(backend, shape, dtype, inplace, ndim, norm, dct_type,
-                 cuda_stream, cl_queue):
+                 cuda_stream, cl_queue, compute_dtype=None, axes=None):
     if backend in [Backend.PYCUDA, Backend.CUPY]:
-        return VkFFTApp_cuda(shape, dtype, ndim=ndim, inplace=inplace,
-                             stream=cuda_stream, norm=norm, dct=dct_type)
+        VkFFTApp_cuda = _backend_module('cuda').VkFFTApp
+        return VkFFTApp_cuda(shape, dtype, ndim=ndim, inplace=inplace, axes=axes,
+                             stream=cuda_stream, norm=norm, dct=dct_type, compute_dtype=compute_dtype)
     elif backend == Backend.PYOPENCL:
-        return VkFFTApp_cl(shape, dtype, cl_queue, ndim=ndim, inplace=inplace,
-                           norm=norm, dct=dct_type)
+        VkFFTApp_cl = _backend_module('opencl').VkFFTApp
+        return VkFFTApp_cl(shape, dtype, cl_queue, ndim=ndim, inplace=inplace, axes=axes,
+                           norm=norm, dct=dct_type, compute_dtype=compute_dtype)
 
 
+@_cached_app('dst')
+def _get_dst_app(backend, shape, dtype, inplace, ndim, norm, dst_type,
+                 cuda_stream, cl_queue, compute_dtype=None, axes=None):
+    if backend in [Backend.PYCUDA, Backend.CUPY]:
+        VkFFTApp_cuda = _backend_module('cuda').VkFFTApp
+        return VkFFTApp_cuda(shape, dtype, ndim=ndim, inplace=inplace, axes=axes,
+                             stream=cuda_stream, norm=norm, dst=dst_type, compute_dtype=compute_dtype)
+    elif backend == Backend.PYOPENCL:
+        VkFFTApp_cl = _backend_module('opencl').VkFFTApp
+        return VkFFTApp_cl(shape, dtype, cl_queue, ndim=ndim, inplace=inplace, axes=axes,
+                           norm=norm, dst=dst_type, compute_dtype=compute_dtype)
+
+
+@_cuda_array_interop
 def fftn(src, dest=None, ndim=None, norm=1, axes=None, cuda_stream=None, cl_queue=None,
-         return_scale=False):
+         return_scale=False, compute_dtype=None):
     """
     Perform a FFT on a GPU array, automatically creating the VkFFTApp
     and caching it for future re-use.
 
-    :param src: the source pycuda.gpuarray.GPUArray or cupy.ndarray
+    :param src: the source pycuda.gpuarray.GPUArray, cupy.ndarray or pyopencl.array.Array,
+        or any CUDA array exporting __cuda_array_interface__ or __dlpack__ (e.g. pytorch),
+        in which case the result is returned with the same type if possible
     :param dest: the destination GPU array. If None, a new GPU array will
         be created and returned (using the source array allocator
         (pycuda, pyopencl) if available).
@@ -189,10 +539,16 @@ def fftn(src, dest=None, ndim=None, norm=1, axes=None, cuda_stream=None, cl_queu
         the source array default queue will be used
     :param return_scale: if True, return the scale factor by which the result
         must be multiplied to keep its L2 norm after the transform
+    :param compute_dtype: the dtype used for the calculations, if it should be
+        different from the source one. This can be np.complex64 for a complex32
+        source array (half precision storage, only for out-of-place transforms),
+        or np.complex128 for a complex64 source array (single precision storage
+        with double precision calculations, for an accuracy close to double precision).
     :return: the destination array if return_scale is False, or (dest, scale)
     """
     backend, inplace, dest, cl_queue = _prepare_transform(src, dest, cl_queue, False)
-    app = _get_fft_app(backend, src.shape, src.dtype, inplace, ndim, axes, norm, cuda_stream, cl_queue)
+    app = _get_fft_app(backend, src.shape, src.dtype, inplace, ndim, axes, norm, cuda_stream, cl_queue,
+                       compute_dtype)
     app.fft(src, dest)
     if return_scale:
         s = app.get_fft_scale()
@@ -200,13 +556,16 @@ def fftn(src, dest=None, ndim=None, norm=1, axes=None, cuda_stream=None, cl_queu
     return dest
 
 
+@_cuda_array_interop
 def ifftn(src, dest=None, ndim=None, norm=1, axes=None, cuda_stream=None, cl_queue=None,
-          return_scale=False):
+          return_scale=False, compute_dtype=None):
     """
     Perform an inverse FFT on a GPU array, automatically creating the VkFFTApp
     and caching it for future re-use.
 
-    :param src: the source pycuda.gpuarray.GPUArray or cupy.ndarray
+    :param src: the source pycuda.gpuarray.GPUArray, cupy.ndarray or pyopencl.array.Array,
+        or any CUDA array exporting __cuda_array_interface__ or __dlpack__ (e.g. pytorch),
+        in which case the result is returned with the same type if possible
     :param dest: the destination GPU array. If None, a new GPU array will
         be created and returned (using the source array allocator
         (pycuda, pyopencl) if available).
@@ -232,10 +591,16 @@ def ifftn(src, dest=None, ndim=None, norm=1, axes=None, cuda_stream=None, cl_que
         the source array default queue will be used
     :param return_scale: if True, return the scale factor by which the result
         must be multiplied to keep its L2 norm after the transform
+    :param compute_dtype: the dtype used for the calculations, if it should be
+        different from the source one. This can be np.complex64 for a complex32
+        source array (half precision storage, only for out-of-place transforms),
+        or np.complex128 for a complex64 source array (single precision storage
+        with double precision calculations, for an accuracy close to double precision).
     :return: the destination array if return_scale is False, or (dest, scale)
     """
     backend, inplace, dest, cl_queue = _prepare_transform(src, dest, cl_queue, False)
-    app = _get_fft_app(backend, src.shape, src.dtype, inplace, ndim, axes, norm, cuda_stream, cl_queue)
+    app = _get_fft_app(backend, src.shape, src.dtype, inplace, ndim, axes, norm, cuda_stream, cl_queue,
+                       compute_dtype)
     app.ifft(src, dest)
     if return_scale:
         s = app.get_fft_scale()
@@ -243,8 +608,9 @@ def ifftn(src, dest=None, ndim=None, norm=1, axes=None, cuda_stream=None, cl_que
     return dest
 
 
+@_cuda_array_interop
 def rfftn(src, dest=None, ndim=None, norm=1, cuda_stream=None, cl_queue=None,
-          return_scale=False):
+          return_scale=False, compute_dtype=None):
     """
     Perform a real->complex transform on a GPU array, automatically creating
     the VkFFTApp and caching it for future re-use.
@@ -254,7 +620,9 @@ def rfftn(src, dest=None, ndim=None, norm=1, cuda_stream=None, cl_queue=None,
     last two values along the last (X) axis are ignored, and the destination
     array will have a shape of (..., nx//2+1).
 
-    :param src: the source pycuda.gpuarray.GPUArray or cupy.ndarray
+    :param src: the source pycuda.gpuarray.GPUArray, cupy.ndarray or pyopencl.array.Array,
+        or any CUDA array exporting __cuda_array_interface__ or __dlpack__ (e.g. pytorch),
+        in which case the result is returned with the same type if possible
     :param dest: the destination GPU array. If None, a new GPU array will
         be created and returned (using the source array allocator
         (pycuda, pyopencl) if available).
@@ -277,12 +645,16 @@ def rfftn(src, dest=None, ndim=None, norm=1, cuda_stream=None, cl_queue=None,
         the source array default queue will be used
     :param return_scale: if True, return the scale factor by which the result
         must be multiplied to keep its L2 norm after the transform
+    :param compute_dtype: the dtype used for the calculations, if it should be
+        different from the real source one. This can be np.float64 for a float32
+        source array (single precision storage with double precision calculations).
     :return: the destination array if return_scale is False, or (dest, scale).
         For an in-place transform, the returned value is a view of the array
         with the appropriate type.
     """
     backend, inplace, dest, cl_queue, dtype = _prepare_transform(src, dest, cl_queue, True)
-    app = _get_rfft_app(backend, src.shape, src.dtype, inplace, ndim, norm, cuda_stream, cl_queue)
+    app = _get_rfft_app(backend, src.shape, src.dtype, inplace, ndim, norm, cuda_stream, cl_queue,
+                        compute_dtype)
     app.fft(src, dest)
     if return_scale:
         s = app.get_fft_scale()
@@ -290,8 +662,9 @@ def rfftn(src, dest=None, ndim=None, norm=1, cuda_stream=None, cl_queue=None,
     return dest.view(dtype=dtype)
 
 
+@_cuda_array_interop
 def irfftn(src, dest=None, ndim=None, norm=1, cuda_stream=None, cl_queue=None,
-           return_scale=False):
+           return_scale=False, compute_dtype=None, preserve_input=False):
     """
     Perform a complex->real transform on a GPU array, automatically creating
     the VkFFTApp and caching it for future re-use.
@@ -300,8 +673,12 @@ def irfftn(src, dest=None, ndim=None, norm=1, cuda_stream=None, cl_queue=None,
     For an in-place transform, if the src array has a shape (..., nx), the
     destination array will have a shape of (..., nx*2) but the last
     two vales along the last axis are used as buffer.
+    Note that for an out-of-place transform with ndim>=2, the source array is
+    modified, unless preserve_input=True.
 
-    :param src: the source pycuda.gpuarray.GPUArray or cupy.ndarray
+    :param src: the source pycuda.gpuarray.GPUArray, cupy.ndarray or pyopencl.array.Array,
+        or any CUDA array exporting __cuda_array_interface__ or __dlpack__ (e.g. pytorch),
+        in which case the result is returned with the same type if possible
     :param dest: the destination GPU array. If None, a new GPU array will
         be created and returned (using the source array allocator
         (pycuda, pyopencl) if available).
@@ -324,12 +701,19 @@ def irfftn(src, dest=None, ndim=None, norm=1, cuda_stream=None, cl_queue=None,
         the source array default queue will be used
     :param return_scale: if True, return the scale factor by which the result
         must be multiplied to keep its L2 norm after the transform
+    :param compute_dtype: the dtype used for the calculations, if it should be
+        different from the real source one. This can be np.float64 for a float32
+        source array (single precision storage with double precision calculations).
+    :param preserve_input: if True (only for an out-of-place transform), the calculations
+        are made in an internal buffer so the source array is not modified. This avoids
+        copying the source array, but uses an internal buffer with the size of the source array.
     :return: the destination array if return_scale is False, or (dest, scale)
         For an in-place transform, the returned value is a view of the array
         with the appropriate type.
     """
     backend, inplace, dest, cl_queue, dtype = _prepare_transform(src, dest, cl_queue, True)
-    app = _get_rfft_app(backend, dest.shape, dest.dtype, inplace, ndim, norm, cuda_stream, cl_queue)
+    app = _get_rfft_app(backend, dest.shape, dest.dtype, inplace, ndim, norm, cuda_stream, cl_queue,
+                        compute_dtype, preserve_input)
     app.ifft(src, dest)
     if return_scale:
         s = app.get_fft_scale()
@@ -337,12 +721,16 @@ def irfftn(src, dest=None, ndim=None, norm=1, cuda_stream=None, cl_queue=None,
     return dest.view(dtype=dtype)
 
 
-def dctn(src, dest=None, ndim=None, norm=1, dct_type=2, cuda_stream=None, cl_queue=None):
+@_cuda_array_interop
+def dctn(src, dest=None, ndim=None, norm=1, dct_type=2, cuda_stream=None, cl_queue=None,
+         compute_dtype=None):
     """
     Perform a real->real Direct Cosine Transform on a GPU array, automatically
     creating the VkFFTApp and caching it for future re-use.
 
-    :param src: the source pycuda.gpuarray.GPUArray or cupy.ndarray
+    :param src: the source pycuda.gpuarray.GPUArray, cupy.ndarray or pyopencl.array.Array,
+        or any CUDA array exporting __cuda_array_interface__ or __dlpack__ (e.g. pytorch),
+        in which case the result is returned with the same type if possible
     :param dest: the destination GPU array. If None, a new GPU array will
         be created and returned (using the source array allocator
         (pycuda, pyopencl) if available).
@@ -361,21 +749,28 @@ def dctn(src, dest=None, ndim=None, norm=1, dct_type=2, cuda_stream=None, cl_que
         for the transform. If None, the default one will be used
     :param cl_queue: the pyopencl.CommandQueue to be used. If None,
         the source array default queue will be used
+    :param compute_dtype: the dtype used for the calculations, if it should be
+        different from the source one. This can be np.float64 for a float32
+        source array (single precision storage with double precision calculations).
     :return: the destination array.
     """
     backend, inplace, dest, cl_queue = _prepare_transform(src, dest, cl_queue, False)
     app = _get_dct_app(backend, src.shape, src.dtype, inplace, ndim, norm,
-                       dct_type, cuda_stream, cl_queue)
+                       dct_type, cuda_stream, cl_queue, compute_dtype)
     app.fft(src, dest)
     return dest
 
 
-def idctn(src, dest=None, ndim=None, norm=1, dct_type=2, cuda_stream=None, cl_queue=None):
+@_cuda_array_interop
+def idctn(src, dest=None, ndim=None, norm=1, dct_type=2, cuda_stream=None, cl_queue=None,
+          compute_dtype=None):
     """
     Perform a real->real inverse Direct Cosine Transform on a GPU array,
     automatically creating the VkFFTApp and caching it for future re-use.
 
-    :param src: the source pycuda.gpuarray.GPUArray or cupy.ndarray
+    :param src: the source pycuda.gpuarray.GPUArray, cupy.ndarray or pyopencl.array.Array,
+        or any CUDA array exporting __cuda_array_interface__ or __dlpack__ (e.g. pytorch),
+        in which case the result is returned with the same type if possible
     :param dest: the destination GPU array. If None, a new GPU array will
         be created and returned (using the source array allocator
         (pycuda, pyopencl) if available).
@@ -394,16 +789,227 @@ def idctn(src, dest=None, ndim=None, norm=1, dct_type=2, cuda_stream=None, cl_qu
         for the transform. If None, the default one will be used
     :param cl_queue: the pyopencl.CommandQueue to be used. If None,
         the source array default queue will be used
+    :param compute_dtype: the dtype used for the calculations, if it should be
+        different from the source one. This can be np.float64 for a float32
+        source array (single precision storage with double precision calculations).
     :return: the destination array.
     """
     backend, inplace, dest, cl_queue = _prepare_transform(src, dest, cl_queue, False)
     app = _get_dct_app(backend, src.shape, src.dtype, inplace, ndim, norm,
-                       dct_type, cuda_stream, cl_queue)
+                       dct_type, cuda_stream, cl_queue, compute_dtype)
+    app.ifft(src, dest)
+    return dest
+
+
+@_cuda_array_interop
+def dstn(src, dest=None, ndim=None, norm=1, dst_type=2, cuda_stream=None, cl_queue=None,
+         compute_dtype=None):
+    """
+    Perform a real->real Direct Sine Transform on a GPU array, automatically
+    creating the VkFFTApp and caching it for future re-use.
+
+    :param src: the source pycuda.gpuarray.GPUArray, cupy.ndarray or pyopencl.array.Array,
+        or any CUDA array exporting __cuda_array_interface__ or __dlpack__ (e.g. pytorch),
+        in which case the result is returned with the same type if possible
+    :param dest: the destination GPU array. If None, a new GPU array will
+        be created and returned (using the source array allocator
+        (pycuda, pyopencl) if available).
+        If dest is the same array as src, an inplace transform is done.
+    :param ndim: the number of dimensions (<=3) to use for the FFT. By default,
+        uses the array dimensions. Can be smaller, e.g. ndim=2 for a 3D
+        array to perform a batched 3D FFT on all the layers. The FFT
+        is always performed along the last axes if the array's number
+        of dimension is larger than ndim, i.e. on the x-axis for ndim=1,
+        on the x and y axes for ndim=2.
+    :param norm: normalisation mode, either 0 (un-normalised) or
+        1 (the default, also available as "backward) which will normalise
+        the inverse transform, so DST+iDST will keep the array norm.
+    :param dst_type: the type of dst desired: 1, 2 (default), 3 or 4
+    :param cuda_stream: the pycuda.driver.Stream or cupy.cuda.Stream to use
+        for the transform. If None, the default one will be used
+    :param cl_queue: the pyopencl.CommandQueue to be used. If None,
+        the source array default queue will be used
+    :param compute_dtype: the dtype used for the calculations, if it should be
+        different from the source one. This can be np.float64 for a float32
+        source array (single precision storage with double precision calculations).
+    :return: the destination array.
+    """
+    backend, inplace, dest, cl_queue = _prepare_transform(src, dest, cl_queue, False)
+    app = _get_dst_app(backend, src.shape, src.dtype, inplace, ndim, norm,
+                       dst_type, cuda_stream, cl_queue, compute_dtype)
+    app.fft(src, dest)
+    return dest
+
+
+@_cuda_array_interop
+def idstn(src, dest=None, ndim=None, norm=1, dst_type=2, cuda_stream=None, cl_queue=None,
+          compute_dtype=None):
+    """
+    Perform a real->real inverse Direct Sine Transform on a GPU array,
+    automatically creating the VkFFTApp and caching it for future re-use.
+
+    :param src: the source pycuda.gpuarray.GPUArray, cupy.ndarray or pyopencl.array.Array,
+        or any CUDA array exporting __cuda_array_interface__ or __dlpack__ (e.g. pytorch),
+        in which case the result is returned with the same type if possible
+    :param dest: the destination GPU array. If None, a new GPU array will
+        be created and returned (using the source array allocator
+        (pycuda, pyopencl) if available).
+        If dest is the same array as src, an inplace transform is done.
+    :param ndim: the number of dimensions (<=3) to use for the FFT. By default,
+        uses the array dimensions. Can be smaller, e.g. ndim=2 for a 3D
+        array to perform a batched 3D FFT on all the layers. The FFT
+        is always performed along the last axes if the array's number
+        of dimension is larger than ndim, i.e. on the x-axis for ndim=1,
+        on the x and y axes for ndim=2.
+    :param norm: normalisation mode, either 0 (un-normalised) or
+        1 (the default, also available as "backward) which will normalise
+        the inverse transform, so DST+iDST will keep the array norm.
+    :param dst_type: the type of dst desired: 1, 2 (default), 3 or 4
+    :param cuda_stream: the pycuda.driver.Stream or cupy.cuda.Stream to use
+        for the transform. If None, the default one will be used
+    :param cl_queue: the pyopencl.CommandQueue to be used. If None,
+        the source array default queue will be used
+    :param compute_dtype: the dtype used for the calculations, if it should be
+        different from the source one. This can be np.float64 for a float32
+        source array (single precision storage with double precision calculations).
+    :return: the destination array.
+    """
+    backend, inplace, dest, cl_queue = _prepare_transform(src, dest, cl_queue, False)
+    app = _get_dst_app(backend, src.shape, src.dtype, inplace, ndim, norm,
+                       dst_type, cuda_stream, cl_queue, compute_dtype)
     app.ifft(src, dest)
     return dest
 
 
-def clear_vkfftapp_cache():
-    """ Remove all cached VkFFTApp"""
-    _get_fft_app.cache_clear()
-    _get_rfft_app.cache_clear()
+def _parse_r2r_kind(kind):
+    """
+    Parse a real->real transform kind.
+
+    :param kind: a string, from 'dct1' to 'dct4' or from 'dst1' to 'dst4'
+    :return: a tuple ('dct' or 'dst', type)
+    """
+    k = str(kind).lower()
+    if len(k) == 4 and k[:3] in ('dct', 'dst') and k[3] in '1234':
+        return k[:3], int(k[3])
+    raise RuntimeError("Unknown R2R transform kind: %s (should be 'dct1'...'dct4' or 'dst1'...'dst4')" % str(kind))
+
+
+def _r2rn(src, dest, kinds, axes, norm, cuda_stream, cl_queue, compute_dtype, inverse):
+    """
+    Perform a real->real transform with a DCT or DST kind per axis. See r2rn() for the parameters.
+    VkFFT uses a single transform type for all the axes of a plan, so the axes are grouped
+    by kind, and one cached VkFFTApp is used for each group.
+    """
+    if axes is None:
+        if isinstance(kinds, str):
+            axes = list(range(src.ndim))
+        else:
+            axes = list(range(src.ndim - len(kinds), src.ndim))
+    axes = [ax % src.ndim for ax in axes]
+    if isinstance(kinds, str):
+        kinds = [kinds] * len(axes)
+    if len(kinds) != len(axes):
+        raise RuntimeError("r2rn: the number of kinds (%d) and axes (%d) differ" % (len(kinds), len(axes)))
+    # Group axes by transform kind, keeping the order of first appearance
+    groups = {}
+    for kind, ax in zip(kinds, axes):
+        groups.setdefault(_parse_r2r_kind(kind), []).append(ax)
+
+    backend, inplace, dest, cl_queue = _prepare_transform(src, dest, cl_queue, False)
+    for (kind, t), gaxes in groups.items():
+        get_app = _get_dct_app if kind == 'dct' else _get_dst_app
+        app = get_app(backend, src.shape, src.dtype, inplace, None, norm, t, cuda_stream, cl_queue,
+                      compute_dtype, axes=tuple(gaxes))
+        if inverse:
+            app.ifft(src, None if inplace else dest)
+        else:
+            app.fft(src, None if inplace else dest)
+        # Subsequent groups are transformed in-place in the destination array
+        src = dest
+        inplace = True
+    return dest
+
+
+@_cuda_array_interop
+def r2rn(src, dest=None, kinds='dct2', axes=None, norm=1, cuda_stream=None, cl_queue=None,
+         compute_dtype=None):
+    """
+    Perform a real->real transform on a GPU array with a DCT or DST type which
+    can be different for each axis (e.g. for mixed boundary conditions),
+    automatically creating the VkFFTApp(s) and caching them for future re-use.
+
+    :param src: the source pycuda.gpuarray.GPUArray, cupy.ndarray or pyopencl.array.Array,
+        or any CUDA array exporting __cuda_array_interface__ or __dlpack__ (e.g. pytorch),
+        in which case the result is returned with the same type if possible
+    :param dest: the destination GPU array. If None, a new GPU array will
+        be created and returned (using the source array allocator
+        (pycuda, pyopencl) if available).
+        If dest is the same array as src, an inplace transform is done.
+    :param kinds: the transform kind, either a single string used for all axes,
+        or a list of strings with one value per axis. Each kind can be
+        'dct1', 'dct2', 'dct3', 'dct4', 'dst1', 'dst2', 'dst3' or 'dst4'.
+    :param axes: a list or tuple of axes along which the transform is made,
+        corresponding to the kinds. If None, all axes are used if kinds is a
+        single string, otherwise the last len(kinds) axes.
+    :param norm: normalisation mode, either 0 (un-normalised) or
+        1 (the default, also available as "backward) which will normalise
+        the inverse transform, so r2rn+ir2rn will keep the array norm.
+    :param cuda_stream: the pycuda.driver.Stream or cupy.cuda.Stream to use
+        for the transform. If None, the default one will be used
+    :param cl_queue: the pyopencl.CommandQueue to be used. If None,
+        the source array default queue will be used
+    :param compute_dtype: the dtype used for the calculations, if it should be
+        different from the source one. This can be np.float64 for a float32
+        source array (single precision storage with double precision calculations).
+    :return: the destination array.
+    """
+    return _r2rn(src, dest, kinds, axes, norm, cuda_stream, cl_queue, compute_dtype, False)
+
+
+@_cuda_array_interop
+def ir2rn(src, dest=None, kinds='dct2', axes=None, norm=1, cuda_stream=None, cl_queue=None,
+          compute_dtype=None):
+    """
+    Perform the inverse of r2rn(), i.e. a real->real inverse transform on a GPU array
+    with a DCT or DST type which can be different for each axis, automatically
+    creating the VkFFTApp(s) and caching them for future re-use.
+
+    :param src: the source pycuda.gpuarray.GPUArray, cupy.ndarray or pyopencl.array.Array,
+        or any CUDA array exporting __cuda_array_interface__ or __dlpack__ (e.g. pytorch),
+        in which case the result is returned with the same type if possible
+    :param dest: the destination GPU array. If None, a new GPU array will
+        be created and returned (using the source array allocator
+        (pycuda, pyopencl) if available).
+        If dest is the same array as src, an inplace transform is done.
+    :param kinds: the transform kind, either a single string used for all axes,
+        or a list of strings with one value per axis. Each kind can be
+        'dct1', 'dct2', 'dct3', 'dct4', 'dst1', 'dst2', 'dst3' or 'dst4'.
+    :param axes: a list or tuple of axes along which the transform is made,
+        corresponding to the kinds. If None, all axes are used if kinds is a
+        single string, otherwise the last len(kinds) axes.
+    :param norm: normalisation mode, either 0 (un-normalised) or
+        1 (the default, also available as "backward) which will normalise
+        the inverse transform, so r2rn+ir2rn will keep the array norm.
+    :param cuda_stream: the pycuda.driver.Stream or cupy.cuda.Stream to use
+        for the transform. If None, the default one will be used
+    :param cl_queue: the pyopencl.CommandQueue to be used. If None,
+        the source array default queue will be used
+    :param compute_dtype: the dtype used for the calculations, if it should be
+        different from the source one. This can be np.float64 for a float32
+        source array (single precision storage with double precision calculations).
+    :return: the destination array.
+    """
+    return _r2rn(src, dest, kinds, axes, norm, cuda_stream, cl_queue, compute_dtype, True)
+
+
+def clear_vkfftapp_cache(kind=None, context=None):
+    """ Remove cached VkFFTApp, by default all of them.
+
+    :param kind: if given, only remove VkFFTApp for this kind of transform,
+        among 'fft', 'rfft', 'dct' and 'dst'.
+    :param context: if given, only remove VkFFTApp using this pyopencl.Context
+        or pycuda.driver.Context. This should be used before destroying a context.
+        VkFFTApp created for cupy arrays do not record their context, so they are
+        only removed when context is None.
+    """
+    vkfftapp_cache.clear(kind=kind, context=context)
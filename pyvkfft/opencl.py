@@ -7,10 +7,11 @@
 
 import warnings
 import ctypes
+import timeit
 import numpy as np
 import pyopencl as cl
 import pyopencl.array as cla
-from .base import load_library, primes, VkFFTApp as VkFFTAppBase, VkFFTResult, check_vkfft_result
+from .base import load_library, primes, VkFFTApp as VkFFTAppBase, _profiled, VkFFTResult, check_vkfft_result
 
 _vkfft_opencl = load_library("_vkfft_opencl")
 
@@ -24,9 +25,10 @@ class _types:
 _vkfft_opencl.make_config.restype = ctypes.c_void_p
 _vkfft_opencl.make_config.argtypes = [ctypes.c_size_t, ctypes.c_size_t, ctypes.c_size_t, ctypes.c_size_t,
                                       ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p,
-                                      ctypes.c_void_p, ctypes.c_int, ctypes.c_size_t, ctypes.c_int,
+                                      ctypes.c_void_p, ctypes.c_int, ctypes.c_size_t, ctypes.c_size_t,
                                       ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int,
-                                      ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int]
+                                      ctypes.c_int, ctypes.c_int, ctypes.c_size_t, ctypes.c_int, ctypes.c_int,
+                                      ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int]
 
 _vkfft_opencl.init_app.restype = ctypes.c_void_p
 _vkfft_opencl.init_app.argtypes = [_types.vkfft_config, ctypes.c_void_p, ctypes.POINTER(ctypes.c_int)]
@@ -43,6 +45,25 @@ _vkfft_opencl.free_app.argtypes = [_types.vkfft_app]
 _vkfft_opencl.free_config.restype = None
 _vkfft_opencl.free_config.argtypes = [_types.vkfft_config]
 
+_vkfft_opencl.get_buffer_nbytes.restype = ctypes.c_size_t
+_vkfft_opencl.get_buffer_nbytes.argtypes = [_types.vkfft_app]
+
+_vkfft_opencl.get_nb_dispatch.restype = ctypes.c_size_t
+_vkfft_opencl.get_nb_dispatch.argtypes = None
+
+_vkfft_opencl.set_profiling.restype = None
+_vkfft_opencl.set_profiling.argtypes = [ctypes.c_int]
+
+_vkfft_opencl.get_dispatch_profile.restype = ctypes.c_int
+_vkfft_opencl.get_dispatch_profile.argtypes = [ctypes.c_size_t, ctypes.POINTER(ctypes.c_size_t),
+                                    ctypes.POINTER(ctypes.c_size_t), ctypes.POINTER(ctypes.c_double)]
+
+_vkfft_opencl.get_init_profile.restype = ctypes.c_size_t
+_vkfft_opencl.get_init_profile.argtypes = [ctypes.POINTER(ctypes.c_double)]
+
+_vkfft_opencl.dst_supported.restype = ctypes.c_int
+_vkfft_opencl.dst_supported.argtypes = None
+
 _vkfft_opencl.vkfft_version.restype = ctypes.c_uint32
 _vkfft_opencl.vkfft_version.argtypes = None
 
@@ -53,7 +74,8 @@ class VkFFTApp(VkFFTAppBase):
     """
 
     def __init__(self, shape, dtype: type, queue: cl.CommandQueue, ndim=None, inplace=True, norm=1,
-                 r2c=False, dct=False, axes=None, **kwargs):
+                 r2c=False, dct=False, axes=None, compute_dtype=None, dst=False, preserve_input=False,
+                 **kwargs):
         """
         Init function for the VkFFT application.
 
@@ -86,35 +108,60 @@ class VkFFTApp(VkFFTAppBase):
             For an out-of-place transform, if the input (real) shape is (..., nx),
             the output (complex) shape should be (..., nx//2+1).
             Note that for C2R transforms with ndim>=2, the source (complex) array
-            is modified.
+            is modified, unless preserve_input=True.
         :param dct: used to perform a Direct Cosine Transform (DCT) aka a R2R transform.
             An integer can be given to specify the type of DCT (1, 2, 3 or 4).
             if dct=True, the DCT type 2 will be performed, following scipy's convention.
         :param axes: a list or tuple of axes along which the transform should be made.
             if None, the transform is done along the ndim fastest axes, or all
             axes if ndim is None. Not allowed for R2C transforms
+        :param compute_dtype: the dtype used for the calculations, if it should be
+            different from the storage one (dtype). If None, the same precision
+            is used for storage and calculations. The following combinations are
+            supported: complex32 storage with complex64 calculations
+            (half precision memory only, out-of-place C2C transforms only), and
+            complex64 (or float32) storage with complex128 (or float64) calculations,
+            which gives an accuracy close to double precision without doubling
+            the memory used by the arrays.
+        :param dst: used to perform a Direct Sine Transform (DST) aka a R2R transform.
+            An integer can be given to specify the type of DST (1, 2, 3 or 4).
+            if dst=True, the DST type 2 will be performed, following scipy's convention.
+            This requires a VkFFT version >= 1.3.0.
+        :param preserve_input: if True, for an out-of-place transform the calculations are
+            made in an internal buffer allocated with the VkFFT application, so that the source
+            array is never modified. This is useful for C2R transforms with ndim>=2, where VkFFT
+            would otherwise use the source array as work buffer.
         :raises RuntimeError: if the initialisation fails, e.g. if the GPU
             driver has not been properly initialised, or if the transform dimensions
             are not allowed by VkFFT.
         """
-        super().__init__(shape, dtype, ndim=ndim, inplace=inplace, norm=norm, r2c=r2c, dct=dct, axes=axes, **kwargs)
+        t0 = timeit.default_timer()
+        super().__init__(shape, dtype, ndim=ndim, inplace=inplace, norm=norm, r2c=r2c, dct=dct, axes=axes,
+                         compute_dtype=compute_dtype, dst=dst, preserve_input=preserve_input, **kwargs)
+        if self.dst and not dst_supported():
+            raise RuntimeError("DST transforms require VkFFT>=1.3.0, but pyvkfft was built with VkFFT %s"
+                               % vkfft_version())
 
         self.queue = queue
 
         if self.precision == 2 and 'cl_khr_fp16' not in self.queue.device.extensions:
             raise RuntimeError("Half precision required but cl_khr_fp16 extension is not available")
-        if self.precision == 8 and 'cl_khr_fp64' not in self.queue.device.extensions:
+        if self.compute_precision == 8 and 'cl_khr_fp64' not in self.queue.device.extensions:
             raise RuntimeError("Double precision required but cl_khr_fp64 extension is not available")
 
+        self._apply_tuning("opencl", kwargs, vkfft_version())
+        t1 = timeit.default_timer()
         self.config = self._make_config()
+        t_config = timeit.default_timer() - t1
 
         if self.config is None:
             raise RuntimeError("Error creating VkFFTConfiguration. Was the OpenCL context properly initialised ?")
         res = ctypes.c_int(0)
         self.app = _vkfft_opencl.init_app(self.config, queue.int_ptr, ctypes.byref(res))
-        check_vkfft_result(res, shape, dtype, ndim, inplace, norm, r2c, dct, axes, "opencl")
+        check_vkfft_result(res, shape, dtype, ndim, inplace, norm, r2c, dct, axes, "opencl", dst)
         if self.app is None:
             raise RuntimeError("Error creating VkFFTApplication. Was the OpenCL context properly initialised ?")
+        self._set_plan_timings(t0, t_config, _vkfft_opencl.get_init_profile)
 
     def __del__(self):
         """ Takes care of deleting allocated memory in the underlying
@@ -125,6 +172,57 @@ class VkFFTApp(VkFFTAppBase):
         if self.config is not None:
             _vkfft_opencl.free_config(self.config)
 
+    def get_buffer_nbytes(self):
+        """
+        Get the size of the GPU buffers allocated by this VkFFTApp, i.e. the internal
+        calculation buffer (e.g. with preserve_input=True) and the VkFFT temporary buffer.
+        This does not include the arrays given to fft() and ifft().
+
+        :return: the number of bytes allocated
+        """
+        if self.app is None:
+            return 0
+        return _vkfft_opencl.get_buffer_nbytes(self.app)
+
+    def get_nb_dispatch(self):
+        """
+        Get the number of GPU kernels launched by the last fft() or ifft() call
+        made in the current thread, including the scaling for norm='ortho'. Each kernel
+        reads and writes the array once, so this can be used to estimate the memory
+        bandwidth actually achieved by the transform.
+
+        :return: the number of kernels launched
+        """
+        return _vkfft_opencl.get_nb_dispatch() + int(self.norm == "ortho")
+
+    def enable_profiling(self, enable=True):
+        """
+        Enable (or disable) the profiling of the GPU kernels launched by fft() and ifft(),
+        see pyvkfft.base.VkFFTApp.enable_profiling().
+
+        :param enable: True to enable the profiling, False to disable it
+        :raises RuntimeError: if the queue was not created with
+            cl.command_queue_properties.PROFILING_ENABLE
+        """
+        if enable and not self.queue.properties & cl.command_queue_properties.PROFILING_ENABLE:
+            raise RuntimeError("VkFFTApp.enable_profiling: the queue must be created with "
+                               "cl.command_queue_properties.PROFILING_ENABLE")
+        super().enable_profiling(enable)
+
+    def _get_gpu_name(self):
+        return self.queue.device.name
+
+    def _set_profiling(self, enable):
+        _vkfft_opencl.set_profiling(int(enable))
+
+    def _get_dispatch_profile(self, i):
+        grid, block, t = (ctypes.c_size_t * 3)(), (ctypes.c_size_t * 3)(), (ctypes.c_double * 2)()
+        res = _vkfft_opencl.get_dispatch_profile(i, grid, block, t)
+        if res:
+            raise RuntimeError("VkFFTApp: could not get the profiling information for kernel #%d "
+                               "(OpenCL error code: %d)" % (i, res))
+        return tuple(grid), tuple(block), tuple(t)
+
     def _make_config(self):
         """ Create a vkfft configuration for a FFT transform"""
         nx, ny, nz, n_batch = self.shape
@@ -150,11 +248,13 @@ class VkFFTApp(VkFFTAppBase):
 
         return _vkfft_opencl.make_config(nx, ny, nz, self.ndim, 1, dest_gpudata, platform.int_ptr,
                                          device.int_ptr, ctx.int_ptr,
-                                         norm, self.precision, int(self.r2c), int(self.dct),
-                                         int(self.disableReorderFourStep), int(self.registerBoost),
+                                         norm, self.precision, self.compute_precision, int(self.r2c), int(self.dct),
+                                         int(self.dst), int(self.disableReorderFourStep), int(self.registerBoost),
                                          int(self.use_lut), int(self.keepShaderCode),
-                                         n_batch, skipx, skipy, skipz)
+                                         n_batch, skipx, skipy, skipz, int(self.preserve_input),
+                                         int(self.coalescedMemory), int(self.aimThreads), int(self.numSharedBanks))
 
+    @_profiled
     def fft(self, src: cla.Array, dest: cla.Array = None):
         """
         Compute the forward FFT
@@ -170,7 +270,7 @@ class VkFFTApp(VkFFTAppBase):
                     raise RuntimeError("VkFFTApp.fft: dest is not None but this is an inplace transform")
             res = _vkfft_opencl.fft(self.app, int(src.data.int_ptr), int(src.data.int_ptr), int(self.queue.int_ptr))
             check_vkfft_result(res, src.shape, src.dtype, self.ndim, self.inplace, self.norm, self.r2c,
-                               self.dct, backend="opencl")
+                               self.dct, backend="opencl", dst=self.dst)
             if self.norm == "ortho":
                 src *= self._get_fft_scale(norm=0)
             if self.r2c:
@@ -188,11 +288,12 @@ class VkFFTApp(VkFFTAppBase):
                 assert (dest.size == src.size // src.shape[-1] * (src.shape[-1] // 2 + 1))
             res = _vkfft_opencl.fft(self.app, int(src.data.int_ptr), int(dest.data.int_ptr), int(self.queue.int_ptr))
             check_vkfft_result(res, src.shape, src.dtype, self.ndim, self.inplace, self.norm, self.r2c,
-                               self.dct, backend="opencl")
+                               self.dct, backend="opencl", dst=self.dst)
             if self.norm == "ortho":
                 dest *= self._get_fft_scale(norm=0)
             return dest
 
+    @_profiled
     def ifft(self, src: cla.Array, dest: cla.Array = None):
         """
         Compute the backward FFT
@@ -208,7 +309,7 @@ class VkFFTApp(VkFFTAppBase):
                     raise RuntimeError("VkFFTApp.fft: dest!=src but this is an inplace transform")
             res = _vkfft_opencl.ifft(self.app, int(src.data.int_ptr), int(src.data.int_ptr), int(self.queue.int_ptr))
             check_vkfft_result(res, src.shape, src.dtype, self.ndim, self.inplace, self.norm, self.r2c,
-                               self.dct, backend="opencl")
+                               self.dct, backend="opencl", dst=self.dst)
             if self.norm == "ortho":
                 src *= self._get_ifft_scale(norm=0)
             if self.r2c:
@@ -222,22 +323,32 @@ class VkFFTApp(VkFFTAppBase):
                 raise RuntimeError("VkFFTApp.ifft: dest is None but this is an out-of-place transform")
             elif src.data.int_ptr == dest.data.int_ptr:
                 raise RuntimeError("VkFFTApp.ifft: dest and src are identical but this is an out-of-place transform")
-            if self.r2c:
-                assert (src.size == dest.size // dest.shape[-1] * (dest.shape[-1] // 2 + 1))
-                # Special case, src and dest buffer sizes are different,
-                # VkFFT is configured to go back to the source buffer
+            if self.r2c or self.half_memory_only or self.preserve_input:
+                if self.r2c:
+                    assert (src.size == dest.size // dest.shape[-1] * (dest.shape[-1] // 2 + 1))
+                # Special case, src and dest buffer sizes are different (R2C), or the calculations
+                # use a separate buffer (half precision storage or preserve_input), VkFFT is
+                # configured to go back to the source buffer
                 res = _vkfft_opencl.ifft(self.app, int(dest.data.int_ptr), int(src.data.int_ptr),
                                          int(self.queue.int_ptr))
             else:
                 res = _vkfft_opencl.ifft(self.app, int(src.data.int_ptr), int(dest.data.int_ptr),
                                          int(self.queue.int_ptr))
             check_vkfft_result(res, src.shape, src.dtype, self.ndim, self.inplace, self.norm, self.r2c,
-                               self.dct, backend="opencl")
+                               self.dct, backend="opencl", dst=self.dst)
             if self.norm == "ortho":
                 dest *= self._get_ifft_scale(norm=0)
             return dest
 
 
+def dst_supported():
+    """
+    Check if DST transforms are supported, which requires pyvkfft to be built with VkFFT>=1.3.0
+    :return: True if DST transforms are supported
+    """
+    return bool(_vkfft_opencl.dst_supported())
+
+
 def vkfft_version():
     """
     Get VkFFT version
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+# PyVkFFT
+#   (c) 2022- : ESRF-European Synchrotron Radiation Facility
+#       authors:
+#         Vincent Favre-Nicolin, favre@esrf.fr
+#
+#
+# pyvkfft script to run benchmarks
+
+import argparse
+import sys
+import numpy as np
+from pyvkfft.accuracy import has_opencl, has_pycuda, has_cupy
+from pyvkfft.base import complex32
+from pyvkfft.benchmark import benchmark, batch_shapes, result_str, save_json, save_csv, chrome_trace, \
+    copy_bandwidth, low_efficiency, plan_summary
+from pyvkfft.tune import tune
+
+
+def main(argv=None):
+    """
+    Run the benchmarks.
+
+    :param argv: the command-line arguments (without the program name).
+        If None, sys.argv[1:] is used.
+    :return: the exit code (0 if all benchmarks were run successfully)
+    """
+    epilog = "Examples:\n" \
+             "  pyvkfft-benchmark --backend cupy --ndim 2 --range 32 2048\n" \
+             "      Benchmark batched 2D C2C transforms with N=32 to 2048 (radix sizes),\n" \
+             "      printing the median GPU time and idealised throughput\n" \
+             "\n" \
+             "  pyvkfft-benchmark --backend pyopencl pycuda --ndim 3 --range 32 512 --radix-max 7 " \
+             "--r2c --inplace --json bench.json\n" \
+             "      Benchmark inplace 3D R2C transforms with both OpenCL and CUDA, and save\n" \
+             "      all timings to a JSON file\n" \
+             "\n" \
+             "  pyvkfft-benchmark --backend pyopencl --opencl-platform portable --shape 16 256 256 " \
+             "--ndim 2 --csv bench.csv\n" \
+             "      Benchmark a single shape using PoCL on the CPU, and save the results as CSV\n" \
+             "\n" \
+             "  pyvkfft-benchmark --backend cupy --ndim 1 --range 16 4096 --radix-max 4096 --roofline\n" \
+             "      Compare the bandwidth achieved by 1D transforms (including Bluestein ones) to the\n" \
+             "      device copy bandwidth, and list the least efficient sizes\n"
+    parser = argparse.ArgumentParser(prog='pyvkfft-benchmark', epilog=epilog,
+                                     description='Benchmark pyvkfft transforms, measuring separately the '
+                                                 'plan creation, host<->GPU transfers, launch (host) '
+                                                 'and GPU times. Timings are reported as median and '
+                                                 'percentiles over the repeats.',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', action='store', nargs='+', default=None,
+                        choices=['cupy', 'pycuda', 'pyopencl'],
+                        help="GPU backend(s) to benchmark. By default all available ones are used.")
+    parser.add_argument('--gpu', action='store', default=None,
+                        help="Name (or sub-string) of the GPU to use")
+    parser.add_argument('--opencl-platform', action='store', default=None,
+                        help="Name (or sub-string) of the OpenCL platform to use, e.g. 'portable' "
+                             "for PoCL. Non-GPU devices are then also accepted.")
+    parser.add_argument('--ndim', action='store', nargs=1, type=int, default=[2], choices=[1, 2, 3],
+                        help="Number of dimensions for the transforms")
+    parser.add_argument('--range', action='store', nargs=2, type=int, default=[32, 2048],
+                        help="Range of transform lengths along each axis, with a batch dimension adapted "
+                             "to keep an approximately constant array size (see --batch-mb)")
+    parser.add_argument('--radix-max', action='store', nargs=1, type=int, default=[13],
+                        help="Largest prime factor allowed for the transform lengths. Use a value larger "
+                             "than the range maximum to include non-radix (Bluestein) transforms.")
+    parser.add_argument('--batch-mb', action='store', nargs=1, type=float, default=[256],
+                        help="Approximate array size in Mbytes, used to compute the batch size")
+    parser.add_argument('--shape', action='store', nargs='+', type=int, default=None,
+                        help="Benchmark a single array shape (supersedes --range). The transform "
+                             "is done along the last ndim axes.")
+    parser.add_argument('--double', action='store_true', help="Use double precision")
+    parser.add_argument('--half', action='store_true',
+                        help="Use half precision storage with single precision calculations "
+                             "(out-of-place C2C only)")
+    parser.add_argument('--r2c', action='store_true', help="Benchmark real-to-complex transforms")
+    parser.add_argument('--dct', action='store', nargs='?', type=int, const=2, default=False,
+                        help="Benchmark a Direct Cosine Transform (default type: 2)", choices=[1, 2, 3, 4])
+    parser.add_argument('--dst', action='store', nargs='?', type=int, const=2, default=False,
+                        help="Benchmark a Direct Sine Transform (default type: 2)", choices=[1, 2, 3, 4])
+    parser.add_argument('--inplace', action='store_true', help="Use inplace transforms")
+    parser.add_argument('--lut', action='store_true', help="Use a LUT for trigonometric values")
+    parser.add_argument('--norm', action='store', nargs=1, type=int, default=[1], choices=[0, 1])
+    parser.add_argument('--nb-repeat', action='store', nargs=1, type=int, default=[20],
+                        help="Number of timed repeats for each transform and transfer")
+    parser.add_argument('--percentiles', action='store', nargs='+', type=float, default=[10, 90],
+                        help="Percentiles reported in addition to the median")
+    parser.add_argument('--json', action='store', default=None, help="Save the results to this JSON file")
+    parser.add_argument('--csv', action='store', default=None, help="Save the results to this CSV file")
+    parser.add_argument('--trace', action='store', default=None,
+                        help="Profile each VkFFT kernel of one forward and backward transform for each "
+                             "benchmark, and save them to this JSON file using the Chrome trace format "
+                             "(can be displayed with chrome://tracing or https://ui.perfetto.dev)")
+    parser.add_argument('--tune', action='store_true',
+                        help="Before each benchmark, tune the VkFFT parameters for the transform and "
+                             "save them to the tuning database (see pyvkfft.tune), so they are "
+                             "used for the benchmark and all later transforms with the same parameters")
+    parser.add_argument('--roofline', action='store_true',
+                        help="First measure the achievable memory bandwidth of the GPU (using a device-to-device "
+                             "copy), then report the efficiency of each transform as the fraction of this peak "
+                             "bandwidth, using the actual number of read & write passes (kernels) of each "
+                             "transform. The transforms with the lowest efficiency are listed at the end.")
+    parser.add_argument('--plan-breakdown', action='store_true',
+                        help="Print at the end the breakdown of the plan creation time (VkFFT code "
+                             "generation, kernel compilation, buffer allocation), summed over all benchmarks")
+    parser.add_argument('--silent', action='store_true', help="Do not print the results")
+    args = parser.parse_args(argv)
+
+    vbackend = args.backend
+    if vbackend is None:
+        vbackend = [b for b, ok in (("pycuda", has_pycuda), ("cupy", has_cupy), ("pyopencl", has_opencl)) if ok]
+    if not len(vbackend):
+        print("No GPU backend available")
+        return 1
+
+    if args.half:
+        dtype = complex32
+    elif args.r2c or args.dct or args.dst:
+        dtype = np.float64 if args.double else np.float32
+    else:
+        dtype = np.complex128 if args.double else np.complex64
+    ndim = args.ndim[0]
+    if args.shape is not None:
+        vshape = [tuple(args.shape)]
+    else:
+        vshape = batch_shapes(ndim, nmin=args.range[0], nmax=args.range[1], radix_max=args.radix_max[0],
+                              batch_mb=args.batch_mb[0], dtype=dtype, r2c=args.r2c)
+
+    vres = []
+    nb_err = 0
+    for backend in vbackend:
+        peak_gbps = None
+        if args.roofline:
+            peak_gbps = copy_bandwidth(backend, nbytes=int(args.batch_mb[0] * 1024 ** 2), gpu_name=args.gpu,
+                                       opencl_platform=args.opencl_platform)["gbps"]
+            if not args.silent:
+                print("%8s: device copy bandwidth: %8.2f Gbytes/s" % (backend, peak_gbps))
+        for sh in vshape:
+            try:
+                if args.tune:
+                    r = tune(backend, sh, ndim=ndim, dtype=dtype, inplace=args.inplace, norm=args.norm[0],
+                             r2c=args.r2c, dct=args.dct, dst=args.dst, nb_repeat=args.nb_repeat[0],
+                             compute_dtype=np.complex64 if args.half else None, gpu_name=args.gpu,
+                             opencl_platform=args.opencl_platform)
+                    if not args.silent:
+                        print("%8s %20s: tuned parameters %s (%.4fms -> %.4fms)" %
+                              (backend, str(sh).replace(" ", ""), r["params"], r["dt_default"] * 1000,
+                               r["dt"] * 1000))
+                res = benchmark(backend, sh, ndim=ndim, dtype=dtype, inplace=args.inplace, norm=args.norm[0],
+                                r2c=args.r2c, dct=args.dct, dst=args.dst, use_lut=args.lut or None,
+                                compute_dtype=np.complex64 if args.half else None, nb_repeat=args.nb_repeat[0],
+                                percentiles=args.percentiles, gpu_name=args.gpu,
+                                opencl_platform=args.opencl_platform, profile=args.trace is not None,
+                                peak_gbps=peak_gbps)
+            except Exception as ex:
+                print("%8s %20s: benchmark failed: %s" % (backend, str(sh).replace(" ", ""), repr(ex)))
+                nb_err += 1
+                continue
+            vres.append(res)
+            if not args.silent:
+                print(result_str(res))
+            # Save intermediate results, so they are available if the benchmark is interrupted
+            if args.json is not None:
+                save_json(args.json, vres)
+            if args.csv is not None:
+                save_csv(args.csv, vres)
+            if args.trace is not None:
+                chrome_trace({"%s %s %s" % (r["backend"], r["transform"], str(r["shape"]).replace(" ", "")):
+                              r["profile"] for r in vres}, args.trace)
+    if args.roofline and not args.silent and len(vres):
+        print("Transforms with the lowest efficiency:")
+        for res in low_efficiency(vres):
+            print(result_str(res))
+    if args.plan_breakdown and len(vres):
+        r = plan_summary(vres)
+        print("Plan creation: %8.3fs total for %d benchmarks:" % (r["total"], r["nb"]))
+        for k, v in (("config", "configuration"), ("codegen", "code generation"), ("compile", "compilation"),
+                     ("alloc", "buffer allocation"), ("other", "other")):
+            print("  %20s: %8.3fs (%5.1f%%)" % (v, r[k]["time"], r[k]["fraction"] * 100))
+    return int(nb_err > 0)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -165,7 +165,17 @@ def name_next_file(pattern="pyvkfft-test%04d.html"):
     raise RuntimeError("name_next_file: '%s' files all used from 1001 to 1998. Maybe cleanup ?" % pattern)
 
 
-def main():
+def main(argv=None, pool=None):
+    """
+    Run the pyvkfft tests.
+
+    :param argv: the list of command-line arguments. If None, sys.argv[1:] is used.
+    :param pool: a pyvkfft.accuracy.AccuracyTestPool to run the systematic tests,
+        which can be re-used by successive calls. If None, a new pool is used.
+    :return: 0 if all tests succeeded, 1 otherwise
+    """
+    if argv is None:
+        argv = sys.argv[1:]
     t0 = timeit.default_timer()
     localt0 = time.localtime()
     epilog = "Examples:\n" \
@@ -201,7 +211,11 @@ def main():
              "--lut --inplace\n" \
              "      test with cupy backend, only non-radix 2D inplace R2C transforms\n," \
              "      using a lookup table( lut) for higher single precision accuracy.\n" \
-             "      (this automatically limits the x-sizes to even values for the inplace R2C\n"
+             "      (this automatically limits the x-sizes to even values for the inplace R2C\n" \
+             "\n" \
+             "  pyvkfft-test --systematic --backend cupy --radix --range 2 4096 --perf --db\n" \
+             "      Measure the GPU time of radix C2C transforms, store them in the database\n" \
+             "      and report the transforms significantly slower than the previous run\n"
     parser = argparse.ArgumentParser(prog='pyvkfft-test', epilog=epilog,
                                      description='Run pyvkfft unit tests, regular or systematic',
                                      formatter_class=argparse.RawDescriptionHelpFormatter)
@@ -223,9 +237,10 @@ def main():
     parser.add_argument('--mailto_smtp', action='store', default="localhost",
                         help="SMTP server address to mail the results")
     parser.add_argument('--nproc', action='store', nargs=1,
-                        help="Number of parallel process to use to speed up tests. "
-                             "Make sure the sum of parallel process will not use too much "
-                             "GPU memory",
+                        help="Maximum number of parallel process to use to speed up tests. "
+                             "For systematic tests, fewer parallel process are used for large "
+                             "transforms, according to their estimated memory usage and the "
+                             "free GPU and host memory",
                         default=[1], type=int)
     parser.add_argument('--silent', action='store_true',
                         help="Use this to minimise the written output "
@@ -248,19 +263,29 @@ def main():
                         help="Only perform transform with non-radix dimensions, i.e. the "
                              "largest number in the prime decomposition of each array dimension "
                              "must be larger than 13")
+    sysgrp.add_argument('--code-path-sample', action='store', nargs=1, type=int,
+                        help="Only test this number of array shapes for each VkFFT code path "
+                             "(radix or Bluestein, number of uploads, largest radix, register or "
+                             "shared memory kernel - approximately, for each axis), including the "
+                             "smallest and largest shapes for each code path. This reduces the "
+                             "number of tests by an order of magnitude or more.")
     sysgrp.add_argument('--db', nargs='*', action='store',
                         help="Save the results to an sql database. If no filename is"
                              "given, pyvkfft-test.sql will be used. If the file already"
                              "exists, the results are added to the file. Fields stored"
-                             "include HOSTNAME, EPOCH, BACKEND, LANGUAGE, TRANSFORM (c2c, r2c or "
-                             "dct1/2/3/4, AXES, ARRAY_SHAPE, NDIMS, NDIM, PRECISION, INPLACE,"
+                             "include HOSTNAME, EPOCH, BACKEND, LANGUAGE, TRANSFORM (c2c, r2c, "
+                             "dct1/2/3/4 or dst1/2/3/4, AXES, ARRAY_SHAPE, NDIMS, NDIM, PRECISION, INPLACE,"
                              "NORM, LUT, N, N2_FFT, N2_IFFT, NI_FFT, NI_IFFT, TOLERANCE,"
                              "DT_APP, DT_FFT, DT_IFFT, SRC_UNCHANGED_FFT, SRC_UNCHANGED_IFFT, "
-                             "GPU_NAME, SUCCESS, ERROR, VKFFT_ERROR_CODE")
+                             "GPU_NAME, SUCCESS, ERROR, VKFFT_ERROR_CODE, VKFFT_VERSION")
     sysgrp.add_argument('--dct', nargs='*', action='store', type=int,
                         help="Test direct cosine transforms (default is c2c):"
                              " '--dct' (defaults to dct 2), '--dct 1'",
                         choices=[1, 2, 3, 4])
+    sysgrp.add_argument('--dst', nargs='*', action='store', type=int,
+                        help="Test direct sine transforms (default is c2c):"
+                             " '--dst' (defaults to dst 2), '--dst 1'",
+                        choices=[1, 2, 3, 4])
     sysgrp.add_argument('--double', action='store_true',
                         help="Use double precision (float64/complex128) instead of single")
     sysgrp.add_argument('--dry-run', action='store_true',
@@ -293,12 +318,41 @@ def main():
     #                          "as the transform (ndim)",
     #                     type=int, choices=[1, 2, 3, 4])
     sysgrp.add_argument('--norm', action='store', nargs=1, type=int,
-                        help="Normalisation to test (must be 1 for dct)",
+                        help="Normalisation to test (must be 1 for dct and dst)",
                         default=[1], choices=[0, 1])
+    sysgrp.add_argument('--perf', action='store_true',
+                        help="Performance mode: instead of the accuracy, measure the GPU time "
+                             "(using cuda events or OpenCL profiling) of each transform. If --db "
+                             "is used, the timings are stored in the database (pyvkfft_perf table) "
+                             "and compared to the latest stored result for the same configuration "
+                             "and GPU (see --perf-baseline). A test fails if the transform is "
+                             "significantly slower than this baseline. The tests are run serially.")
+    sysgrp.add_argument('--perf-baseline', action='store', nargs=1,
+                        help="VkFFT version to use as a baseline for --perf. By default the "
+                             "latest stored result is used, whatever the VkFFT version.")
+    sysgrp.add_argument('--perf-threshold', action='store', nargs=1, type=float, default=[0.05],
+                        help="Relative slowdown above which a performance regression is reported, "
+                             "if it is also statistically significant (default: 0.05)")
+    sysgrp.add_argument('--ref-cache', action='store', nargs=1,
+                        help="Directory where the reference transforms are stored, so they can "
+                             "be re-used by other tests on the same arrays (e.g. with different "
+                             "LUT, inplace or normalisation parameters). This also enables "
+                             "a fixed seed for the random arrays (0 if --seed is not used). "
+                             "Up to 32GB can be used in this directory.")
+    sysgrp.add_argument('--ref-auto', action='store_true',
+                        help="Use a double precision reference with an a-priori error bound, "
+                             "and only compute a long double reference (requires scipy) when "
+                             "the measured error is too close to the tolerance to decide. "
+                             "This is much faster than --ref-long-double for single precision.")
     sysgrp.add_argument('--ref-long-double', action='store_true',
                         help="Use long double precision for the reference calculation, "
                              "(requires scipy). This gives more objective accuracy plots but "
                              "can be slower (or much slower on some architectures).")
+    sysgrp.add_argument('--resume', action='store_true',
+                        help="Skip the tests already stored in the database (see --db) for the same "
+                             "backend, transform, array shape, axes, precision, norm, lut, inplace "
+                             "parameters, VkFFT version and GPU name. This allows to resume "
+                             "an interrupted test campaign, or to only test new sizes.")
     sysgrp.add_argument('--r2c', action='store_true', help="Test real-to-complex transform "
                                                            "(default is c2c)")
     sysgrp.add_argument('--radix', action='store', nargs='*', type=int,
@@ -335,6 +389,10 @@ def main():
                              "abs(n2-n1)<max(dabs+drel*N1). The default value of (0,0) "
                              "only allows the same lengths. This allows to test more "
                              "diverse configurations while limiting the number of tests.")
+    sysgrp.add_argument('--seed', action='store', nargs=1, type=int,
+                        help="Seed used to generate the random arrays, combined with the "
+                             "array shape. By default, a random seed is drawn and printed, "
+                             "so the tests can be reproduced.")
     sysgrp.add_argument('--serial', action='store_true',
                         help="Serialise the tests instead of spawning them in separate "
                              "process, allowing to diagnose more errors. Incompatible "
@@ -345,7 +403,7 @@ def main():
                         default=[120])
 
     # parser.print_help()
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     if args.serial and args.nproc[0] > 1:
         raise RuntimeError("Cannot use --serial with --nproc")
     if args.graph is not None:
@@ -357,9 +415,11 @@ def main():
         t = TestFFTSystematic
         t.axes = args.axes
         t.bluestein = args.bluestein
+        t.code_path_sample = None if args.code_path_sample is None else args.code_path_sample[0]
         t.colour = args.colour
         t.dct = False if args.dct is None else args.dct[0] if len(args.dct) else 2
-        t.db = args.db[0] if args.db is not None else None
+        t.db = None if args.db is None else args.db[0] if len(args.db) else 'pyvkfft-test.sql'
+        t.dst = False if args.dst is None else args.dst[0] if len(args.dst) else 2
         t.dry_run = args.dry_run
         t.dtype = np.float64 if args.double else np.float32
         t.gpu = args.gpu
@@ -373,11 +433,23 @@ def main():
         t.nproc = args.nproc[0]
         t.r2c = args.r2c
         t.radix = args.radix
-        t.ref_long_double = args.ref_long_double
+        t.ref_long_double = 'auto' if args.ref_auto else args.ref_long_double
+        t.resume = args.resume
+        t.perf = args.perf
+        t.perf_baseline = None if args.perf_baseline is None else args.perf_baseline[0]
+        t.perf_threshold = args.perf_threshold[0]
+        t.pool = pool
+        t.ref_cache = None if args.ref_cache is None else args.ref_cache[0]
+        if args.seed is not None:
+            t.seed = args.seed[0]
+        elif args.ref_cache is not None:
+            t.seed = 0
+        else:
+            t.seed = None
         t.max_pow = None if args.radix_max_pow is None else args.radix_max_pow[0]
         t.range = args.range
         size_min_max = np.array(args.range_mb) * 1024 ** 2 // 8
-        if args.r2c or args.dct:
+        if args.r2c or args.dct or args.dst is not None:
             size_min_max = size_min_max * 2
         if args.double:
             size_min_max = size_min_max / 2
@@ -397,7 +469,7 @@ def main():
             res = unittest.TextTestRunner(verbosity=1).run(suite)
         if t.dry_run:
             print(t.nb_shapes_gen)
-            sys.exit()
+            return 0
     else:
         t = TestFFT
         t.verbose = not args.silent
@@ -410,10 +482,10 @@ def main():
         else:
             res = unittest.TextTestRunner(verbosity=1).run(suite)
 
-    sub = os.path.split(sys.argv[0])[-1]
-    for i in range(1, len(sys.argv)):
-        arg = sys.argv[i]
-        if 'mail' not in arg and 'mail' not in sys.argv[i - 1] and 'html' not in arg and 'graph' not in arg:
+    sub = 'pyvkfft-test'
+    for i in range(len(argv)):
+        arg = argv[i]
+        if 'mail' not in arg and (i == 0 or 'mail' not in argv[i - 1]) and 'html' not in arg and 'graph' not in arg:
             sub += " " + arg
     info = "Ran:\n   %s\n\n Result:%s\n\n" % (sub, "OK" if res.wasSuccessful() else "FAILURE")
 
@@ -448,6 +520,8 @@ def main():
                 html += tmp % 'R2C'
             elif t.dct:
                 html += tmp % ('DCT%d' % t.dct)
+            elif t.dst:
+                html += tmp % ('DST%d' % t.dst)
             else:
                 html += tmp % 'C2C'
             if t.ndim == 12:
@@ -561,8 +635,8 @@ def main():
         with open(html_out, 'w') as f:
             f.write(html)
 
-    sys.exit(int(nb_err_fail > 0))
+    return int(nb_err_fail > 0)
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -9,14 +9,26 @@
 # script to run a long multi-test accuracy suite
 
 import os
+import shlex
+import shutil
+import tempfile
+from pyvkfft.accuracy import AccuracyTestPool
+from pyvkfft.scripts.pyvkfft_test import main as pyvkfft_test_main
 
 
 def main():
     gpu = 'v100'
+    # Maximum number of parallel tests - the actual number is adapted to the free memory
     nproc0 = 20
-    gpu_gb = 32
     dry_run = False
     backend = 'cupy'
+    # Directory used to share the reference transforms between the tests with the same
+    # array shapes (e.g. different LUT, inplace and normalisation), removed at the end
+    ref_cache = os.path.join(tempfile.gettempdir(), 'pyvkfft-ref-cache')
+    # The results are stored in this database. With resume=True, the tests already
+    # in the database (e.g. before an interruption) are skipped.
+    db = 'pyvkfft-test-suite.sql'
+    resume = False
 
     # Basic test
     com = "pyvkfft-test --nproc %d --html --range-mb 0 4100" % nproc0
@@ -25,8 +37,11 @@ def main():
     else:
         os.system(com)
 
-    # systematic tests
-    vtransform = ['        ', ' --r2c  ', ' --dct 1', ' --dct 2', ' --dct 3', ' --dct 4']
+    # systematic tests. These are run in this process, using the same pool of
+    # worker processes (and GPU contexts) for all the tests
+    pool = None if dry_run else AccuracyTestPool(nproc0)
+    vtransform = ['        ', ' --r2c  ', ' --dct 1', ' --dct 2', ' --dct 3', ' --dct 4',
+                  ' --dst 1', ' --dst 2', ' --dst 3', ' --dst 4']
     # vtransform = ['        ', ' --r2c  ']
     vdim = [1, 2, 3]
     vnorm = [' --norm 1', ' --norm 0']
@@ -42,14 +57,16 @@ def main():
                         if ' --lut' in lut and 'double' in prec:
                             continue
                         for transform in vtransform:
-                            if 'dct' in transform and '0' in norm:
+                            # DST use the same size limits as DCT
+                            r2r = transform.replace('dst', 'dct')
+                            if 'dct' in r2r and '0' in norm:
                                 continue
                             for ndim in vdim:
-                                n1 = 3 if 'dct 4' in transform else 2
+                                n1 = 3 if 'dct 4' in r2r else 2
                                 if ndim == 1:
-                                    if 'dct 1' in transform:
+                                    if 'dct 1' in r2r:
                                         n2 = 767 if 'double' in prec else 1535
-                                    elif 'dct' in transform:
+                                    elif 'dct' in r2r:
                                         if 'double' in prec:
                                             n2 = 1536 if 'bluestein' in radix else 3071
                                         else:
@@ -57,34 +74,27 @@ def main():
                                     else:
                                         n2 = 100000 if 'radix' in radix else 10000
                                 elif ndim == 2:
-                                    if 'dct 1' in transform:
+                                    if 'dct 1' in r2r:
                                         n2 = 512 if 'double' in prec else 1024
-                                    elif 'dct' in transform:
+                                    elif 'dct' in r2r:
                                         n2 = 1024 if 'bluestein' in radix and 'double' in prec else 2047
                                     else:
                                         n2 = 4500
                                 else:  # ndim==3
-                                    if 'dct' in transform:
+                                    if 'dct' in r2r:
                                         n2 = 500
                                     else:
                                         n2 = 550
-                                mem = n2 ** ndim * 8
-                                if 'double' in prec:
-                                    mem *= 2
-                                if 'inplace' not in inplace:
-                                    mem *= 2
-                                if 'dct' in transform or 'r2c' in transform:
-                                    mem /= 2
-                                nproc1 = gpu_gb // (mem / 1024 ** 3 * 1.5)
-                                nproc = max(1, min(nproc1, nproc0))
                                 com = 'pyvkfft-test --systematic --backend %s --gpu %s --graph --html' % (backend, gpu)
                                 com += ' --max-nb-tests 0'
-                                com += ' --nproc %2d --ndim %d --range %d %6d' % (nproc, ndim, n1, n2)
+                                com += ' --nproc %2d --ndim %d --range %d %6d' % (nproc0, ndim, n1, n2)
                                 com += transform + radix + inplace + prec + lut + norm + ' --range-mb 0 4100'
+                                com += ' --ref-cache %s' % ref_cache
+                                com += ' --db %s' % db + (' --resume' if resume else '')
                                 if dry_run:
                                     print(com)
                                 else:
-                                    os.system(com)
+                                    pyvkfft_test_main(shlex.split(com)[1:], pool=pool)
 
     # Last, run a few 2D and 3D tests where the lengths can differ,
     # and radix and Bluestein transforms are mixed.
@@ -104,25 +114,22 @@ def main():
                  ('', '', '', '', 2, 4080, 4112, ' --range-nd-narrow 0.02 4'),
                  ('', '', '', '', 3, 120, 140, ' --range-nd-narrow 0.02 4'),
                  ]:
-            mem = n2 ** ndim * 8
-            if 'double' in prec:
-                mem *= 2
-            if 'inplace' not in inplace:
-                mem *= 2
-            if 'dct' in transform or 'r2c' in transform:
-                mem /= 2
-            nproc1 = gpu_gb // (mem / 1024 ** 3 * 1.5)
-            nproc = max(1, min(nproc1, nproc0))
             com = 'pyvkfft-test --systematic --backend %s --gpu %s --graph --html' % (backend, gpu)
             com += ' --max-nb-tests 0'
-            com += ' --nproc %2d --ndim %d --range %d %6d' % (nproc, ndim, n1, n2)
+            com += ' --nproc %2d --ndim %d --range %d %6d' % (nproc0, ndim, n1, n2)
             com += transform + radix + inplace + prec + lut + norm + rn + ' --range-mb 0 4100'
+            com += ' --ref-cache %s' % ref_cache
+            com += ' --db %s' % db + (' --resume' if resume else '')
 
             if dry_run:
                 print(com)
                 os.system(com + ' --dry-run')
             else:
-                os.system(com)
+                pyvkfft_test_main(shlex.split(com)[1:], pool=pool)
+
+    if pool is not None:
+        pool.close()
+    shutil.rmtree(ref_cache, ignore_errors=True)
 
 
 if __name__ == '__main__':
@@ -7,11 +7,18 @@
 #
 #
 # pyvkfft unit tests.
+import os
+import csv
+import json
 import sys
+import shutil
 import unittest
 import multiprocessing
+import multiprocessing.pool
+import itertools
 import sqlite3
 import socket
+import tempfile
 import time
 import timeit
 import numpy as np
@@ -23,10 +30,23 @@ except ImportError:
         return np.random.randint(0, 255, (512, 512))
 
 from pyvkfft.version import __version__, vkfft_version
-from pyvkfft.base import primes, radix_gen, radix_gen_n
+from pyvkfft.base import primes, radix_gen, radix_gen_n, complex32, vkfft_code_path, select_code_path_shapes, \
+    VkFFTApp as VkFFTAppBase, _profiled, fft_cost, fit_cost_model, cuda_array_ptr
+from pyvkfft import next_fast_len, next_fast_shape
 from pyvkfft.fft import fftn as vkfftn, ifftn as vkifftn, rfftn as vkrfftn, \
-    irfftn as vkirfftn, dctn as vkdctn, idctn as vkidctn
-from pyvkfft.accuracy import test_accuracy, test_accuracy_kwargs, fftn, init_ctx, gpu_ctx_dic, has_dct_ref, has_scipy
+    irfftn as vkirfftn, dctn as vkdctn, idctn as vkidctn, r2rn as vkr2rn, ir2rn as vkir2rn, VkFFTAppCache, \
+    ArrayAdapter, register_array_adapter, _prepare_transform, _cached_app, vkfftapp_cache
+from pyvkfft.accuracy import test_accuracy, test_accuracy_kwargs, fftn, init_ctx, gpu_ctx_dic, has_dct_ref, has_scipy, \
+    get_gpu_name, get_free_memory, accuracy_test_memory, imap_memory, AccuracyTestPool, ReferenceCache, \
+    make_random_array, ref_error_bound, error_norms, gpu_error_norms, gpu_array_equal, speed_test_kwargs, is_slower
+from pyvkfft.accuracy import accuracy_tolerance, _ref_auto_long_double
+import pyvkfft.accuracy
+from pyvkfft.benchmark import timing_stats, batch_shapes, save_json, save_csv, chrome_trace, low_efficiency, \
+    plan_summary
+from pyvkfft.tune import tuning_key, get_tuned_params, save_tuned_params, has_tuning_db
+
+if has_scipy:
+    from scipy.fft import dctn as scipy_dctn, dstn as scipy_dstn
 
 try:
     import pycuda.gpuarray as cua
@@ -54,6 +74,15 @@ except ImportError:
     has_pyopencl = False
 
 
+def backend_dst_supported(backend):
+    """Check if DST transforms are supported by the VkFFT version used to build a backend"""
+    if backend == "pyopencl":
+        from pyvkfft.opencl import dst_supported
+    else:
+        from pyvkfft.cuda import dst_supported
+    return dst_supported()
+
+
 def latex_float(f):
     float_str = "{0:.2g}".format(f)
     if "e" in float_str:
@@ -136,7 +165,7 @@ class TestFFT(unittest.TestCase):
     def run_fft(self, vbackend, vn, dims_max=4, ndim_max=3, shuffle_axes=True,
                 vtype=(np.complex64, np.complex128),
                 vlut="auto", vinplace=(True, False), vnorm=(0, 1),
-                vr2c=(False,), vdct=(False,), verbose=False, dry_run=False):
+                vr2c=(False,), vdct=(False,), verbose=False, dry_run=False, vdst=(False,)):
         """
         Run a series of tests
         :param vbackend: list of backends to test among "pycuda", "cupy and "pyopencl"
@@ -157,6 +186,7 @@ class TestFFT(unittest.TestCase):
         :param vdct: a list among False/0, 1, 2, 3, 4 to test various DCT
         :param verbose: True or False - prints two lines per test (FFT and iFFT result)
         :param dry_run: if True, only count the number of test to run
+        :param vdst: a list among False/0, 1, 2, 3, 4 to test various DST
         :return: the number of tests performed, and the list of kwargs (dry run)
         """
         ct = 0
@@ -168,10 +198,12 @@ class TestFFT(unittest.TestCase):
                 for dims in range(1, dims_max + 1):
                     for ndim0 in range(1, min(dims, ndim_max) + 1):
                         for r2c in vr2c:
-                            for dct in vdct:
+                            for dct, dst in itertools.product(vdct, vdst):
+                                if dct and dst:
+                                    continue
                                 # Setup use of either ndim or axes, also test skipping dimensions
                                 ndim_axes = [(ndim0, None)]
-                                if shuffle_axes and not (r2c or dct):
+                                if shuffle_axes and not (r2c or dct or dst):
                                     for i in range(1, 2 ** (ndim0 - 1)):
                                         axes = []
                                         for ii in range(ndim0):
@@ -212,11 +244,12 @@ class TestFFT(unittest.TestCase):
                                                     with self.subTest(backend=backend, n=n, dims=dims, ndim=ndim,
                                                                       axes=axes, dtype=np.dtype(dtype), norm=norm,
                                                                       use_lut=use_lut, inplace=inplace,
-                                                                      r2c=r2c, dct=dct):
+                                                                      r2c=r2c, dct=dct, dst=dst):
                                                         ct += 1
                                                         if not dry_run:
                                                             res = test_accuracy(backend, sh, ndim, axes, dtype, inplace,
                                                                                 norm, use_lut, r2c=r2c, dct=dct,
+                                                                                dst=dst,
                                                                                 gpu_name=self.gpu,
                                                                                 stream=None, queue=cq,
                                                                                 return_array=False, init_array=d0,
@@ -248,7 +281,7 @@ class TestFFT(unittest.TestCase):
                                                                       "ndim": ndim, "axes": axes,
                                                                       "dtype": dtype, "inplace": inplace,
                                                                       "norm": norm, "use_lut": use_lut,
-                                                                      "r2c": r2c, "dct": dct,
+                                                                      "r2c": r2c, "dct": dct, "dst": dst,
                                                                       "gpu_name": self.gpu, "stream": None,
                                                                       "verbose": False,
                                                                       "colour_output": self.colour}
@@ -379,6 +412,617 @@ class TestFFT(unittest.TestCase):
                 if dry_run and self.verbose:
                     print("Running %d DCT tests (backend: %s)" % (ct, backend))
 
+    @unittest.skipIf(not (has_pycuda or has_cupy or has_pyopencl), "No OpenCL/CUDA backend is available")
+    @unittest.skipIf(not has_dct_ref, "scipy and pyfftw are not available - cannot test DST")
+    def test_dst(self):
+        """Run DST tests"""
+        vbackend = []
+        if has_pycuda:
+            vbackend.append("pycuda")
+        if has_cupy:
+            vbackend.append("cupy")
+        if has_pyopencl:
+            vbackend.append("pyopencl")
+        for backend in vbackend:
+            if not backend_dst_supported(backend):
+                continue
+            init_ctx(backend, gpu_name=self.gpu, verbose=False)
+            has_cl_fp64 = gpu_ctx_dic["pyopencl"][3] if backend == "pyopencl" else True
+            ct = 0
+            vkwargs = []
+            for dry_run in [True, False]:
+                vtype = (np.float32, np.float64)
+                if backend == "pyopencl" and not has_cl_fp64:
+                    vtype = (np.float32,)
+                v = self.verbose and not dry_run
+                if dry_run or self.nproc == 1:
+                    tmp = self.run_fft([backend], [30, 34], vtype=vtype, vnorm=[1], vdst=range(1, 5), verbose=v,
+                                       dry_run=dry_run)
+                    ct += tmp[0]
+                    vkwargs += tmp[1]
+                else:
+                    self.run_fft_parallel(vkwargs)
+                if dry_run and self.verbose:
+                    print("Running %d DST tests (backend: %s)" % (ct, backend))
+
+    @unittest.skipIf(not (has_pycuda or has_cupy or has_pyopencl), "No OpenCL/CUDA backend is available")
+    @unittest.skipIf(not has_scipy, "scipy is not available - cannot test mixed DCT/DST")
+    def test_r2rn_mixed(self):
+        """Test the mixed DCT/DST per-axis transforms"""
+        vbackend = []
+        if has_pycuda:
+            vbackend.append("pycuda")
+        if has_cupy:
+            vbackend.append("cupy")
+        if has_pyopencl:
+            vbackend.append("pyopencl")
+        for backend in vbackend:
+            if not backend_dst_supported(backend):
+                continue
+            init_ctx(backend, gpu_name=self.gpu, verbose=False)
+            cq = gpu_ctx_dic["pyopencl"][2] if backend == "pyopencl" else None
+            for kinds in [("dct2", "dst2"), ("dst1", "dct1", "dst1"), ("dct4", "dst3", "dct4")]:
+                for inplace in [True, False]:
+                    with self.subTest(backend=backend, kinds=kinds, inplace=inplace):
+                        sh = [30, 34, 32][:len(kinds)]
+                        d0 = np.random.uniform(-0.5, 0.5, sh).astype(np.float32)
+                        if backend == "pyopencl":
+                            d_gpu = cla.to_device(cq, d0)
+                        elif backend == "pycuda":
+                            d_gpu = cua.to_gpu(d0)
+                        else:
+                            d_gpu = cp.array(d0)
+                        # Reference using one scipy transform per axis
+                        d = d0.astype(np.float64)
+                        for ax, kind in enumerate(kinds):
+                            r2r = scipy_dctn if kind[:3] == "dct" else scipy_dstn
+                            d = r2r(d, type=int(kind[3]), axes=[ax])
+                        d1_gpu = vkr2rn(d_gpu, d_gpu if inplace else None, kinds=kinds)
+                        d1 = d1_gpu.get()
+                        self.assertTrue(np.allclose(d1, d, rtol=1e-4, atol=1e-4 * abs(d).max()),
+                                        "Accuracy mismatch after mixed DCT/DST")
+                        d2 = vkir2rn(d1_gpu, d1_gpu if inplace else None, kinds=kinds).get()
+                        self.assertTrue(np.allclose(d2, d0, rtol=1e-4, atol=1e-4),
+                                        "Accuracy mismatch after mixed inverse DCT/DST")
+
+    @unittest.skipIf(not (has_pycuda or has_cupy or has_pyopencl), "No OpenCL/CUDA backend is available")
+    def test_c2r_preserve_input(self):
+        """Run out-of-place R2C/C2R tests with preserve_input=True, checking the source is never modified"""
+        vbackend = []
+        if has_pycuda:
+            vbackend.append("pycuda")
+        if has_cupy:
+            vbackend.append("cupy")
+        if has_pyopencl:
+            vbackend.append("pyopencl")
+        for backend in vbackend:
+            init_ctx(backend, gpu_name=self.gpu, verbose=False)
+            cq = gpu_ctx_dic["pyopencl"][2] if backend == "pyopencl" else None
+            # Include non-radix and large 1D sizes, for which the source is modified by default
+            for n, ndim in [(30, 2), (34, 3), (808, 2), (46, 2), (6144, 1), (94, 1)]:
+                with self.subTest(backend=backend, n=n, ndim=ndim):
+                    res = test_accuracy(backend, [n] * ndim, ndim, None, np.float32, False, 1, None, r2c=True,
+                                        gpu_name=self.gpu, queue=cq, preserve_input=True, verbose=self.verbose)
+                    self.assertTrue(res["ni"] < res["tol"], "Accuracy mismatch after FFT, "
+                                                            "n2=%8e ni=%8e>%8e" % (res["n2"], res["ni"], res["tol"]))
+                    self.assertTrue(res["nii"] < res["tol"], "Accuracy mismatch after iFFT, "
+                                                             "n2=%8e ni=%8e>%8e" % (res["n2i"], res["nii"], res["tol"]))
+                    self.assertTrue(res["src_unchanged_fft"], "The source array was modified during the FFT")
+                    self.assertTrue(res["src_unchanged_ifft"], "The source array was modified during the iFFT")
+
+    @unittest.skipIf(not (has_pycuda or has_cupy or has_pyopencl), "No OpenCL/CUDA backend is available")
+    def test_c2c_half_memory(self):
+        """Run C2C tests with half precision storage and single precision calculations"""
+        vbackend = []
+        if has_pycuda:
+            vbackend.append("pycuda")
+        if has_cupy:
+            vbackend.append("cupy")
+        if has_pyopencl:
+            vbackend.append("pyopencl")
+        for backend in vbackend:
+            init_ctx(backend, gpu_name=self.gpu, verbose=False)
+            cq = gpu_ctx_dic["pyopencl"][2] if backend == "pyopencl" else None
+            if backend == "pyopencl" and 'cl_khr_fp16' not in cq.device.extensions:
+                continue
+            for n in [30, 34, 808]:
+                for ndim in [1, 2]:
+                    for norm in [0, 1]:
+                        with self.subTest(backend=backend, n=n, ndim=ndim, norm=norm):
+                            res = test_accuracy(backend, [n] * ndim, ndim, None, complex32, False, norm, None,
+                                                gpu_name=self.gpu, queue=cq, compute_dtype=np.complex64,
+                                                verbose=self.verbose)
+                            self.assertTrue(res["ni"] < res["tol"], "Accuracy mismatch after FFT, "
+                                                                    "n2=%8e ni=%8e>%8e" %
+                                            (res["n2"], res["ni"], res["tol"]))
+                            self.assertTrue(res["nii"] < res["tol"], "Accuracy mismatch after iFFT, "
+                                                                     "n2=%8e ni=%8e>%8e" %
+                                            (res["n2i"], res["nii"], res["tol"]))
+                            self.assertTrue(res["src_unchanged_fft"], "The source array was modified "
+                                                                      "during the FFT")
+                            self.assertTrue(res["src_unchanged_ifft"], "The source array was modified "
+                                                                       "during the iFFT")
+
+    @unittest.skipIf(not (has_pycuda or has_cupy or has_pyopencl), "No OpenCL/CUDA backend is available")
+    def test_float_memory_double_compute(self):
+        """Run C2C, R2C and DCT tests with single precision storage and double precision calculations"""
+        vbackend = []
+        if has_pycuda:
+            vbackend.append("pycuda")
+        if has_cupy:
+            vbackend.append("cupy")
+        if has_pyopencl:
+            vbackend.append("pyopencl")
+        for backend in vbackend:
+            init_ctx(backend, gpu_name=self.gpu, verbose=False)
+            cq = gpu_ctx_dic["pyopencl"][2] if backend == "pyopencl" else None
+            if backend == "pyopencl" and 'cl_khr_fp64' not in cq.device.extensions:
+                continue
+            for transform in ["c2c", "r2c", "dct"] if has_dct_ref else ["c2c", "r2c"]:
+                for n in [30, 34, 808]:
+                    for ndim in [1, 2]:
+                        for inplace in [False, True]:
+                            if transform == "c2c":
+                                dtype, compute_dtype = np.complex64, np.complex128
+                            else:
+                                dtype, compute_dtype = np.float32, np.float64
+                            with self.subTest(backend=backend, transform=transform, n=n, ndim=ndim,
+                                              inplace=inplace):
+                                res = test_accuracy(backend, [n] * ndim, ndim, None, dtype, inplace, 1, None,
+                                                    r2c=transform == "r2c", dct=2 if transform == "dct" else False,
+                                                    gpu_name=self.gpu, queue=cq, compute_dtype=compute_dtype,
+                                                    verbose=self.verbose)
+                                self.assertTrue(res["ni"] < res["tol"], "Accuracy mismatch after FFT, "
+                                                                        "n2=%8e ni=%8e>%8e" %
+                                                (res["n2"], res["ni"], res["tol"]))
+                                self.assertTrue(res["nii"] < res["tol"], "Accuracy mismatch after iFFT, "
+                                                                         "n2=%8e ni=%8e>%8e" %
+                                                (res["n2i"], res["nii"], res["tol"]))
+
+    def test_app_cache(self):
+        """Test the VkFFTApp cache statistics, eviction and clearing"""
+
+        class FakeApp:
+            def get_buffer_nbytes(self):
+                return 1024
+
+        cache = VkFFTAppCache(maxsize=3)
+        a1 = cache.get('fft', ((16, 16), np.complex64, [-1]), FakeApp)
+        self.assertIs(cache.get('fft', ((16, 16), np.complex64, [-1]), FakeApp), a1)
+        cache.get('dct', ((16, 16), np.float32), FakeApp)
+        cache.get('rfft', ((16, 16), np.float32), FakeApp)
+        cache.get('rfft', ((32, 32), np.float32), FakeApp)
+        st = cache.stats()
+        self.assertEqual((st["hits"], st["misses"], st["evictions"]), (1, 4, 1))
+        self.assertEqual((st["size"], st["nbytes"]), (3, 3 * 1024))
+        self.assertEqual(st["kinds"]["fft"]["evictions"], 1)
+        cache.clear(kind='rfft')
+        st = cache.stats()
+        self.assertEqual(st["size"], 1)
+        self.assertEqual(st["kinds"]["dct"]["size"], 1)
+        cache.clear(reset_stats=True)
+        st = cache.stats()
+        self.assertEqual((st["hits"], st["misses"], st["size"]), (0, 0, 0))
+        # The same parameters given positionally, by keyword or by default share the same app
+
+        @_cached_app('test')
+        def get_app(shape, dtype, norm=1):
+            return FakeApp()
+
+        nb = vkfftapp_cache.stats()["kinds"].get("test", {"misses": 0})["misses"]
+        a1 = get_app((16, 16), np.complex64)
+        self.assertIs(get_app((16, 16), np.complex64, 1), a1)
+        self.assertIs(get_app((16, 16), dtype=np.complex64, norm=1), a1)
+        self.assertIs(get_app(dtype=np.complex64, shape=(16, 16)), a1)
+        self.assertIsNot(get_app((16, 16), np.complex64, norm=0), a1)
+        self.assertEqual(vkfftapp_cache.stats()["kinds"]["test"]["misses"], nb + 2)
+        vkfftapp_cache.clear(kind='test')
+
+    def test_reference_cache(self):
+        """Test the reference transforms cache, in memory and on disk"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            a = np.random.uniform(-0.5, 0.5, (32, 48)).astype(np.complex64)
+            c = ReferenceCache(tmpdir)
+            r1 = c.transform(fftn, a, axes=[-1])
+            self.assertIs(c.transform(fftn, a, axes=[-1]), r1)
+            c.transform(fftn, a, axes=[-2])
+            self.assertEqual((c.stats()["hits"], c.stats()["misses"]), (1, 2))
+            # A new cache (e.g. in another process) re-uses the stored transforms
+            c = ReferenceCache(tmpdir)
+            r2 = c.transform(fftn, a.copy(), axes=[-1])
+            self.assertEqual((c.stats()["hits"], c.stats()["misses"]), (1, 0))
+            self.assertTrue(np.array_equal(r1, r2))
+            del r2, c
+
+    def test_error_norms(self):
+        """Test the chunked comparison of GPU arrays with a reference"""
+
+        class FakeGPUArray:
+            def __init__(self, a):
+                self.a = a
+
+            def reshape(self, shape):
+                return FakeGPUArray(self.a.reshape(shape))
+
+            def __getitem__(self, item):
+                return FakeGPUArray(self.a[item])
+
+            def get(self):
+                return self.a.copy()
+
+        chunk_size = pyvkfft.accuracy.norm_chunk_size
+        try:
+            pyvkfft.accuracy.norm_chunk_size = 100
+            ref = make_random_array((6, 34), np.complex128, 0)
+            a = ref + make_random_array((6, 34), np.complex128, 1) * 1e-3
+            n2 = np.sqrt((abs(a - ref) ** 2).sum() / (abs(ref) ** 2).sum())
+            ni = abs(a - ref).max() / abs(ref).max()
+            for v in (error_norms(ref, a), gpu_error_norms(ref, FakeGPUArray(a))):
+                self.assertTrue(np.allclose(v, (n2, ni), rtol=1e-12))
+            # Cropped (inplace R2C) and scaled arrays
+            b = np.zeros((6, 36), dtype=np.complex128)
+            b[:, :-2] = a * 2
+            self.assertTrue(np.allclose(gpu_error_norms(ref, FakeGPUArray(b), crop=2, scale=0.5), (n2, ni)))
+            self.assertTrue(gpu_array_equal(ref, FakeGPUArray(ref.copy())))
+            self.assertFalse(gpu_array_equal(ref, FakeGPUArray(a)))
+        finally:
+            pyvkfft.accuracy.norm_chunk_size = chunk_size
+
+    def test_memory_scheduler(self):
+        """Test the memory estimation and the memory-aware scheduling of tests"""
+        m = accuracy_test_memory((256, 256), np.complex64, inplace=False)
+        self.assertGreater(m[0], accuracy_test_memory((256, 256), np.complex64, inplace=True)[0])
+        self.assertGreater(m[0], accuracy_test_memory((256, 256), np.float32, inplace=False, r2c=True)[0])
+        self.assertLess(m[0], accuracy_test_memory((257, 257), np.complex64, inplace=False)[0])
+        self.assertLess(m[1], accuracy_test_memory((256, 256), np.complex128, inplace=False)[1])
+        if has_scipy and np.dtype(np.longdouble).itemsize > 8:
+            # Any true value (e.g. from the command-line) selects the long double reference
+            m1 = accuracy_test_memory((256, 256), np.complex64, inplace=False, ref_long_double=1)[1]
+            self.assertEqual(m1, m[1])
+            self.assertLess(accuracy_test_memory((256, 256), np.complex64, inplace=False,
+                                                 ref_long_double='auto')[1], m1)
+            # ... and is used directly in 'auto' mode for double precision
+            m1 = accuracy_test_memory((256, 256), np.complex128, inplace=False, ref_long_double=True)[1]
+            self.assertEqual(accuracy_test_memory((256, 256), np.complex128, inplace=False,
+                                                  ref_long_double='auto')[1], m1)
+            self.assertEqual(accuracy_test_memory((4, 256, 256), np.complex128, inplace=False, ndim=2,
+                                                  ref_long_double='auto')[1],
+                             accuracy_test_memory((4, 256, 256), np.complex128, inplace=False, ndim=2)[1])
+        vkwargs = list(range(-20, 0))
+        vmem = [(abs(i), abs(i)) for i in vkwargs]
+        with multiprocessing.pool.ThreadPool(4) as pool:
+            # Configurations larger than the available memory are run one at a time
+            for mem in [(100, 100), (10, 10)]:
+                res = list(imap_memory(pool, 4, vkwargs, vmem, mem, timeout=10, func=abs))
+                self.assertEqual(res, [abs(i) for i in vkwargs])
+
+    def test_accuracy_test_pool(self):
+        """Test the persistent worker pool, including the replacement of a hung worker"""
+        with AccuracyTestPool(2, func=time.sleep) as pool:
+            res = list(pool.imap([0, 1000, 0, 'a'], timeout=5))
+            self.assertIsNone(res[0])
+            self.assertIsInstance(res[1], multiprocessing.TimeoutError)
+            self.assertIsNone(res[2])
+            self.assertIsInstance(res[3], TypeError)
+            # The pool can be re-used
+            self.assertEqual(list(pool.imap([0, 0, 0])), [None] * 3)
+
+    def test_radix_gen_n(self):
+        """Test the generation of nD array shapes against a brute-force generation"""
+        n0 = radix_gen(40, (2, 3, 5))
+        for ndim in (1, 2, 3):
+            for narrow in (None, (0.1, 2)):
+                with self.subTest(ndim=ndim, range_nd_narrow=narrow):
+                    v0 = []
+                    for sh in itertools.product(n0, repeat=ndim):
+                        if not (50 <= np.prod(sh) <= 5000):
+                            continue
+                        if narrow is not None and max(abs(n - sh[0]) for n in sh) > max(narrow[1], sh[0] * narrow[0]):
+                            continue
+                        v0.append(tuple(int(n) for n in sh))
+                    v = radix_gen_n(40, 5000, (2, 3, 5), ndim=ndim, range_nd_narrow=narrow, min_size=50)
+                    self.assertEqual(sorted(v), sorted(v0))
+                    self.assertEqual([np.prod(sh) for sh in v], sorted(np.prod(sh) for sh in v))
+                    a = radix_gen_n(40, 5000, (2, 3, 5), ndim=ndim, range_nd_narrow=narrow, min_size=50,
+                                    as_array=True)
+                    self.assertEqual(a.shape, (len(v), ndim))
+                    self.assertEqual([tuple(sh) for sh in a.tolist()], v)
+
+    def test_code_path_shapes(self):
+        """Test the selection of array shapes according to VkFFT code paths"""
+        self.assertEqual(vkfft_code_path(16), ('radix', 1, 2, 'register'))
+        self.assertEqual(vkfft_code_path(3 * 7 * 64), ('radix', 1, 7, 'shared'))
+        self.assertEqual(vkfft_code_path(2 ** 14), ('radix', 2, 2, 'shared'))
+        self.assertEqual(vkfft_code_path(2 ** 13, r2c=True), ('radix', 1, 2, 'shared'))
+        self.assertEqual(vkfft_code_path(4096, dtype=np.complex128), ('radix', 2, 2, 'shared'))
+        self.assertEqual(vkfft_code_path(17)[0], 'bluestein')
+        vshape = radix_gen_n(nmax=20000, max_size=20000, radix=None, ndim=1)
+        v = select_code_path_shapes(vshape, nb=3)
+        self.assertLess(len(v) * 100, len(vshape))
+        # All code paths are tested, including the boundaries
+        self.assertEqual({vkfft_code_path(s[0]) for s in v}, {vkfft_code_path(s[0]) for s in vshape})
+        for n in (32, 4096, 6144, 8192):
+            self.assertIn((n,), v)
+
+    def test_random_array(self):
+        """Test the reproducible generation of random arrays"""
+        for dtype in (np.float32, np.float64, np.complex64, np.complex128):
+            with self.subTest(dtype=np.dtype(dtype)):
+                a = make_random_array((16, 30), dtype, 1)
+                self.assertEqual(a.dtype, dtype)
+                self.assertTrue(np.array_equal(a, make_random_array((16, 30), dtype, 1)))
+                self.assertFalse(np.array_equal(a, make_random_array((16, 30), dtype, 2)))
+                self.assertFalse(np.array_equal(a.ravel(), make_random_array((30, 16), dtype, 1).ravel()))
+                self.assertTrue(abs(a).max() <= 0.5 * np.sqrt(2))
+
+    @unittest.skipIf(not has_scipy, "scipy is not available")
+    def test_ref_error_bound(self):
+        """Test that the a-priori float64 reference error bound holds"""
+        for sh in [(1024,), (97,), (60, 120), (17, 16, 15)]:
+            with self.subTest(shape=sh):
+                a = make_random_array(sh, np.complex128, 0)
+                d = fftn(a.astype(np.clongdouble))
+                ni = error_norms(d, fftn(a))[1]
+                bound = ref_error_bound(sh)
+                self.assertTrue(ni < bound < 1e-10, "%e %e" % (ni, bound))
+        # In 'auto' mode, the long double reference is used directly for double precision
+        for sh in [(16,), (1024,), (1000, 1000)]:
+            with self.subTest(shape=sh, auto=True):
+                n = np.prod(sh, dtype=np.float64)
+                self.assertTrue(_ref_auto_long_double(sh, accuracy_tolerance(n, np.complex128)))
+                self.assertTrue(_ref_auto_long_double(sh, accuracy_tolerance(n, np.float64), r2r=True))
+                self.assertFalse(_ref_auto_long_double(sh, accuracy_tolerance(n, np.complex64)))
+
+    def test_benchmark_utils(self):
+        """Test the benchmark statistics, shapes generation and JSON/CSV output"""
+        r = timing_stats(np.arange(1, 102) * 1e-3, percentiles=(10, 90))
+        self.assertAlmostEqual(r["median"], 0.051)
+        self.assertAlmostEqual(r["min"], 0.001)
+        self.assertAlmostEqual(r["p10"], 0.011)
+        self.assertAlmostEqual(r["p90"], 0.091)
+        vsh = batch_shapes(2, nmin=30, nmax=64, radix_max=3, batch_mb=1, r2c=True)
+        self.assertEqual([sh[1] for sh in vsh], [32, 36, 48, 54, 64])
+        for sh in vsh:
+            self.assertEqual(sh[1], sh[2])
+            self.assertTrue(abs(np.prod(sh) * 8 - 1024 ** 2) < sh[1] ** 2 * 8)
+        res = {"backend": "pyopencl", "shape": (4, 32), "fft": r, "gbps": 10.}
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        info = {"hostname": "localhost", "vkfft_version": "1.2.21"}
+        save_json(os.path.join(tmp, "bench.json"), [res], info=info)
+        with open(os.path.join(tmp, "bench.json")) as f:
+            j = json.load(f)
+        self.assertEqual(j["results"][0]["fft"], r)
+        self.assertEqual(j["info"], info)
+        save_csv(os.path.join(tmp, "bench.csv"), [res, res], info=info)
+        with open(os.path.join(tmp, "bench.csv")) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 2)
+        self.assertAlmostEqual(float(rows[1]["fft_p90"]), 0.091)
+        self.assertEqual(rows[0]["shape"], "(4, 32)")
+        self.assertEqual(rows[0]["vkfft_version"], "1.2.21")
+        vres = [{"shape": (4, n), "efficiency": e} for n, e in ((32, 0.8), (37, 0.2), (64, 0.9), (67, 0.1))]
+        self.assertEqual([r["shape"][1] for r in low_efficiency(vres + [res], nb=3)], [67, 37, 32])
+        p = {"config": 0.001, "codegen": 0.01, "compile": 0.08, "alloc": 0.004, "total": 0.1, "nb_compile": 2}
+        r = plan_summary([{"plan_phases": p}, {"plan_phases": p}, res])
+        self.assertEqual(r["nb"], 2)
+        self.assertAlmostEqual(r["total"], 0.2)
+        self.assertAlmostEqual(r["compile"]["fraction"], 0.8)
+        self.assertAlmostEqual(r["other"]["time"], 0.01)
+
+    def test_profiling(self):
+        """Test the recording of per-kernel profiling information and its Chrome trace export"""
+
+        class ProfiledApp(VkFFTAppBase):
+            # Emulates a backend with two kernels per transform
+            def _set_profiling(self, enable):
+                pass
+
+            def get_nb_dispatch(self):
+                return 2
+
+            def _get_dispatch_profile(self, i):
+                return (64, 1, 1), (128, 1, 1), (i * 1e-3, (i + 1) * 1e-3)
+
+            @_profiled
+            def fft(self, src, dest=None):
+                return src
+
+            @_profiled
+            def ifft(self, src, dest=None):
+                return src
+
+        d = np.zeros((4, 256), dtype=np.complex64)
+        app = ProfiledApp(d.shape, d.dtype, ndim=1)
+        app.fft(d)
+        self.assertEqual(app.get_profile(), [])
+        app.enable_profiling()
+        app.fft(d)
+        app.ifft(d)
+        p = app.get_profile(clear=True)
+        self.assertEqual(app.get_profile(), [])
+        self.assertEqual([v["transform"] for v in p], ["fft", "ifft"])
+        self.assertEqual(len(p[0]["kernels"]), 2)
+        k = p[1]["kernels"][1]
+        self.assertEqual(k["grid"], (64, 1, 1))
+        self.assertAlmostEqual(k["dt"], 1e-3)
+        self.assertEqual(k["nbytes"], 2 * d.nbytes)
+        trace = chrome_trace({"C2C (4,256)": p})
+        ev = [e for e in trace["traceEvents"] if e["ph"] == "X"]
+        self.assertEqual(len(ev), 4)
+        self.assertEqual(ev[0]["ts"], 0)
+        self.assertAlmostEqual(ev[3]["dur"], 1e3)
+        self.assertTrue(ev[2]["ts"] >= ev[0]["ts"])
+        self.assertEqual(json.loads(json.dumps(trace))["traceEvents"][0]["args"]["name"], "C2C (4,256)")
+
+    def test_tuning_db(self):
+        """Test storing and retrieving tuned VkFFT parameters"""
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        db = os.path.join(tmp, "tune", "tune.db")
+        self.assertFalse(has_tuning_db(db))
+        # Batched transforms with the same collapsed shape share the same key
+        k = tuning_key(VkFFTAppBase((4, 8, 32), np.complex64, ndim=1))
+        self.assertEqual(k, tuning_key(VkFFTAppBase((32, 32), np.complex64, ndim=1)))
+        self.assertNotEqual(k, tuning_key(VkFFTAppBase((32, 32), np.complex64, ndim=2)))
+        self.assertNotEqual(k, tuning_key(VkFFTAppBase((32, 32), np.complex128, ndim=1)))
+        params = {"coalescedMemory": 64, "aimThreads": 128}
+        save_tuned_params("opencl", "GPU 1", k, params, dt=1e-3, dt_default=2e-3, db=db, version="1.2.21")
+        self.assertTrue(has_tuning_db(db))
+        self.assertEqual(get_tuned_params("opencl", "GPU 1", k, db=db, version="1.2.21"), params)
+        self.assertEqual(get_tuned_params("opencl", "GPU 2", k, db=db, version="1.2.21"), {})
+        self.assertEqual(get_tuned_params("cuda", "GPU 1", k, db=db, version="1.2.21"), {})
+        self.assertEqual(get_tuned_params("opencl", "GPU 1", k, db=db, version="1.2.26"), {})
+        # Update
+        save_tuned_params("opencl", "GPU 1", k, {}, db=db, version="1.2.21")
+        self.assertEqual(get_tuned_params("opencl", "GPU 1", k, db=db, version="1.2.21"), {})
+        app = VkFFTAppBase((32, 32), np.complex64, ndim=1, aimThreads=64)
+        self.assertEqual((app.aimThreads, app.coalescedMemory, app.numSharedBanks), (64, -1, -1))
+
+    def test_next_fast_len(self):
+        """Test the choice of the fastest transform lengths for padding"""
+        for n in (16, 100, 1000, 1024, 4096):
+            self.assertEqual(next_fast_len(n), n)
+        for n in (17, 1023, 1031, 4097, 65537):
+            for ndim in (1, 2, 3):
+                for r2c in (False, True):
+                    with self.subTest(n=n, ndim=ndim, r2c=r2c):
+                        m = next_fast_len(n, ndim=ndim, r2c=r2c)
+                        self.assertTrue(n <= m <= 2 ** int(np.ceil(np.log2(n))))
+                        self.assertTrue(max(primes(m // 2 if r2c else m)) <= 13)
+        # A Bluestein transform is slower than a larger radix one
+        self.assertTrue(fft_cost((1031,)) > 2 * fft_cost((1040,)))
+        self.assertEqual(next_fast_shape((10, 100, 1031), ndim=2), (10, 100, 1040))
+        self.assertEqual(next_fast_shape((129, 129, 129)), (130, 130, 130))
+        # Calibration
+        coeffs = {"launch": 1e-5, "mem": 1e-9, "flop": 1e-10, "bluestein": 5e-9}
+        vsh = [(64, n) for n in (32, 37, 100, 128, 256, 700, 1031, 2048, 3000, 4096, 5003)]
+        c = fit_cost_model(vsh, [fft_cost(sh, 1, coeffs=coeffs) for sh in vsh], ndim=1)
+        for k, v in coeffs.items():
+            self.assertAlmostEqual(c[k] / v, 1, places=5)
+
+    def test_is_slower(self):
+        """Test the detection of significant slowdowns against a baseline"""
+        self.assertFalse(is_slower(1.0, 0.01, 20, 1.0, 0.01, 20))
+        self.assertFalse(is_slower(1.02, 0.001, 20, 1.0, 0.001, 20))  # below threshold
+        self.assertTrue(is_slower(1.02, 0.001, 20, 1.0, 0.001, 20, threshold=0.01))
+        self.assertTrue(is_slower(1.2, 0.01, 20, 1.0, 0.01, 20))
+        self.assertFalse(is_slower(1.2, 0.5, 20, 1.0, 0.5, 20))  # not significant
+        self.assertFalse(is_slower(0.8, 0.01, 20, 1.0, 0.01, 20))  # faster
+
+    def test_lazy_import(self):
+        """Test that importing pyvkfft.fft does not load the backends"""
+        import subprocess
+        code = "import sys, pyvkfft.fft as f; f.has_cupy, f.has_opencl, f.has_pycuda; " \
+               "print(' '.join(m for m in ('pyvkfft.cuda', 'pyvkfft.opencl', 'pycuda', 'pyopencl', 'cupy') " \
+               "if m in sys.modules))"
+        r = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        self.assertEqual(r.stdout.strip(), "")
+
+    def test_array_adapter(self):
+        """Test the registration of an adapter for another type of array"""
+
+        class HostArray(np.ndarray):
+            pass
+
+        class HostAdapter(ArrayAdapter):
+            def ptr(self, a):
+                return a.ctypes.data
+
+            def empty_like(self, src, shape=None, dtype=None):
+                return np.empty(src.shape if shape is None else shape,
+                                dtype=src.dtype if dtype is None else dtype).view(HostArray)
+
+        a = np.ones((4, 16), dtype=np.float32).view(HostArray)
+        with self.assertRaisesRegex(RuntimeError, "Could not determine the type of GPU array"):
+            _prepare_transform(a, None, None)
+        with self.assertRaisesRegex(RuntimeError, "Could not determine the type of GPU array"):
+            vkfftn(np.ones((4, 16), dtype=np.complex64))
+        register_array_adapter(HostArray, HostAdapter())
+        backend, inplace, dest, cl_queue = _prepare_transform(a, None, None)
+        self.assertFalse(inplace)
+        self.assertEqual((dest.shape, dest.dtype, type(dest)), (a.shape, a.dtype, HostArray))
+        self.assertTrue(_prepare_transform(a, a, None)[1])
+        backend, inplace, dest, cl_queue, dtype = _prepare_transform(a, None, None, r2c=True)
+        self.assertEqual((dest.shape, dest.dtype, dtype), ((4, 9), np.complex64, np.complex64))
+        backend, inplace, dest, cl_queue, dtype = _prepare_transform(dest, None, None, r2c=True)
+        self.assertEqual((dest.shape, dest.dtype), ((4, 16), np.float32))
+
+    def test_cuda_array_ptr(self):
+        """Test getting the data address from __cuda_array_interface__ and __dlpack__"""
+
+        class CAIArray:
+            def __init__(self, strides=None):
+                self.__cuda_array_interface__ = {"shape": (4, 8), "typestr": "<f4", "data": (1024, False),
+                                                 "strides": strides, "version": 3, "stream": 7}
+
+        class DLPackArray:
+            # Pretend a host array is in CUDA memory
+            def __init__(self, a):
+                self.a = a
+
+            def __dlpack__(self, stream=None):
+                return self.a.__dlpack__()
+
+            def __dlpack_device__(self):
+                return 2, 0
+
+        self.assertEqual(cuda_array_ptr(CAIArray()), (1024, 7))
+        self.assertEqual(cuda_array_ptr(CAIArray(strides=(32, 4))), (1024, 7))
+        with self.assertRaises(RuntimeError):
+            cuda_array_ptr(CAIArray(strides=(64, 4)))
+        a = np.zeros((4, 16), dtype=np.complex64)
+        self.assertEqual(cuda_array_ptr(DLPackArray(a)), (a.ctypes.data, None))
+        self.assertEqual(cuda_array_ptr(DLPackArray(a[1:3])), (a[1:3].ctypes.data, None))
+        with self.assertRaises(RuntimeError):
+            cuda_array_ptr(DLPackArray(a[:, ::2]))
+        with self.assertRaises(RuntimeError):
+            cuda_array_ptr(a)  # not in CUDA memory
+
+    @unittest.skipIf(not has_cupy, "cupy is not available")
+    def test_cuda_array_interop(self):
+        """Test the pyvkfft.fft functions with other CUDA arrays, e.g. pytorch"""
+
+        class CAIArray:
+            # Any array exporting __cuda_array_interface__ - results are returned as cupy arrays
+            def __init__(self, a):
+                self.a = a
+                self.__cuda_array_interface__ = a.__cuda_array_interface__
+
+        d0 = make_random_array((16, 64), np.complex64, seed=0)
+        ref = np.fft.fftn(d0)
+        d = cp.array(d0)
+        r = vkfftn(CAIArray(d))
+        self.assertIsInstance(r, cp.ndarray)
+        self.assertTrue(np.allclose(r.get(), ref, rtol=1e-4, atol=1e-3 * abs(ref).max()))
+        # VkFFTApp with norm='ortho' and in-place R2C, which use a cupy view of the array
+        from pyvkfft.cuda import VkFFTApp as cuApp
+        a = CAIArray(cp.array(d0))
+        self.assertIs(cuApp(d0.shape, d0.dtype, ndim=2, norm="ortho").fft(a), a)
+        ref = np.fft.fftn(d0, norm="ortho")
+        self.assertTrue(np.allclose(a.a.get(), ref, rtol=1e-4, atol=1e-3 * abs(ref).max()))
+        dr = make_random_array((16, 66), np.float32, seed=0)
+        a = CAIArray(cp.array(dr))
+        r = cuApp(dr.shape, dr.dtype, ndim=2, r2c=True, inplace=True).fft(a)
+        self.assertIsInstance(r, cp.ndarray)
+        self.assertEqual((r.shape, r.dtype), ((16, 33), np.complex64))
+        ref = np.fft.rfftn(dr[:, :64])
+        self.assertTrue(np.allclose(r.get(), ref, rtol=1e-4, atol=1e-3 * abs(ref).max()))
+        try:
+            import torch
+        except ImportError:
+            return
+        with self.subTest(library="torch"):
+            t = torch.from_dlpack(cp.array(d0.real.copy()))
+            r = vkrfftn(t)
+            self.assertIsInstance(r, torch.Tensor)
+            self.assertEqual(tuple(r.shape), (16, 33))
+            ref = np.fft.rfftn(d0.real)
+            self.assertTrue(np.allclose(r.cpu().numpy(), ref, rtol=1e-4, atol=1e-3 * abs(ref).max()))
+            # An inplace transform returns the source tensor
+            t = torch.from_dlpack(cp.array(d0))
+            self.assertIs(vkfftn(t, t), t)
+
     @unittest.skipIf(not has_pycuda, "pycuda is not available")
     def test_pycuda_streams(self):
         """
@@ -417,10 +1061,12 @@ class TestFFT(unittest.TestCase):
 class TestFFTSystematic(unittest.TestCase):
     axes = None
     bluestein = False
+    code_path_sample = None
     colour = False
     dct = False
     db = None
     dry_run = False
+    dst = False
     dtype = np.float32
     graph = None
     gpu = None
@@ -434,12 +1080,19 @@ class TestFFTSystematic(unittest.TestCase):
     # t.ndims = args.ndims
     norm = 1
     nproc = 1
+    perf = False
+    perf_baseline = None
+    perf_threshold = 0.05
+    pool = None
     r2c = False
     radix = None
     range = 2, 128
     range_nd_narrow = 0, 0
     range_size = 0, 128 * 1024 ** 2 // 8
+    ref_cache = None
     ref_long_double = False
+    resume = False
+    seed = None
     serial = False
     timeout = 30
     vbackend = None
@@ -476,6 +1129,9 @@ class TestFFTSystematic(unittest.TestCase):
                                       radix=self.radix, ndim=self.ndim, even=self.r2c,
                                       nmin=self.range[0], max_pow=self.max_pow,
                                       range_nd_narrow=self.range_nd_narrow, min_size=self.range_size[0])
+        if self.code_path_sample:
+            self.vshape = select_code_path_shapes(self.vshape, nb=self.code_path_sample, dtype=self.dtype,
+                                                  r2c=self.r2c)
         if not self.dry_run:
             self.assertTrue(len(self.vshape), "The list of sizes to test is empty !")
             if self.max_nb_tests:
@@ -484,6 +1140,8 @@ class TestFFTSystematic(unittest.TestCase):
                                 (len(self.vshape), self.max_nb_tests))
 
     def test_systematic(self):
+        if self.perf:
+            raise unittest.SkipTest("Performance mode: accuracy tests are skipped")
         if self.dry_run:
             # The array shapes to test have been generated
             if self.verbose:
@@ -491,14 +1149,28 @@ class TestFFTSystematic(unittest.TestCase):
             # OK, this lacks elegance, but works to get back the value in the scripts
             self.__class__.nb_shapes_gen = len(self.vshape)
             return
+        seed = self.seed
+        if seed is None:
+            # Random arrays are still reproducible using this seed
+            seed = int(np.random.randint(0, 2 ** 31))
+        if self.verbose:
+            print("Random arrays seed: %d" % seed)
+        ref_cache = self.ref_cache
+        if ref_cache is None and len(self.vbackend) > 1:
+            # The same arrays are tested with each backend, so share the reference
+            # transforms between the worker processes, in shared memory if available
+            ref_cache = tempfile.mkdtemp(prefix='pyvkfft-ref-',
+                                         dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+            self.addCleanup(shutil.rmtree, ref_cache, ignore_errors=True)
         # Generate the list of configurations as kwargs for test_accuracy()
         vkwargs = []
         for backend in self.vbackend:
             for s in self.vshape:
                 kwargs = {"backend": backend, "shape": s, "ndim": len(s), "axes": self.axes,
                           "dtype": self.dtype, "inplace": self.inplace, "norm": self.norm, "use_lut": self.lut,
-                          "r2c": self.r2c, "dct": self.dct, "gpu_name": self.gpu, "stream": None, "verbose": False,
-                          "colour_output": self.colour, "ref_long_double": self.ref_long_double}
+                          "r2c": self.r2c, "dct": self.dct, "dst": self.dst, "gpu_name": self.gpu, "stream": None,
+                          "verbose": False, "colour_output": self.colour, "ref_long_double": self.ref_long_double,
+                          "ref_cache": ref_cache, "seed": seed}
                 vkwargs.append(kwargs)
         if self.db is not None:
             # TODO secure the db with a context 'with'
@@ -509,111 +1181,124 @@ class TestFFTSystematic(unittest.TestCase):
                         'ndims int, ndim int, precision int, inplace int, norm int, lut int,'
                         'n int, n2_fft float, n2_ifft float, ni_fft float, ni_ifft float, tolerance float,'
                         'dt_app float, dt_fft float, dt_ifft float, src_unchanged_fft int, src_unchanged_ifft int,'
-                        'gpu_name text, success int, error int, vkfft_error_code int)')
+                        'gpu_name text, success int, error int, vkfft_error_code int, vkfft_version text)')
+            # Databases created with previous versions lack the vkfft_version column
+            if 'vkfft_version' not in [r[1] for r in dbc.execute('PRAGMA table_info(pyvkfft_test)')]:
+                dbc.execute('ALTER TABLE pyvkfft_test ADD COLUMN vkfft_version text')
             db.commit()
             hostname = socket.gethostname()
-            lang = 'opencl' if 'opencl' in backend else 'cuda'
             if self.r2c:
                 transform = "R2C"
             elif self.dct:
                 transform = "DCT%d" % self.dct
+            elif self.dst:
+                transform = "DST%d" % self.dst
             else:
                 transform = "C2C"
+            if self.resume:
+                # Skip the configurations already tested with the same GPU and VkFFT version
+                done = set()
+                for backend in self.vbackend:
+                    dbc.execute('SELECT backend, axes, array_shape FROM pyvkfft_test WHERE backend=? AND '
+                                'transform=? AND precision=? AND inplace=? AND norm=? AND lut=? AND '
+                                'vkfft_version=? AND gpu_name=?',
+                                (backend, transform, np.dtype(self.dtype).itemsize, self.inplace, self.norm,
+                                 self.lut, vkfft_version(), get_gpu_name(backend, self.gpu).encode('ascii')))
+                    done.update(dbc.fetchall())
+                nb = len(vkwargs)
+                vkwargs = [v for v in vkwargs if (v['backend'], str(v['axes']).encode('ascii'),
+                                                  str(v['shape']).encode('ascii')) not in done]
+                if self.verbose:
+                    print("Resuming: %d tests already in the database are skipped" % (nb - len(vkwargs)))
 
         # For graph output
         vn, vni, vn2, vnii, vn2i, vblue, vshape = [], [], [], [], [], [], []
         gpu_name = "GPU"
 
+        # Estimated memory for each test, so the number of parallel tests is adapted
+        # to the free memory (using nproc at most)
+        vmem = [accuracy_test_memory(**v) for v in vkwargs]
+        max_mem = np.inf, np.inf
+        if not self.serial and len(self.vbackend):
+            gpu_free, host_free = np.array([get_free_memory(b, self.gpu) for b in self.vbackend]).min(axis=0)
+            max_mem = 0.9 * gpu_free, 0.8 * host_free
+
         if self.verbose:
             print("Starting %d tests..." % (len(vkwargs)))
         t0 = timeit.default_timer()
 
-        # Handle timeouts if for some weird reason a process hangs indefinitely
-        nb_timeout = 0
-        i_start = 0
-
-        while True:
-            timeout = False
-            # Need to use spawn to handle the GPU context
-            with multiprocessing.get_context('spawn').Pool(self.nproc) as pool:
-                if not self.serial:
-                    results = pool.imap(test_accuracy_kwargs, vkwargs[i_start:], chunksize=1)
-                for i in range(i_start, len(vkwargs)):
-                    v = vkwargs[i]
-                    sh = v['shape']
-                    ndim = len(sh)
-                    # We use np.dtype(dtype) instead of dtype because it is written out simply
-                    # as e.g. "float32" instead of "<class 'numpy.float32'>"
-                    with self.subTest(backend=backend, shape=sh, ndim=ndim,
-                                      dtype=np.dtype(self.dtype), norm=self.norm, use_lut=self.lut,
-                                      inplace=self.inplace, r2c=self.r2c, dct=self.dct):
-                        if self.serial:
-                            res = test_accuracy_kwargs(v)
-                        else:
-                            try:
-                                res = results.next(timeout=self.timeout)
-                            except multiprocessing.TimeoutError as ex:
-                                # NB: the timeout won't change the next() result, so will need
-                                # to terminate & restart the pool
-                                timeout = True
-                                raise ex
-                        n = max(res['shape'])
-                        npr = primes(n)
-                        ni, n2 = res["ni"], res["n2"]
-                        nii, n2i = res["nii"], res["n2i"]
-                        tol = res["tol"]
-                        src1 = res["src_unchanged_fft"]
-                        src2 = res["src_unchanged_ifft"]
-                        succ = max(ni, nii) < tol
-
-                        vn.append(n)
-                        vblue.append(max(npr) > 13)
-                        vni.append(ni)
-                        vn2.append(n2)
-                        vn2i.append(n2i)
-                        vnii.append(nii)
-                        vshape.append(sh)
-                        if len(vn) == 1:
-                            gpu_name = res["gpu_name"]
-
-                        if not self.inplace:
-                            if not src1:
-                                succ = False
-                            elif not self.r2c and not src2:
-                                succ = False
-                        if self.db is not None:
-                            dbc.execute('INSERT INTO pyvkfft_test VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,'
-                                        '?,?,?,?,?,?,?,?,?,?,?,?,?)',
-                                        (time.time(), hostname, backend, lang, transform,
-                                         str(res['axes']).encode('ascii'), str(res['shape']).encode('ascii'),
-                                         len(res['shape']), ndim, np.dtype(self.dtype).itemsize,
-                                         self.inplace, self.norm, self.lut, int(max(res['shape'])), float(n2),
-                                         float(n2i),
-                                         float(ni), float(nii), float(tol), res["dt_app"], res["dt_fft"],
-                                         res["dt_ifft"],
-                                         int(src1), int(src2), res["gpu_name"].encode('ascii'), int(succ), 0, 0))
-                            db.commit()
-                        if self.verbose:
-                            print(res['str'])
-                        self.assertTrue(ni < tol, "Accuracy mismatch after FFT, n2=%8e ni=%8e>%8e" % (n2, ni, tol))
-                        self.assertTrue(nii < tol, "Accuracy mismatch after iFFT, n2=%8e ni=%8e>%8e" % (n2, nii, tol))
-                        if not self.inplace:
-                            self.assertTrue(src1, "The source array was modified during the FFT")
-                            nmaxr2c1d = 3072 * (1 + int(self.dtype in (np.float32, np.complex64)))
-                            if not self.r2c or (ndim == 1 and max(npr) <= 13) and n < nmaxr2c1d:
-                                # Only 1D radix C2R do not alter the source array, if n<=?
-                                self.assertTrue(src2,
-                                                "The source array was modified during the iFFT %d %d" % (n, nmaxr2c1d))
-                    if timeout:
-                        # One process is stuck, must kill the pool and start again
-                        if self.verbose:
-                            print("Timeout for N=%d. Re-starting the pool..." % max(v['shape']))
-                        i_start = i + 1
-                        pool.terminate()
-                        nb_timeout += 1
-                        break
-            if not timeout or i_start >= len(vkwargs) or nb_timeout >= 4:
-                break
+        if not self.serial and len(vkwargs):
+            # The pool can be shared by successive tests, keeping the workers and their GPU contexts
+            pool = self.pool
+            if pool is None:
+                pool = AccuracyTestPool(self.nproc)
+                self.addCleanup(pool.close)
+            results = pool.imap(vkwargs, vmem, max_mem, timeout=self.timeout)
+        for v in vkwargs:
+            backend = v['backend']
+            sh = v['shape']
+            ndim = len(sh)
+            # We use np.dtype(dtype) instead of dtype because it is written out simply
+            # as e.g. "float32" instead of "<class 'numpy.float32'>"
+            with self.subTest(backend=backend, shape=sh, ndim=ndim,
+                              dtype=np.dtype(self.dtype), norm=self.norm, use_lut=self.lut,
+                              inplace=self.inplace, r2c=self.r2c, dct=self.dct, dst=self.dst):
+                if self.serial:
+                    res = test_accuracy_kwargs(v)
+                else:
+                    res = next(results)
+                    if isinstance(res, Exception):
+                        # Exception raised by the test, or timeout (the worker has been replaced)
+                        raise res
+                n = max(res['shape'])
+                npr = primes(n)
+                ni, n2 = res["ni"], res["n2"]
+                nii, n2i = res["nii"], res["n2i"]
+                tol = res["tol"]
+                src1 = res["src_unchanged_fft"]
+                src2 = res["src_unchanged_ifft"]
+                succ = max(ni, nii) < tol
+
+                vn.append(n)
+                vblue.append(max(npr) > 13)
+                vni.append(ni)
+                vn2.append(n2)
+                vn2i.append(n2i)
+                vnii.append(nii)
+                vshape.append(sh)
+                if len(vn) == 1:
+                    gpu_name = res["gpu_name"]
+
+                if not self.inplace:
+                    if not src1:
+                        succ = False
+                    elif not self.r2c and not src2:
+                        succ = False
+                if self.db is not None:
+                    lang = 'opencl' if 'opencl' in backend else 'cuda'
+                    dbc.execute('INSERT INTO pyvkfft_test VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,'
+                                '?,?,?,?,?,?,?,?,?,?,?,?,?,?)',
+                                (time.time(), hostname, backend, lang, transform,
+                                 str(res['axes']).encode('ascii'), str(res['shape']).encode('ascii'),
+                                 len(res['shape']), ndim, np.dtype(self.dtype).itemsize,
+                                 self.inplace, self.norm, self.lut, int(max(res['shape'])), float(n2),
+                                 float(n2i),
+                                 float(ni), float(nii), float(tol), res["dt_app"], res["dt_fft"],
+                                 res["dt_ifft"],
+                                 int(src1), int(src2), res["gpu_name"].encode('ascii'), int(succ), 0, 0,
+                                 vkfft_version()))
+                    db.commit()
+                if self.verbose:
+                    print(res['str'])
+                self.assertTrue(ni < tol, "Accuracy mismatch after FFT, n2=%8e ni=%8e>%8e" % (n2, ni, tol))
+                self.assertTrue(nii < tol, "Accuracy mismatch after iFFT, n2=%8e ni=%8e>%8e" % (n2, nii, tol))
+                if not self.inplace:
+                    self.assertTrue(src1, "The source array was modified during the FFT")
+                    nmaxr2c1d = 3072 * (1 + int(self.dtype in (np.float32, np.complex64)))
+                    if not self.r2c or (ndim == 1 and max(npr) <= 13) and n < nmaxr2c1d:
+                        # Only 1D radix C2R do not alter the source array, if n<=?
+                        self.assertTrue(src2,
+                                        "The source array was modified during the iFFT %d %d" % (n, nmaxr2c1d))
         self.__class__.nb_test = len(self.vbackend) * len(vkwargs)
         if self.verbose:
             print("Finished %d tests in %s" %
@@ -624,6 +1309,8 @@ class TestFFTSystematic(unittest.TestCase):
                 t = "R2C"
             elif self.dct:
                 t = "DCT%d" % self.dct
+            elif self.dst:
+                t = "DST%d" % self.dst
             else:
                 t = "C2C"
 
@@ -650,7 +1337,9 @@ class TestFFTSystematic(unittest.TestCase):
                 sndim = "%dD" % self.ndim
             suptit = " %s %s%s N=%d-%d norm=%d %s%s" % \
                      (t, sndim, r, self.range[0], self.range[1], self.norm, str(np.dtype(np.float32)), tmp)
-            if self.ref_long_double and has_scipy:
+            if self.ref_long_double == 'auto' and has_scipy:
+                suptit += " [auto ref]"
+            elif self.ref_long_double and has_scipy:
                 suptit += " [long double ref]"
             suptit += " [%d tests]" % self.nb_test
 
@@ -689,8 +1378,103 @@ class TestFFTSystematic(unittest.TestCase):
             if self.verbose:
                 print("Saved accuracy graph to: %s" % graph)
 
-        if nb_timeout >= 4:
-            raise RuntimeError("4 multiprocessing timeouts while testing... giving up")
+    def test_systematic_perf(self):
+        """
+        Measure the GPU time of the transforms, and compare it to a baseline
+        stored in the database, to detect performance regressions.
+        """
+        if not self.perf:
+            raise unittest.SkipTest("Performance tests are only run with perf=True")
+        if self.dry_run:
+            self.__class__.nb_shapes_gen = len(self.vshape)
+            return
+        vkwargs = []
+        for backend in self.vbackend:
+            for s in self.vshape:
+                vkwargs.append({"backend": backend, "shape": s, "ndim": len(s), "axes": self.axes,
+                                "dtype": self.dtype, "inplace": self.inplace, "norm": self.norm,
+                                "use_lut": self.lut, "r2c": self.r2c, "dct": self.dct, "dst": self.dst,
+                                "gpu_name": self.gpu, "verbose": False})
+        if self.r2c:
+            transform = "R2C"
+        elif self.dct:
+            transform = "DCT%d" % self.dct
+        elif self.dst:
+            transform = "DST%d" % self.dst
+        else:
+            transform = "C2C"
+        if self.db is not None:
+            db = sqlite3.connect(self.db)
+            self.addCleanup(db.close)
+            dbc = db.cursor()
+            dbc.execute('CREATE TABLE IF NOT EXISTS pyvkfft_perf (epoch int, hostname int, backend text,'
+                        'transform text, axes text, array_shape text, ndim int, precision int, inplace int,'
+                        'norm int, lut int, gpu_name text, vkfft_version text, nb int, dt_app float,'
+                        'dt_fft float, dt_fft_std float, dt_ifft float, dt_ifft_std float)')
+            db.commit()
+            hostname = socket.gethostname()
+
+        if self.verbose:
+            print("Starting %d performance tests..." % (len(vkwargs)))
+        t0 = timeit.default_timer()
+        if not self.serial and len(vkwargs):
+            # Use a single worker process, so that the timings are not disturbed by parallel
+            # tests, but the timeout can be used
+            pool = AccuracyTestPool(1, func=speed_test_kwargs)
+            self.addCleanup(pool.close)
+            results = pool.imap(vkwargs, timeout=self.timeout)
+        nb_slow = 0
+        for v in vkwargs:
+            backend = v['backend']
+            sh = v['shape']
+            with self.subTest(backend=backend, shape=sh, ndim=len(sh), dtype=np.dtype(self.dtype), norm=self.norm,
+                              use_lut=self.lut, inplace=self.inplace, r2c=self.r2c, dct=self.dct, dst=self.dst):
+                if self.serial:
+                    res = speed_test_kwargs(v)
+                else:
+                    res = next(results)
+                    if isinstance(res, Exception):
+                        raise res
+                msg = res['str']
+                slow = False
+                if self.db is not None:
+                    config = (backend, transform, str(res['axes']).encode('ascii'), str(sh).encode('ascii'),
+                              np.dtype(self.dtype).itemsize, self.inplace, self.norm, self.lut,
+                              res["gpu_name"].encode('ascii'))
+                    sql = 'SELECT vkfft_version, nb, dt_fft, dt_fft_std, dt_ifft, dt_ifft_std FROM pyvkfft_perf ' \
+                          'WHERE backend=? AND transform=? AND axes=? AND array_shape=? AND precision=? AND ' \
+                          'inplace=? AND norm=? AND lut=? AND gpu_name=?'
+                    if self.perf_baseline is not None:
+                        sql += ' AND vkfft_version=?'
+                        config += (self.perf_baseline,)
+                    # The baseline is the latest stored result for the same configuration
+                    dbc.execute(sql + ' ORDER BY epoch DESC LIMIT 1', config)
+                    base = dbc.fetchone()
+                    if base is not None:
+                        ver0, nb0, dt0, dt0_std, dti0, dti0_std = base
+                        slow_fft = is_slower(res['dt_fft'], res['dt_fft_std'], res['nb_repeat'], dt0, dt0_std, nb0,
+                                             threshold=self.perf_threshold)
+                        slow_ifft = is_slower(res['dt_ifft'], res['dt_ifft_std'], res['nb_repeat'], dti0,
+                                              dti0_std, nb0, threshold=self.perf_threshold)
+                        slow = slow_fft or slow_ifft
+                        msg += " [VkFFT %s: %+6.1f%% %+6.1f%%]%s" % \
+                               (ver0, (res['dt_fft'] / dt0 - 1) * 100, (res['dt_ifft'] / dti0 - 1) * 100,
+                                " SLOWER" if slow else "")
+                    dbc.execute('INSERT INTO pyvkfft_perf VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)',
+                                (time.time(), hostname, backend, transform, str(res['axes']).encode('ascii'),
+                                 str(sh).encode('ascii'), len(sh), np.dtype(self.dtype).itemsize, self.inplace,
+                                 self.norm, self.lut, res["gpu_name"].encode('ascii'), vkfft_version(),
+                                 res['nb_repeat'], res['dt_app'], res['dt_fft'], res['dt_fft_std'],
+                                 res['dt_ifft'], res['dt_ifft_std']))
+                    db.commit()
+                if self.verbose:
+                    print(msg)
+                nb_slow += slow
+                self.assertFalse(slow, "Performance regression: %s" % msg)
+        self.__class__.nb_test = len(vkwargs)
+        if self.verbose:
+            print("Finished %d performance tests in %s, %d slower than the baseline" %
+                  (len(vkwargs), time.strftime("%Hh %Mm %Ss", time.gmtime(timeit.default_timer() - t0)), nb_slow))
 
 
 def suite():
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+
+# PyVkFFT
+#   (c) 2022- : ESRF-European Synchrotron Radiation Facility
+#       authors:
+#         Vincent Favre-Nicolin, favre@esrf.fr
+#
+#
+# Auto-tuning of VkFFT parameters
+
+"""
+Auto-tuning of the VkFFT parameters (coalescedMemory, aimThreads, registerBoost,...)
+for a given transform and GPU. The best parameters are stored in a sqlite
+database (by default ~/.cache/pyvkfft/tune.db, see pyvkfft.config.TUNE_DB),
+which is used automatically when a VkFFTApp is created, including through
+the pyvkfft.fft interface.
+"""
+
+import functools
+import importlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from . import config
+
+# The VkFFT parameters tested by default by tune(), with their candidate values
+tune_candidates = {"coalescedMemory": [32, 64, 128], "aimThreads": [32, 64, 128, 256],
+                   "registerBoost": [1, 2, 4], "disableReorderFourStep": [0, 1]}
+
+# Tuned parameters loaded from the database: (db, backend, gpu_name, vkfft_version) -> {key: params}
+_tuned = {}
+_lock = threading.Lock()
+
+
+def _db_path(db=None):
+    return config.TUNE_DB if db is None else db
+
+
+def _backend_vkfft_version(backend):
+    """ Get the VkFFT version used by a backend library ('cuda' or 'opencl'), only importing this backend """
+    return importlib.import_module('.' + backend, __package__).vkfft_version()
+
+
+def has_tuning_db(db=None):
+    """
+    Check if the tuning database exists.
+
+    :param db: the path to the database. If None, pyvkfft.config.TUNE_DB is used
+    :return: True if the database file exists
+    """
+    db = _db_path(db)
+    return bool(db) and os.path.exists(db)
+
+
+def tuning_key(app):
+    """
+    Get the key identifying a transform in the tuning database. It only depends
+    on the parameters which determine the VkFFT kernels, so that e.g. arrays
+    with the same shape after collapsing the non-transformed axes share the
+    same tuned parameters.
+
+    :param app: the VkFFTApp
+    :return: the key, as a string
+    """
+    return json.dumps([[int(n) for n in app.shape], [int(s) for s in app.skip_axis], int(app.ndim),
+                       int(app.inplace), int(app.r2c), int(app.dct), int(app.dst), int(app.precision),
+                       int(app.compute_precision), str(app.norm), int(app.preserve_input)])
+
+
+def _connect(db):
+    d = os.path.dirname(db)
+    if len(d):
+        os.makedirs(d, exist_ok=True)
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE IF NOT EXISTS pyvkfft_tune (backend TEXT, gpu_name TEXT, vkfft_version TEXT,"
+                 "key TEXT, params TEXT, dt REAL, dt_default REAL, epoch REAL,"
+                 "PRIMARY KEY (backend, gpu_name, vkfft_version, key))")
+    return conn
+
+
+def get_tuned_params(backend, gpu_name, key, db=None, version=None):
+    """
+    Get the tuned parameters for a transform. The database is only read once
+    for each backend and GPU, so this is fast enough to be used for each
+    VkFFTApp creation.
+
+    :param backend: the backend library, 'cuda' or 'opencl'
+    :param gpu_name: the name of the GPU
+    :param key: the transform key, see tuning_key()
+    :param db: the path to the database. If None, pyvkfft.config.TUNE_DB is used
+    :param version: the VkFFT version. If None, the one used by the backend library is used
+    :return: a dictionary with the tuned VkFFT parameters, which is empty
+        if the transform has not been tuned.
+    """
+    db = _db_path(db)
+    if not has_tuning_db(db):
+        return {}
+    if version is None:
+        version = _backend_vkfft_version(backend)
+    k = (db, backend, gpu_name, version)
+    with _lock:
+        if k not in _tuned:
+            conn = sqlite3.connect(db)
+            try:
+                rows = conn.execute("SELECT key, params FROM pyvkfft_tune WHERE backend = ? AND gpu_name = ? "
+                                    "AND vkfft_version = ?", k[1:]).fetchall()
+            except sqlite3.OperationalError:
+                # Empty database
+                rows = []
+            finally:
+                conn.close()
+            _tuned[k] = {r[0]: json.loads(r[1]) for r in rows}
+        return dict(_tuned[k].get(key, {}))
+
+
+def save_tuned_params(backend, gpu_name, key, params, dt=None, dt_default=None, db=None, version=None):
+    """
+    Save the tuned parameters for a transform to the database, replacing any
+    previous entry for the same transform, GPU and VkFFT version.
+
+    :param backend: the backend library, 'cuda' or 'opencl'
+    :param gpu_name: the name of the GPU
+    :param key: the transform key, see tuning_key()
+    :param params: a dictionary with the VkFFT parameters. An empty dictionary
+        means that the VkFFT default parameters are the fastest.
+    :param dt: the time for the transform with the tuned parameters (seconds)
+    :param dt_default: the time for the transform with the default parameters (seconds)
+    :param db: the path to the database. If None, pyvkfft.config.TUNE_DB is used
+    :param version: the VkFFT version. If None, the one used by the backend library is used
+    """
+    db = _db_path(db)
+    if not len(db):
+        raise RuntimeError("save_tuned_params: no tuning database path (pyvkfft.config.TUNE_DB is empty)")
+    if version is None:
+        version = _backend_vkfft_version(backend)
+    conn = _connect(db)
+    try:
+        conn.execute("INSERT OR REPLACE INTO pyvkfft_tune VALUES (?,?,?,?,?,?,?,?)",
+                     (backend, gpu_name, version, key, json.dumps(params), dt, dt_default, time.time()))
+        conn.commit()
+    finally:
+        conn.close()
+    clear_tuning_cache()
+
+
+def clear_tuning_cache():
+    """
+    Clear the tuned parameters loaded from the database, so they are read again
+    when the next VkFFTApp is created. Note that VkFFTApp already created (e.g. in
+    the pyvkfft.fft cache, see clear_vkfftapp_cache) are not affected.
+    """
+    with _lock:
+        _tuned.clear()
+
+
+def tune(backend, shape, dtype=np.complex64, ndim=None, axes=None, inplace=False, norm=1, r2c=False,
+         dct=False, dst=False, compute_dtype=None, candidates=None, nb_repeat=20, rel_gain=0.02,
+         gpu_name=None, opencl_platform=None, db=None, save=True, verbose=False):
+    """
+    Find the VkFFT parameters giving the fastest transform for a given shape and GPU,
+    and save them to the tuning database.
+
+    The search is greedy: the parameters are tuned one after the other, each
+    candidate value being tested with the best values found so far for the
+    previous parameters (and the VkFFT defaults for the following ones).
+    The speed is measured as the median GPU time of a forward plus a backward
+    transform (see pyvkfft.accuracy.gpu_timings). A candidate is only retained
+    if it is faster than the current best by more than rel_gain, so that timing
+    noise does not lead to storing parameters without any real benefit.
+
+    :param backend: either 'pyopencl', 'pycuda' or 'cupy'
+    :param shape: the shape of the array. For an inplace r2c transform, two extra
+        values are appended along x, so the actual transform shape is the one supplied.
+    :param dtype: the array dtype: np.complex64 or np.complex128 (C2C), np.float32 or
+        np.float64 (R2C, DCT and DST), or pyvkfft.base.complex32.
+    :param ndim: the number of transform dimensions. Can be None if axes is given
+    :param axes: the transform axes. Supersedes ndim
+    :param inplace: if True, tune an inplace transform
+    :param norm: either 0, 1 or "ortho"
+    :param r2c: if True, tune a real-to-complex transform
+    :param dct: 1, 2, 3 or 4 to tune a DCT
+    :param dst: 1, 2, 3 or 4 to tune a DST
+    :param compute_dtype: the dtype used for the calculations, if different from dtype
+    :param candidates: a dictionary with the VkFFT parameters to tune and the list of
+        their values to test. If None, tune_candidates is used.
+    :param nb_repeat: the number of timed transforms for each set of parameters
+    :param rel_gain: the minimum relative gain for a candidate to be retained
+    :param gpu_name: the (sub)string used to select the GPU
+    :param opencl_platform: the (sub)string used to select the OpenCL platform
+    :param db: the path to the database. If None, pyvkfft.config.TUNE_DB is used
+    :param save: if True, save the best parameters to the database
+    :param verbose: if True, print the time for each tested set of parameters
+    :return: a dictionary with 'params' (the best VkFFT parameters, empty if the
+        defaults are the fastest), 'dt' and 'dt_default' (the median GPU time of the
+        forward and backward transforms with the best and default parameters, in seconds),
+        'nb_plan' (the number of tested sets of parameters), 'backend', 'gpu_name' and 'key'
+    """
+    from .accuracy import init_ctx, gpu_ctx_dic, gpu_timings, make_random_array, complex_to_half
+    from .base import complex32
+    init_ctx(backend, gpu_name=gpu_name, opencl_platform=opencl_platform)
+    half = dtype == complex32
+    if dtype in (np.complex64, np.float32) or half:
+        dtypec, dtypef = np.complex64, np.float32
+    else:
+        dtypec, dtypef = np.complex128, np.float64
+    shape = list(shape)
+    shapec = list(shape)
+    if r2c:
+        shapec[-1] = shapec[-1] // 2 + 1
+        if inplace:
+            shape[-1] += 2
+    shape = tuple(shape)
+    d0 = make_random_array(shape, dtypef if r2c or dct or dst else dtypec, seed=0)
+    if half:
+        d0 = complex_to_half(d0)
+    dtype_app = complex32 if half else d0.dtype
+
+    if backend == "pyopencl":
+        import pyopencl as cl
+        import pyopencl.array as cla
+        from .opencl import VkFFTApp, vkfft_version
+        # A dedicated queue is needed to get the profiling information
+        queue = cl.CommandQueue(gpu_ctx_dic["pyopencl"][1], properties=cl.command_queue_properties.PROFILING_ENABLE)
+        d_gpu = cla.to_device(queue, d0)
+        empty = functools.partial(cla.empty, queue)
+
+        def make_app(params):
+            return VkFFTApp(shape, dtype_app, queue, ndim=ndim, axes=axes, inplace=inplace, norm=norm, r2c=r2c,
+                            dct=dct, dst=dst, compute_dtype=compute_dtype, use_tuning=False, **params)
+    else:
+        from .cuda import VkFFTApp, vkfft_version
+        if backend == "pycuda":
+            import pycuda.gpuarray as cua
+            to_gpu, empty = cua.to_gpu, cua.empty
+        else:
+            import cupy as cp
+            to_gpu, empty = cp.array, cp.empty
+        d_gpu = to_gpu(d0)
+
+        def make_app(params):
+            return VkFFTApp(shape, dtype_app, ndim=ndim, axes=axes, inplace=inplace, norm=norm, r2c=r2c,
+                            dct=dct, dst=dst, compute_dtype=compute_dtype, use_tuning=False, **params)
+    if inplace:
+        d1_gpu, d2_gpu = d_gpu, d_gpu
+    else:
+        d1_gpu = empty(tuple(shapec), dtype=dtypec) if r2c else d_gpu.copy()
+        d2_gpu = d_gpu.copy()
+
+    def reset():
+        if inplace:
+            # Avoid an overflow after repeated transforms with norm=0
+            d_gpu.set(d0)
+
+    def timing(params):
+        app = make_app(params)
+        dt = np.median(gpu_timings(app, d_gpu, None if inplace else d1_gpu, nb_repeat=nb_repeat, reset=reset)["dt"])
+        dt += np.median(gpu_timings(app, d1_gpu, None if inplace else d2_gpu, inverse=True, nb_repeat=nb_repeat,
+                                    reset=reset)["dt"])
+        if verbose:
+            print("%8s %20s %s: %8.4fms" % (backend, str(shape).replace(" ", ""), params, dt * 1000))
+        return app, dt
+
+    app, dt_default = timing({})
+    vkbackend = "opencl" if backend == "pyopencl" else "cuda"
+    gpu_name, key = app._get_gpu_name(), tuning_key(app)
+    del app
+    best, dt_best, nb_plan = {}, dt_default, 1
+    for k, values in (tune_candidates if candidates is None else candidates).items():
+        best_k = best
+        for v in values:
+            p = dict(best, **{k: v})
+            try:
+                app, dt = timing(p)
+                del app
+            except RuntimeError as ex:
+                # Some combinations of parameters are not supported by VkFFT
+                if verbose:
+                    print("%8s %20s %s: failed (%s)" % (backend, str(shape).replace(" ", ""), p, str(ex)))
+                continue
+            nb_plan += 1
+            if dt < dt_best * (1 - rel_gain):
+                best_k, dt_best = p, dt
+        best = best_k
+    if save:
+        save_tuned_params(vkbackend, gpu_name, key, best, dt=dt_best, dt_default=dt_default, db=db,
+                          version=vkfft_version())
+    return {"params": best, "dt": dt_best, "dt_default": dt_default, "nb_plan": nb_plan, "backend": backend,
+            "gpu_name": gpu_name, "key": key}
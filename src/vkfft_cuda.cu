@@ -10,7 +10,114 @@
 #include <iostream>
 #include <fstream>
 #include <memory>
+#include <vector>
+#include <chrono>
 using namespace std;
+
+#include <cuda.h>
+#include <cuda_runtime.h>
+#include <nvrtc.h>
+
+// Number of kernels launched by the last fft() or ifft() call in this thread.
+// VkFFT kernel launches are counted by wrapping cuLaunchKernel
+static thread_local size_t nb_dispatch = 0;
+
+// Profiling of each kernel launch, only if enabled with set_profiling()
+struct DispatchProfile
+{
+  size_t grid[3];
+  size_t block[3];
+  CUevent start;
+  CUevent end;
+};
+static thread_local int profiling = 0;
+static thread_local vector<DispatchProfile> vprofile;
+
+static CUresult pyvkfft_cuLaunchKernel(CUfunction f, unsigned int gridDimX, unsigned int gridDimY,
+                                      unsigned int gridDimZ, unsigned int blockDimX, unsigned int blockDimY,
+                                      unsigned int blockDimZ, unsigned int sharedMemBytes, CUstream hStream,
+                                      void **kernelParams, void **extra)
+{
+  nb_dispatch++;
+  if(!profiling)
+    return cuLaunchKernel(f, gridDimX, gridDimY, gridDimZ, blockDimX, blockDimY, blockDimZ, sharedMemBytes,
+                          hStream, kernelParams, extra);
+  DispatchProfile p = {{gridDimX, gridDimY, gridDimZ}, {blockDimX, blockDimY, blockDimZ}, NULL, NULL};
+  cuEventCreate(&(p.start), CU_EVENT_DEFAULT);
+  cuEventCreate(&(p.end), CU_EVENT_DEFAULT);
+  cuEventRecord(p.start, hStream);
+  const CUresult res = cuLaunchKernel(f, gridDimX, gridDimY, gridDimZ, blockDimX, blockDimY, blockDimZ,
+                                      sharedMemBytes, hStream, kernelParams, extra);
+  cuEventRecord(p.end, hStream);
+  vprofile.push_back(p);
+  return res;
+}
+
+// Destroy the profiling events of the previous transform
+static void clear_profile()
+{
+  for(size_t i = 0; i < vprofile.size(); i++)
+  {
+    cuEventDestroy(vprofile[i].start);
+    cuEventDestroy(vprofile[i].end);
+  }
+  vprofile.clear();
+  nb_dispatch = 0;
+}
+#define cuLaunchKernel pyvkfft_cuLaunchKernel
+
+// Breakdown of the time spent in the last init_app() call made in this thread. The time spent
+// compiling the kernels (nvrtcCompileProgram, cuModuleLoadDataEx) and allocating & initialising
+// the VkFFT buffers (cudaMalloc, cudaMemcpy e.g. for the LUT) is measured by wrapping these
+// functions, and the remaining time is spent generating the kernels code.
+static thread_local double init_time_total = 0;
+static thread_local double init_time_compile = 0;
+static thread_local double init_time_alloc = 0;
+static thread_local size_t init_nb_compile = 0;
+
+static double elapsed(const chrono::steady_clock::time_point &t0)
+{
+  return chrono::duration<double>(chrono::steady_clock::now() - t0).count();
+}
+
+static nvrtcResult pyvkfft_nvrtcCompileProgram(nvrtcProgram prog, int numOptions, const char * const *options)
+{
+  const chrono::steady_clock::time_point t0 = chrono::steady_clock::now();
+  const nvrtcResult res = nvrtcCompileProgram(prog, numOptions, options);
+  init_time_compile += elapsed(t0);
+  init_nb_compile++;
+  return res;
+}
+
+static CUresult pyvkfft_cuModuleLoadDataEx(CUmodule *module, const void *image, unsigned int numOptions,
+                                           CUjit_option *options, void **optionValues)
+{
+  const chrono::steady_clock::time_point t0 = chrono::steady_clock::now();
+  const CUresult res = cuModuleLoadDataEx(module, image, numOptions, options, optionValues);
+  init_time_compile += elapsed(t0);
+  return res;
+}
+
+template<class T> static cudaError_t pyvkfft_cudaMalloc(T **devPtr, size_t size)
+{
+  const chrono::steady_clock::time_point t0 = chrono::steady_clock::now();
+  const cudaError_t res = cudaMalloc((void **)devPtr, size);
+  init_time_alloc += elapsed(t0);
+  return res;
+}
+
+static cudaError_t pyvkfft_cudaMemcpy(void *dst, const void *src, size_t count, cudaMemcpyKind kind)
+{
+  const chrono::steady_clock::time_point t0 = chrono::steady_clock::now();
+  const cudaError_t res = cudaMemcpy(dst, src, count, kind);
+  init_time_alloc += elapsed(t0);
+  return res;
+}
+#define nvrtcCompileProgram pyvkfft_nvrtcCompileProgram
+#define cuModuleLoadDataEx pyvkfft_cuModuleLoadDataEx
+#define cudaMalloc pyvkfft_cudaMalloc
+#define cudaMemcpy pyvkfft_cudaMemcpy
+
 #include "vkFFT.h"
 typedef float2 Complex;
 
@@ -22,8 +129,9 @@ typedef float2 Complex;
 
 
 LIBRARY_API VkFFTConfiguration* make_config(const size_t, const size_t, const size_t, const size_t, void*, void*, void*,
-                                const int, const size_t, const int, const int, const int, const int,
-                                const int, const int, const size_t, const int, const int, const int);
+                                const int, const size_t, const size_t, const int, const int, const int, const int,
+                                const int, const int, const int, const size_t, const int, const int, const int,
+                                const int, const int, const int, const int);
 
 LIBRARY_API VkFFTApplication* init_app(const VkFFTConfiguration*, int*);
 
@@ -35,8 +143,22 @@ LIBRARY_API void free_app(VkFFTApplication* app);
 
 LIBRARY_API void free_config(VkFFTConfiguration *config);
 
+LIBRARY_API size_t get_buffer_nbytes(VkFFTApplication* app);
+
 LIBRARY_API uint32_t vkfft_version();
 
+LIBRARY_API size_t get_nb_dispatch();
+
+LIBRARY_API void set_profiling(const int);
+
+LIBRARY_API int get_dispatch_profile(const size_t, size_t*, size_t*, double*);
+
+LIBRARY_API size_t get_init_profile(double*);
+
+LIBRARY_API int dst_supported();
+
+LIBRARY_API int stream_wait(void*, void*);
+
 
 class PyVkFFT
 {
@@ -65,15 +187,24 @@ class PyVkFFT
 * \param hstream: the stream handle (CUstream)
 * \param norm: 0, the L2 norm is multiplied by the size on each transform, 1, the inverse transform
 *   divides the L2 norm by the size.
-* \param precision: number of bits per float, 16=half, 32=single, 64=double precision
+* \param precision: number of bytes per float, 2=half, 4=single, 8=double precision
+* \param precision_compute: number of bytes per float used for the calculations. This can
+*  be larger than precision: 4 with half precision (halfPrecisionMemoryOnly, out-of-place only)
+*  or 8 with single precision (doublePrecisionFloatMemory)
+* \param preserve_input: if 1 and buffer_out is not NULL, the calculations are made in an internal
+*  buffer, so that the source array is not modified by either the forward or the inverse transform
+* \param disableReorderFourStep, registerBoost, useLUT, keepShaderCode, coalescedMemory, aimThreads,
+*  numSharedBanks: VkFFT parameters, only used if >=0 (otherwise the VkFFT default is used)
 * \return: the pointer to the newly created VkFFTConfiguration, or 0 if an error occurred.
 */
 VkFFTConfiguration* make_config(const size_t nx, const size_t ny, const size_t nz, const size_t fftdim,
                                 void *buffer, void *buffer_out, void* hstream,
-                                const int norm, const size_t precision, const int r2c, const int dct,
+                                const int norm, const size_t precision, const size_t precision_compute,
+                                const int r2c, const int dct, const int dst,
                                 const int disableReorderFourStep, const int registerBoost,
                                 const int useLUT, const int keepShaderCode, const size_t n_batch,
-                                const int skipx, const int skipy, const int skipz)
+                                const int skipx, const int skipy, const int skipz, const int preserve_input,
+                                const int coalescedMemory, const int aimThreads, const int numSharedBanks)
 {
   VkFFTConfiguration *config = new VkFFTConfiguration({});
   config->FFTdim = fftdim;
@@ -89,6 +220,9 @@ VkFFTConfiguration* make_config(const size_t nx, const size_t ny, const size_t n
   config->normalize = norm;
   config->performR2C = r2c;
   config->performDCT = dct;
+#if defined(VKFFT_VERSION) && (VKFFT_VERSION >= 10300)
+  config->performDST = dst;
+#endif
 
   if(disableReorderFourStep>=0)
     config->disableReorderFourStep = disableReorderFourStep;
@@ -102,12 +236,28 @@ VkFFTConfiguration* make_config(const size_t nx, const size_t ny, const size_t n
   if(keepShaderCode>=0)
     config->keepShaderCode = keepShaderCode;
 
+  if(coalescedMemory>=0)
+    config->coalescedMemory = coalescedMemory;
+
+  if(aimThreads>=0)
+    config->aimThreads = aimThreads;
+
+  if(numSharedBanks>=0)
+    config->numSharedBanks = numSharedBanks;
+
   switch(precision)
   {
-      case 2 : config->halfPrecision = 1;
-      case 8 : config->doublePrecision = 1;
+      case 2 : config->halfPrecision = 1; break;
+      case 8 : config->doublePrecision = 1; break;
   };
 
+  // Half precision storage with single precision calculations
+  const int half_memory_only = (precision == 2) && (precision_compute == 4);
+  if(half_memory_only) config->halfPrecisionMemoryOnly = 1;
+
+  // Single precision storage with double precision calculations
+  if((precision == 4) && (precision_compute == 8)) config->doublePrecisionFloatMemory = 1;
+
   CUdevice *dev = new CUdevice;
   if(hstream != 0)
   {
@@ -164,13 +314,57 @@ VkFFTConfiguration* make_config(const size_t nx, const size_t ny, const size_t n
   }
   else
   {
-    if(dct) *psize = (uint64_t)(nx * ny * nz * precision);
+    if(dct || dst) *psize = (uint64_t)(nx * ny * nz * precision);
     else *psize = (uint64_t)(nx * ny * nz * precision * (size_t)2);
   }
 
   config->bufferSize = psize;
 
-  if(buffer_out != NULL)
+  if((half_memory_only || preserve_input) && (buffer_out != NULL))
+  {
+    // The calculations are made in a separate buffer (single precision for half precision
+    // storage), allocated here in the current context. The forward transform goes from
+    // inputBuffer to outputBuffer, and the inverse one from outputBuffer back to inputBuffer,
+    // so the source array of either transform is never modified.
+    uint64_t* psizeout = new uint64_t;
+    *psizeout = *psize;
+    if(psizein == psize)
+    {
+      psizein = new uint64_t;
+      *psizein = *psize;
+    }
+    config->inputBufferSize = psizein;
+    config->outputBufferSize = psizeout;
+    if(r2c)
+    {
+      config->outputBufferStride[0] = nx / 2 + 1;
+      config->outputBufferStride[1] = (nx / 2 + 1) * ny;
+      config->outputBufferStride[2] = (nx / 2 + 1) * ny * nz;
+    }
+
+    const size_t precision_buffer = half_memory_only ? precision_compute : precision;
+    *psize = (uint64_t)(*psizeout / precision * precision_buffer * n_batch);
+    CUdeviceptr buftmp;
+    CUresult res = cuMemAlloc(&buftmp, *psize);
+    if(res != CUDA_SUCCESS)
+    {
+      cout << "make_config: could not allocate the calculation buffer (" << *psize << " bytes)" << endl;
+      return 0;
+    }
+    void ** pbuftmp = new void*;
+    *pbuftmp = (void*)buftmp;
+    config->buffer = pbuftmp;
+
+    void ** pbufout = new void*;
+    *pbufout = buffer_out;
+    config->inputBuffer = pbuf;
+    config->outputBuffer = pbufout;
+
+    config->isInputFormatted = 1;
+    config->isOutputFormatted = 1;
+    config->inverseReturnToInputBuffer = 1;
+  }
+  else if(buffer_out != NULL)
   {
     // Calculations are made in buffer, so with buffer != inputBuffer we keep the original data
     void ** pbufout = new void*;
@@ -203,8 +397,13 @@ VkFFTConfiguration* make_config(const size_t nx, const size_t ny, const size_t n
 */
 VkFFTApplication* init_app(const VkFFTConfiguration* config, int *res)
 {
+  init_time_compile = 0;
+  init_time_alloc = 0;
+  init_nb_compile = 0;
+  const chrono::steady_clock::time_point t0 = chrono::steady_clock::now();
   VkFFTApplication* app = new VkFFTApplication({});
   *res = initializeVkFFT(app, *config);
+  init_time_total = elapsed(t0);
   /*
   cout << "init_app: "<<config<<endl<< config->buffer<<", "<< *(config->buffer)<<", "
        << config->size[0] << " " << config->size[1] << " " << config->size[2] << " "<< config->FFTdim
@@ -223,7 +422,8 @@ int fft(VkFFTApplication* app, void *in, void *out)
 {
   // Modify the original app only to avoid allocating
   // new buffer pointers in memory
-  *(app->configuration.buffer) = out;
+  // If isOutputFormatted is used, buffer is an internal calculation buffer
+  if(!app->configuration.isOutputFormatted) *(app->configuration.buffer) = out;
   *(app->configuration.inputBuffer) = in;
   *(app->configuration.outputBuffer) = out;
 
@@ -232,6 +432,7 @@ int fft(VkFFTApplication* app, void *in, void *out)
   par.inputBuffer = app->configuration.inputBuffer;
   par.outputBuffer = app->configuration.outputBuffer;
 
+  clear_profile();
   return VkFFTAppend(app, -1, &par);
 }
 
@@ -239,7 +440,8 @@ int ifft(VkFFTApplication* app, void *in, void *out)
 {
   // Modify the original app only to avoid allocating
   // new buffer pointers in memory
-  *(app->configuration.buffer) = out;
+  // If isOutputFormatted is used, buffer is an internal calculation buffer
+  if(!app->configuration.isOutputFormatted) *(app->configuration.buffer) = out;
   *(app->configuration.inputBuffer) = in;
   *(app->configuration.outputBuffer) = out;
 
@@ -248,6 +450,7 @@ int ifft(VkFFTApplication* app, void *in, void *out)
   par.inputBuffer = app->configuration.inputBuffer;
   par.outputBuffer = app->configuration.outputBuffer;
 
+  clear_profile();
   return VkFFTAppend(app, 1, &par);
 }
 
@@ -269,6 +472,8 @@ void free_app(VkFFTApplication* app)
 void free_config(VkFFTConfiguration *config)
 {
   free(config->device);
+  // The buffer was only allocated here if isOutputFormatted is used
+  if(config->isOutputFormatted) cuMemFree((CUdeviceptr)*(config->buffer));
   // Only frees the pointer to the buffer pointer, not the buffer itself.
   free(config->buffer);
   free(config->bufferSize);
@@ -286,6 +491,125 @@ void free_config(VkFFTConfiguration *config)
   free(config);
 }
 
+/** Get the size of the GPU buffers allocated for the application, i.e. the internal
+* calculation buffer (allocated in make_config()) and the VkFFT temporary buffer, if any.
+*
+* \param app: the pointer to the VkFFTApplication
+* \return: the number of bytes allocated
+*/
+size_t get_buffer_nbytes(VkFFTApplication* app)
+{
+  size_t nbytes = 0;
+  if(app == NULL) return 0;
+  if(app->configuration.isOutputFormatted) nbytes += (size_t)(app->configuration.bufferSize[0]);
+  if(app->configuration.allocateTempBuffer && (app->configuration.tempBufferSize != NULL))
+    nbytes += (size_t)(app->configuration.tempBufferSize[0]);
+  return nbytes;
+}
+
+/** Get the number of kernels launched by VkFFT during the last fft() or ifft() call
+* made in the calling thread.
+*
+* \return: the number of kernels launched
+*/
+size_t get_nb_dispatch()
+{
+  return nb_dispatch;
+}
+
+/** Enable or disable the profiling of the kernels launched by fft() and ifft()
+* in the calling thread, using cuda events recorded before and after each kernel.
+*
+* \param enable: 1 to enable profiling, 0 to disable it
+*/
+void set_profiling(const int enable)
+{
+  profiling = enable;
+}
+
+/** Get the profiling information for a kernel launched by the last fft() or ifft()
+* call made in the calling thread, with profiling enabled. This waits for the kernel
+* to finish.
+*
+* \param i: the index of the kernel, from 0 to get_nb_dispatch()-1
+* \param grid: the number of blocks along each dimension (3 values)
+* \param block: the block size along each dimension (3 values)
+* \param t: the start and end times of the kernel, in seconds, relative to the start
+*  of the first kernel (2 values)
+* \return: 0 if successful, -1 if no profiling information is available for this kernel,
+*  or the CUDA error code
+*/
+int get_dispatch_profile(const size_t i, size_t *grid, size_t *block, double *t)
+{
+  if(i >= vprofile.size()) return -1;
+  CUresult err = cuEventSynchronize(vprofile[i].end);
+  if(err != CUDA_SUCCESS) return err;
+  float start, end;
+  err = cuEventElapsedTime(&start, vprofile[0].start, vprofile[i].start);
+  if(err != CUDA_SUCCESS) return err;
+  err = cuEventElapsedTime(&end, vprofile[0].start, vprofile[i].end);
+  if(err != CUDA_SUCCESS) return err;
+  for(int j = 0; j < 3; j++)
+  {
+    grid[j] = vprofile[i].grid[j];
+    block[j] = vprofile[i].block[j];
+  }
+  t[0] = start * 1e-3;
+  t[1] = end * 1e-3;
+  return 0;
+}
+
+/** Get the breakdown of the time spent in the last init_app() call made in the calling thread.
+*
+* \param t: the total time, and the times spent generating the kernels code, compiling the kernels
+*  (nvrtcCompileProgram and cuModuleLoadDataEx), and allocating & initialising the VkFFT buffers
+*  (cudaMalloc and cudaMemcpy, e.g. for the LUT), in seconds (4 values)
+* \return: the number of compiled programs
+*/
+size_t get_init_profile(double *t)
+{
+  t[0] = init_time_total;
+  t[2] = init_time_compile;
+  t[3] = init_time_alloc;
+  t[1] = t[0] - t[2] - t[3];
+  return init_nb_compile;
+}
+
+/** Make a stream wait for the work already submitted to another stream, without
+* blocking the host. This is used to follow the __cuda_array_interface__ stream
+* synchronisation semantics when the array was produced on another stream.
+*
+* \param producer: the stream which produced the data (0 or 1: legacy default stream,
+*  2: per-thread default stream)
+* \param consumer: the stream which will use the data
+* \return: 0 if successful, or the CUDA error code
+*/
+int stream_wait(void *producer, void *consumer)
+{
+  CUevent ev;
+  CUresult err = cuEventCreate(&ev, CU_EVENT_DISABLE_TIMING);
+  if(err != CUDA_SUCCESS) return err;
+  err = cuEventRecord(ev, (CUstream)producer);
+  if(err == CUDA_SUCCESS) err = cuStreamWaitEvent((CUstream)consumer, ev, 0);
+  cuEventDestroy(ev);
+  return err;
+}
+
+/** Check if DST transforms are supported, which requires VkFFT>=1.3.0. VkFFT 1.2.x does
+* not define VKFFT_VERSION, so DST are only enabled when building against a newer version
+* (VKFFT_VERSION can also be given to the compiler, e.g. -DVKFFT_VERSION=10300).
+*
+* \return: 1 if DST transforms are supported, 0 otherwise
+*/
+int dst_supported()
+{
+#if defined(VKFFT_VERSION) && (VKFFT_VERSION >= 10300)
+  return 1;
+#else
+  return 0;
+#endif
+}
+
 /// Get VkFFT version
 uint32_t vkfft_version()
 {
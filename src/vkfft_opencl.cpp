@@ -11,7 +11,121 @@
 #include <fstream>
 #include <memory>
 #include <iostream>
+#include <vector>
+#include <chrono>
 using namespace std;
+
+#ifndef CL_USE_DEPRECATED_OPENCL_1_2_APIS
+#define CL_USE_DEPRECATED_OPENCL_1_2_APIS
+#endif
+#ifdef __APPLE__
+#include <OpenCL/opencl.h>
+#else
+#include <CL/cl.h>
+#endif
+
+// Number of kernels launched by the last fft() or ifft() call in this thread.
+// VkFFT kernel launches are counted by wrapping clEnqueueNDRangeKernel
+static thread_local size_t nb_dispatch = 0;
+
+// Profiling of each kernel launch, only if enabled with set_profiling()
+struct DispatchProfile
+{
+  size_t grid[3];
+  size_t block[3];
+  cl_event event;
+};
+static thread_local int profiling = 0;
+static thread_local vector<DispatchProfile> vprofile;
+
+static cl_int pyvkfft_clEnqueueNDRangeKernel(cl_command_queue queue, cl_kernel kernel, cl_uint work_dim,
+                                             const size_t *global_work_offset, const size_t *global_work_size,
+                                             const size_t *local_work_size, cl_uint num_events_in_wait_list,
+                                             const cl_event *event_wait_list, cl_event *event)
+{
+  nb_dispatch++;
+  if(!profiling || (event != NULL))
+    return clEnqueueNDRangeKernel(queue, kernel, work_dim, global_work_offset, global_work_size, local_work_size,
+                                  num_events_in_wait_list, event_wait_list, event);
+  DispatchProfile p = {{1, 1, 1}, {1, 1, 1}, NULL};
+  for(cl_uint i = 0; (i < work_dim) && (i < 3); i++)
+  {
+    if(local_work_size != NULL) p.block[i] = local_work_size[i];
+    p.grid[i] = global_work_size[i] / p.block[i];
+  }
+  const cl_int res = clEnqueueNDRangeKernel(queue, kernel, work_dim, global_work_offset, global_work_size,
+                                            local_work_size, num_events_in_wait_list, event_wait_list, &(p.event));
+  if(res == CL_SUCCESS) vprofile.push_back(p);
+  return res;
+}
+
+// Release the profiling events of the previous transform
+static void clear_profile()
+{
+  for(size_t i = 0; i < vprofile.size(); i++) clReleaseEvent(vprofile[i].event);
+  vprofile.clear();
+  nb_dispatch = 0;
+}
+#define clEnqueueNDRangeKernel pyvkfft_clEnqueueNDRangeKernel
+
+// Breakdown of the time spent in the last init_app() call made in this thread. The time spent
+// compiling the kernels (clBuildProgram, clCreateKernel) and allocating & initialising the
+// VkFFT buffers (clCreateBuffer, clEnqueueWriteBuffer e.g. for the LUT) is measured by
+// wrapping these functions, and the remaining time is spent generating the kernels code.
+static thread_local double init_time_compile = 0;
+static thread_local double init_time_alloc = 0;
+static thread_local size_t init_nb_compile = 0;
+static thread_local double init_time_total = 0;
+
+static double elapsed(const chrono::steady_clock::time_point &t0)
+{
+  return chrono::duration<double>(chrono::steady_clock::now() - t0).count();
+}
+
+static cl_int pyvkfft_clBuildProgram(cl_program program, cl_uint num_devices, const cl_device_id *device_list,
+                                     const char *options, void (CL_CALLBACK *pfn_notify)(cl_program, void *),
+                                     void *user_data)
+{
+  const chrono::steady_clock::time_point t0 = chrono::steady_clock::now();
+  const cl_int res = clBuildProgram(program, num_devices, device_list, options, pfn_notify, user_data);
+  init_time_compile += elapsed(t0);
+  init_nb_compile++;
+  return res;
+}
+
+static cl_kernel pyvkfft_clCreateKernel(cl_program program, const char *kernel_name, cl_int *errcode_ret)
+{
+  const chrono::steady_clock::time_point t0 = chrono::steady_clock::now();
+  cl_kernel k = clCreateKernel(program, kernel_name, errcode_ret);
+  init_time_compile += elapsed(t0);
+  return k;
+}
+
+static cl_mem pyvkfft_clCreateBuffer(cl_context context, cl_mem_flags flags, size_t size, void *host_ptr,
+                                     cl_int *errcode_ret)
+{
+  const chrono::steady_clock::time_point t0 = chrono::steady_clock::now();
+  cl_mem b = clCreateBuffer(context, flags, size, host_ptr, errcode_ret);
+  init_time_alloc += elapsed(t0);
+  return b;
+}
+
+static cl_int pyvkfft_clEnqueueWriteBuffer(cl_command_queue queue, cl_mem buffer, cl_bool blocking_write,
+                                           size_t offset, size_t size, const void *ptr,
+                                           cl_uint num_events_in_wait_list, const cl_event *event_wait_list,
+                                           cl_event *event)
+{
+  const chrono::steady_clock::time_point t0 = chrono::steady_clock::now();
+  const cl_int res = clEnqueueWriteBuffer(queue, buffer, blocking_write, offset, size, ptr,
+                                          num_events_in_wait_list, event_wait_list, event);
+  init_time_alloc += elapsed(t0);
+  return res;
+}
+#define clBuildProgram pyvkfft_clBuildProgram
+#define clCreateKernel pyvkfft_clCreateKernel
+#define clCreateBuffer pyvkfft_clCreateBuffer
+#define clEnqueueWriteBuffer pyvkfft_clEnqueueWriteBuffer
+
 #include "vkFFT.h"
 
 #ifdef _WIN32
@@ -22,9 +136,10 @@ using namespace std;
 
 LIBRARY_API VkFFTConfiguration* make_config(const size_t, const size_t, const size_t,
                                             const size_t, void*, void*, void*, void*, void*,
-                                            const int, const size_t, const int, const int,
-                                            const int, const int, const int, const int,
-                                            const size_t, const int, const int, const int);
+                                            const int, const size_t, const size_t, const int, const int,
+                                            const int, const int, const int, const int, const int,
+                                            const size_t, const int, const int, const int, const int,
+                                            const int, const int, const int);
 
 LIBRARY_API VkFFTApplication* init_app(const VkFFTConfiguration*, void*, int*);
 
@@ -36,8 +151,20 @@ LIBRARY_API void free_app(VkFFTApplication* app);
 
 LIBRARY_API void free_config(VkFFTConfiguration *config);
 
+LIBRARY_API size_t get_buffer_nbytes(VkFFTApplication* app);
+
 LIBRARY_API uint32_t vkfft_version();
 
+LIBRARY_API size_t get_nb_dispatch();
+
+LIBRARY_API void set_profiling(const int);
+
+LIBRARY_API int get_dispatch_profile(const size_t, size_t*, size_t*, double*);
+
+LIBRARY_API size_t get_init_profile(double*);
+
+LIBRARY_API int dst_supported();
+
 /** Create the VkFFTConfiguration from the array parameters
 *
 * \param nx, ny, nz: dimensions of the array. The fast axis is x. In the corresponding numpy array,
@@ -52,17 +179,28 @@ LIBRARY_API uint32_t vkfft_version();
 * \param ctx: the cl_context
 * \param norm: 0, the L2 norm is multiplied by the size on each transform, 1, the inverse transform
 *   divides the L2 norm by the size.
-* \param precision: number of bits per float, 16=half, 32=single, 64=double precision
+* \param precision: number of bytes per float, 2=half, 4=single, 8=double precision
+* \param precision_compute: number of bytes per float used for the calculations. This can
+*  be larger than precision: 4 with half precision (halfPrecisionMemoryOnly, out-of-place only)
+*  or 8 with single precision (doublePrecisionFloatMemory)
 * \param r2c: if True, create a configuration for a real<->complex transform
+* \param dct: 0, or 1, 2, 3 or 4 for a Direct Cosine Transform of the given type
+* \param dst: 0, or 1, 2, 3 or 4 for a Direct Sine Transform of the given type
+* \param preserve_input: if 1 and buffer_out is not NULL, the calculations are made in an internal
+*  buffer, so that the source array is not modified by either the forward or the inverse transform
+* \param disableReorderFourStep, registerBoost, useLUT, keepShaderCode, coalescedMemory, aimThreads,
+*  numSharedBanks: VkFFT parameters, only used if >=0 (otherwise the VkFFT default is used)
 * \return: the pointer to the newly created VkFFTConfiguration, or 0 if an error occurred.
 */
 VkFFTConfiguration* make_config(const size_t nx, const size_t ny, const size_t nz, const size_t fftdim,
                                 void *buffer, void *buffer_out,
                                 void* platform, void* device, void* ctx,
-                                const int norm, const size_t precision, const int r2c, const int dct,
+                                const int norm, const size_t precision, const size_t precision_compute,
+                                const int r2c, const int dct, const int dst,
                                 const int disableReorderFourStep, const int registerBoost,
                                 const int useLUT, const int keepShaderCode, const size_t n_batch,
-                                const int skipx, const int skipy, const int skipz)
+                                const int skipx, const int skipy, const int skipz, const int preserve_input,
+                                const int coalescedMemory, const int aimThreads, const int numSharedBanks)
 {
   VkFFTConfiguration *config = new VkFFTConfiguration({});
   config->FFTdim = fftdim;
@@ -78,6 +216,9 @@ VkFFTConfiguration* make_config(const size_t nx, const size_t ny, const size_t n
   config->normalize = norm;
   config->performR2C = r2c;
   config->performDCT = dct;
+#if defined(VKFFT_VERSION) && (VKFFT_VERSION >= 10300)
+  config->performDST = dst;
+#endif
 
   if(disableReorderFourStep>=0)
     config->disableReorderFourStep = disableReorderFourStep;
@@ -91,12 +232,28 @@ VkFFTConfiguration* make_config(const size_t nx, const size_t ny, const size_t n
   if(keepShaderCode>=0)
     config->keepShaderCode = keepShaderCode;
 
+  if(coalescedMemory>=0)
+    config->coalescedMemory = coalescedMemory;
+
+  if(aimThreads>=0)
+    config->aimThreads = aimThreads;
+
+  if(numSharedBanks>=0)
+    config->numSharedBanks = numSharedBanks;
+
   switch(precision)
   {
-      case 2 : config->halfPrecision = 1;
-      case 8 : config->doublePrecision = 1;
+      case 2 : config->halfPrecision = 1; break;
+      case 8 : config->doublePrecision = 1; break;
   };
 
+  // Half precision storage with single precision calculations
+  const int half_memory_only = (precision == 2) && (precision_compute == 4);
+  if(half_memory_only) config->halfPrecisionMemoryOnly = 1;
+
+  // Single precision storage with double precision calculations
+  if((precision == 4) && (precision_compute == 8)) config->doublePrecisionFloatMemory = 1;
+
   cl_device_id *pdev = new cl_device_id;
   *pdev = (cl_device_id)device;
   config->device = pdev;
@@ -130,13 +287,56 @@ VkFFTConfiguration* make_config(const size_t nx, const size_t ny, const size_t n
   }
   else
   {
-    if(dct) *psize = (uint64_t)(nx * ny * nz * precision);
+    if(dct || dst) *psize = (uint64_t)(nx * ny * nz * precision);
     else *psize = (uint64_t)(nx * ny * nz * precision * (size_t)2);
   }
 
   config->bufferSize = psize;
 
-  if(buffer_out != NULL)
+  if((half_memory_only || preserve_input) && (buffer_out != NULL))
+  {
+    // The calculations are made in a separate buffer (single precision for half precision
+    // storage), allocated here. The forward transform goes from inputBuffer to outputBuffer,
+    // and the inverse one from outputBuffer back to inputBuffer, so the source array
+    // of either transform is never modified.
+    uint64_t* psizeout = new uint64_t;
+    *psizeout = *psize;
+    if(psizein == psize)
+    {
+      psizein = new uint64_t;
+      *psizein = *psize;
+    }
+    config->inputBufferSize = psizein;
+    config->outputBufferSize = psizeout;
+    if(r2c)
+    {
+      config->outputBufferStride[0] = nx / 2 + 1;
+      config->outputBufferStride[1] = (nx / 2 + 1) * ny;
+      config->outputBufferStride[2] = (nx / 2 + 1) * ny * nz;
+    }
+
+    const size_t precision_buffer = half_memory_only ? precision_compute : precision;
+    *psize = (uint64_t)(*psizeout / precision * precision_buffer * n_batch);
+    cl_int err = CL_SUCCESS;
+    cl_mem *pbuftmp = new cl_mem;
+    *pbuftmp = clCreateBuffer((cl_context)ctx, CL_MEM_READ_WRITE, *psize, NULL, &err);
+    if(err != CL_SUCCESS)
+    {
+      cout << "make_config: could not allocate the calculation buffer (" << *psize << " bytes)" << endl;
+      return 0;
+    }
+    config->buffer = pbuftmp;
+
+    void ** pbufout = new void*;
+    *pbufout = buffer_out;
+    config->inputBuffer = (cl_mem*)pbuf;
+    config->outputBuffer = (cl_mem*)pbufout;
+
+    config->isInputFormatted = 1;
+    config->isOutputFormatted = 1;
+    config->inverseReturnToInputBuffer = 1;
+  }
+  else if(buffer_out != NULL)
   {
     // Calculations are made in buffer, so with buffer != inputBuffer we keep the original data
     void ** pbufout = new void*;
@@ -165,8 +365,13 @@ VkFFTConfiguration* make_config(const size_t nx, const size_t ny, const size_t n
 */
 VkFFTApplication* init_app(const VkFFTConfiguration* config, void *queue, int *res)
 {
+  init_time_compile = 0;
+  init_time_alloc = 0;
+  init_nb_compile = 0;
+  const chrono::steady_clock::time_point t0 = chrono::steady_clock::now();
   VkFFTApplication* app = new VkFFTApplication({});
   *res = initializeVkFFT(app, *config);
+  init_time_total = elapsed(t0);
 
   if(*res!=0)
   {
@@ -182,7 +387,8 @@ int fft(VkFFTApplication* app, void *in, void *out, void* queue)
 
   // Modify the original app only to avoid allocating
   // new buffer pointers in memory
-  *(app->configuration.buffer) = (cl_mem)out;
+  // If isOutputFormatted is used, buffer is an internal calculation buffer
+  if(!app->configuration.isOutputFormatted) *(app->configuration.buffer) = (cl_mem)out;
   *(app->configuration.inputBuffer) = (cl_mem)in;
   *(app->configuration.outputBuffer) = (cl_mem)out;
   app->configuration.commandQueue = &q;
@@ -193,6 +399,7 @@ int fft(VkFFTApplication* app, void *in, void *out, void* queue)
   par.inputBuffer = app->configuration.inputBuffer;
   par.outputBuffer = app->configuration.outputBuffer;
 
+  clear_profile();
   return VkFFTAppend(app, -1, &par);
 }
 
@@ -202,7 +409,8 @@ int ifft(VkFFTApplication* app, void *in, void *out, void* queue)
 
   // Modify the original app only to avoid allocating
   // new buffer pointers in memory
-  *(app->configuration.buffer) = (cl_mem)out;
+  // If isOutputFormatted is used, buffer is an internal calculation buffer
+  if(!app->configuration.isOutputFormatted) *(app->configuration.buffer) = (cl_mem)out;
   *(app->configuration.inputBuffer) = (cl_mem)in;
   *(app->configuration.outputBuffer) = (cl_mem)out;
   app->configuration.commandQueue = &q;
@@ -213,6 +421,7 @@ int ifft(VkFFTApplication* app, void *in, void *out, void* queue)
   par.inputBuffer = app->configuration.inputBuffer;
   par.outputBuffer = app->configuration.outputBuffer;
 
+  clear_profile();
   return VkFFTAppend(app, 1, &par);
 }
 
@@ -236,6 +445,8 @@ void free_config(VkFFTConfiguration *config)
   free(config->platform);
   free(config->device);
   free(config->context);
+  // The buffer was only allocated here if isOutputFormatted is used
+  if(config->isOutputFormatted) clReleaseMemObject(*(config->buffer));
   // Only frees the pointer to the buffer pointer, not the buffer itself.
   free(config->buffer);
   free(config->bufferSize);
@@ -252,6 +463,108 @@ void free_config(VkFFTConfiguration *config)
   free(config);
 }
 
+/** Get the size of the GPU buffers allocated for the application, i.e. the internal
+* calculation buffer (allocated in make_config()) and the VkFFT temporary buffer, if any.
+*
+* \param app: the pointer to the VkFFTApplication
+* \return: the number of bytes allocated
+*/
+size_t get_buffer_nbytes(VkFFTApplication* app)
+{
+  size_t nbytes = 0;
+  if(app == NULL) return 0;
+  if(app->configuration.isOutputFormatted) nbytes += (size_t)(app->configuration.bufferSize[0]);
+  if(app->configuration.allocateTempBuffer && (app->configuration.tempBufferSize != NULL))
+    nbytes += (size_t)(app->configuration.tempBufferSize[0]);
+  return nbytes;
+}
+
+/** Get the number of kernels launched by VkFFT during the last fft() or ifft() call
+* made in the calling thread.
+*
+* \return: the number of kernels launched
+*/
+size_t get_nb_dispatch()
+{
+  return nb_dispatch;
+}
+
+/** Enable or disable the profiling of the kernels launched by fft() and ifft()
+* in the calling thread. The command queue must have been created with
+* CL_QUEUE_PROFILING_ENABLE.
+*
+* \param enable: 1 to enable profiling, 0 to disable it
+*/
+void set_profiling(const int enable)
+{
+  profiling = enable;
+}
+
+/** Get the profiling information for a kernel launched by the last fft() or ifft()
+* call made in the calling thread, with profiling enabled. This waits for the kernel
+* to finish.
+*
+* \param i: the index of the kernel, from 0 to get_nb_dispatch()-1
+* \param grid: the number of work-groups along each dimension (3 values)
+* \param block: the work-group size along each dimension (3 values)
+* \param t: the start and end times of the kernel, in seconds, relative to the start
+*  of the first kernel (2 values)
+* \return: 0 if successful, -1 if no profiling information is available for this kernel,
+*  or the OpenCL error code
+*/
+int get_dispatch_profile(const size_t i, size_t *grid, size_t *block, double *t)
+{
+  if(i >= vprofile.size()) return -1;
+  cl_int err = clWaitForEvents(1, &(vprofile[i].event));
+  if(err != CL_SUCCESS) return err;
+  cl_ulong t0, start, end;
+  err = clGetEventProfilingInfo(vprofile[0].event, CL_PROFILING_COMMAND_START, sizeof(cl_ulong), &t0, NULL);
+  if(err != CL_SUCCESS) return err;
+  err = clGetEventProfilingInfo(vprofile[i].event, CL_PROFILING_COMMAND_START, sizeof(cl_ulong), &start, NULL);
+  if(err != CL_SUCCESS) return err;
+  err = clGetEventProfilingInfo(vprofile[i].event, CL_PROFILING_COMMAND_END, sizeof(cl_ulong), &end, NULL);
+  if(err != CL_SUCCESS) return err;
+  for(int j = 0; j < 3; j++)
+  {
+    grid[j] = vprofile[i].grid[j];
+    block[j] = vprofile[i].block[j];
+  }
+  t[0] = (double)(start - t0) * 1e-9;
+  t[1] = (double)(end - t0) * 1e-9;
+  return 0;
+}
+
+/** Get the breakdown of the time spent in the last init_app() call made in the calling thread.
+*
+* \param t: the total time, and the times spent generating the kernels code, compiling the kernels
+*  (clBuildProgram and clCreateKernel), and allocating & initialising the VkFFT buffers (clCreateBuffer
+*  and clEnqueueWriteBuffer, e.g. for the LUT), in seconds (4 values)
+* \return: the number of compiled programs
+*/
+size_t get_init_profile(double *t)
+{
+  t[0] = init_time_total;
+  t[2] = init_time_compile;
+  t[3] = init_time_alloc;
+  t[1] = t[0] - t[2] - t[3];
+  return init_nb_compile;
+}
+
+/** Check if DST transforms are supported, which requires VkFFT>=1.3.0. VkFFT 1.2.x does
+* not define VKFFT_VERSION, so DST are only enabled when building against a newer version
+* (VKFFT_VERSION can also be given to the compiler, e.g. -DVKFFT_VERSION=10300).
+*
+* \return: 1 if DST transforms are supported, 0 otherwise
+*/
+int dst_supported()
+{
+#if defined(VKFFT_VERSION) && (VKFFT_VERSION >= 10300)
+  return 1;
+#else
+  return 0;
+#endif
+}
+
 /// Get VkFFT version
 uint32_t vkfft_version()
 {